@@ -1,12 +1,23 @@
-from typing import Dict, Any, Optional
-from langchain.chat_models import ChatOpenAI, ChatAnthropic
-from langchain.schema import HumanMessage, SystemMessage
+from typing import Dict, Any, Optional, AsyncIterator, Union, Tuple, TYPE_CHECKING
 from pydantic import BaseModel
-import os
 from dotenv import load_dotenv
 
+from services.llm_clients import LLMClientPool, llm_clients
+from services.llm_stream import TokenSource, word_tokens
+from services.intent_extractor import IntentExtractor, intent_extractor
+from services.model_router import ModelRouter, ModelTier, model_router
+from services.telemetry import tracer
+
+if TYPE_CHECKING:
+    # Only for annotations: the cache module loads numpy
+    from services.response_cache import ResponseCache
+
 load_dotenv()
 
+# What rule_intent finds in a message: whether it asks for a trip plan,
+# the preferences it gives, and how sure the extraction is
+RuleIntent = Tuple[bool, Optional[Dict[str, Any]], float]
+
 class ChatAgentResponse(BaseModel):
     text: str
     requires_planning: bool = False
@@ -18,19 +29,18 @@ class ChatAgent:
     and determines when trip planning is needed
     """
     
-    def __init__(self):
-        # Initialize both OpenAI and Anthropic models
-        self.openai_model = ChatOpenAI(
-            model="gpt-4-turbo-preview",
-            temperature=0.7,
-            openai_api_key=os.getenv("OPENAI_API_KEY")
-        )
-        
-        self.anthropic_model = ChatAnthropic(
-            model="claude-3-opus-20240229",
-            temperature=0.7,
-            anthropic_api_key=os.getenv("ANTHROPIC_API_KEY")
-        )
+    def __init__(
+        self,
+        token_source: Optional[TokenSource] = None,
+        cache: Optional["ResponseCache"] = None,
+        clients: LLMClientPool = llm_clients,
+        router: ModelRouter = model_router,
+        extractor: IntentExtractor = intent_extractor
+    ):
+        # OpenAI and Anthropic models, built on first use (see openai_model)
+        self.model_name = "gpt-4-turbo-preview"
+        self.anthropic_model_name = "claude-3-opus-20240229"
+        self.clients = clients
         
         self.system_prompt = """You are a friendly and knowledgeable AI travel assistant. 
         Your goal is to help users plan amazing trips. You should:
@@ -41,6 +51,25 @@ class ChatAgent:
         
         When you detect the user wants to plan a specific trip, set requires_planning=True
         and extract their preferences into a structured format."""
+        
+        # Streams reply text for stream_message when the router has no
+        # models for the reply's tier; the default replays the drafted reply
+        self.token_source = token_source or TokenSource()
+        # Picks the cheapest model that can handle each step (see ModelRouter)
+        self.router = router
+        # Destinations, durations, interests and budgets found without a model
+        self.extractor = extractor
+        # Replies to the same or a near-identical message skip the model
+        # call; main passes the shared cache, other callers opt in
+        self.cache = cache
+    
+    @property
+    def openai_model(self):
+        return self.clients.chat_model("openai", self.model_name, 0.7)
+    
+    @property
+    def anthropic_model(self):
+        return self.clients.chat_model("anthropic", self.anthropic_model_name, 0.7)
     
     async def process_message(
         self, 
@@ -49,18 +78,103 @@ class ChatAgent:
         current_trip: Optional[Any] = None
     ) -> ChatAgentResponse:
         """
-        Process user message and determine response strategy
+        Process user message and determine response strategy.
+        The reply stream_message produces, collected: the same cache,
+        intent escalation and model routing apply.
+        """
+        with tracer.span("chat_agent.process_message"):
+            async for item in self.stream_message(message, context, current_trip):
+                if isinstance(item, ChatAgentResponse):
+                    return item
+    
+    async def stream_message(
+        self,
+        message: str,
+        context: Optional[Dict[str, Any]] = None,
+        current_trip: Optional[Any] = None,
+        intent: Optional[RuleIntent] = None
+    ) -> AsyncIterator[Union[str, ChatAgentResponse]]:
+        """
+        Same as process_message, streaming the reply: yields text tokens as
+        they are produced, then the complete ChatAgentResponse. intent is
+        rule_intent(message) if the caller already has it; the message is
+        extracted once and that result used throughout.
         """
+        model = self.model_name
+        if intent is None:
+            intent = self.rule_intent(message)
+        scope = self._cache_scope(intent, context, current_trip)
+        if self.cache is not None:
+            cached, _ = self.cache.get(message, model, scope)
+            if cached is not None:
+                for token in word_tokens(cached["text"]):
+                    yield token
+                yield ChatAgentResponse(**cached)
+                return
+        
+        draft = self._draft_response(message, intent)
+        routed = await self.router.route_intent(message, lambda _: intent)
+        if routed.route != ModelTier.RULES:
+            # The rules weren't sure; a model's extraction replaces theirs
+            draft = draft.model_copy(update={
+                "requires_planning": routed.requires_planning,
+                "extracted_preferences": routed.preferences
+            })
+        # (role, content) pairs, which LangChain chat models accept as
+        # messages, so replies don't need LangChain's message classes imported
+        messages = [("system", self.system_prompt), ("human", message)]
+        
+        # Only itinerary replies need the large models
+        tier = ModelTier.LARGE if draft.requires_planning else ModelTier.SMALL
+        token_source = self.router.token_source(tier) or self.token_source
+        
+        parts = []
+        async for token in token_source.stream(messages, draft.text):
+            parts.append(token)
+            yield token
+        
+        response = draft.model_copy(update={"text": "".join(parts)})
+        if self.cache is not None:
+            self.cache.put(message, model, response.dict(), scope)
+        yield response
+    
+    def _cache_scope(
+        self,
+        intent: RuleIntent,
+        context: Optional[Dict[str, Any]],
+        current_trip: Optional[Any]
+    ) -> Dict[str, Any]:
+        """
+        Everything besides the wording that the reply depends on; cached
+        replies are only shared between messages with the same scope
+        """
+        requires_planning, preferences, _ = intent
+        return {
+            "context": context,
+            "destination": getattr(current_trip, "destination", None),
+            "requires_planning": requires_planning,
+            "preferences": preferences
+        }
+    
+    def rule_intent(self, message: str) -> RuleIntent:
+        """
+        Fast guess, without a model call, at whether the message asks for a
+        trip plan, with which preferences and how sure it is. Lets planning
+        start while the reply is still being generated; the model router
+        escalates to a model below its confidence threshold.
+        """
+        extraction = self.extractor.extract(message)
+        return extraction.requires_planning, extraction.preferences, extraction.confidence
+    
+    def _draft_response(self, message: str, intent: RuleIntent) -> ChatAgentResponse:
         # TODO: Implement actual LangChain conversation logic
         # This is a placeholder implementation
         
         # For now, return a mock response
-        # Check if message contains trip planning keywords
-        planning_keywords = ["plan", "trip", "itinerary", "visit", "travel to", "going to"]
-        requires_planning = any(keyword in message.lower() for keyword in planning_keywords)
+        requires_planning, extracted_preferences, _ = intent
         
         # Mock response based on message content
-        if "san francisco" in message.lower() or "sf" in message.lower():
+        if (extracted_preferences or {}).get("destination") == "San Francisco":
             response_text = """I'd be happy to help you plan a trip to San Francisco! 
             The Bay Area has so much to offer - from the iconic Golden Gate Bridge to 
             the vibrant neighborhoods like Mission District and Chinatown. 
@@ -69,15 +183,8 @@ class ChatAgent:
             - How many days are you planning to stay?
             - What are your main interests? (food, culture, nature, tech, etc.)
             - Do you have a budget in mind?"""
-            
-            extracted_preferences = {
-                "destination": "San Francisco",
-                "interests": ["sightseeing", "food", "culture"],
-                "duration_days": 3  # Default assumption
-            }
         else:
             response_text = "I'm your AI travel assistant! Where would you like to explore?"
-            extracted_preferences = None
         
         return ChatAgentResponse(
             text=response_text,
@@ -0,0 +1,304 @@
+from typing import Dict, Any, Optional, AsyncIterator, Tuple, TYPE_CHECKING
+from collections import deque
+from pydantic import BaseModel
+import asyncio
+import time
+
+from models import TripPlan
+from agents.chat_agent import ChatAgent, ChatAgentResponse
+from services.telemetry import tracer
+
+if TYPE_CHECKING:
+    # Only for annotations: the planner loads numpy and the catalogs
+    from agents.trip_planner import TripPlannerAgent
+
+# Preferences that change the plan; the rest don't invalidate a speculative one
+PLANNING_KEYS = ("destination", "duration_days", "interests", "budget", "travel_mode")
+
+STAGES = ("intent", "chat", "plan", "plan_wait", "total")
+
+
+def planning_key(preferences: Optional[Dict[str, Any]]) -> Tuple:
+    """
+    What a plan depends on, normalized so equivalent preferences compare equal
+    """
+    preferences = preferences or {}
+    key = []
+    for name in PLANNING_KEYS:
+        value = preferences.get(name)
+        if isinstance(value, str):
+            value = value.strip().lower()
+        elif isinstance(value, (list, tuple, set)):
+            value = tuple(sorted(str(item).strip().lower() for item in value))
+        key.append(value)
+    return tuple(key)
+
+
+class StageTimeout(Exception):
+    def __init__(self, stage: str, deadline_ms: float):
+        super().__init__(f"{stage} stage exceeded its {deadline_ms:.0f} ms deadline")
+        self.stage = stage
+        self.deadline_ms = deadline_ms
+
+
+class PipelineResult(BaseModel):
+    chat_response: ChatAgentResponse
+    trip_plan: Optional[TripPlan] = None
+    timings_ms: Dict[str, float] = {}
+    # "none", "reused", "replanned" or "discarded"
+    speculation: str = "none"
+
+    def server_timing(self) -> str:
+        """
+        The timings as a Server-Timing header value
+        """
+        return ", ".join(f"{stage};dur={duration:.1f}" for stage, duration in self.timings_ms.items())
+
+
+class PipelineMetrics:
+    """
+    Stage latencies over the most recent requests and speculation outcomes
+    """
+
+    def __init__(self, window: int = 1024):
+        self.requests = 0
+        self.speculations = 0
+        self.reused = 0
+        self.wasted = 0
+        self.wasted_ms = 0.0
+        self.timeouts: Dict[str, int] = {}
+        self._samples: Dict[str, deque] = {stage: deque(maxlen=window) for stage in STAGES}
+
+    def record(self, timings_ms: Dict[str, float]):
+        self.requests += 1
+        for stage, duration in timings_ms.items():
+            self._samples[stage].append(duration)
+
+    def stats(self) -> Dict[str, Any]:
+        stages = {}
+        for stage, samples in self._samples.items():
+            if samples:
+                ordered = sorted(samples)
+                stages[stage] = {
+                    "count": len(ordered),
+                    "p50_ms": round(ordered[len(ordered) // 2], 2),
+                    "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 2)
+                }
+        return {
+            "requests": self.requests,
+            "speculations": self.speculations,
+            "speculations_reused": self.reused,
+            "speculations_wasted": self.wasted,
+            "wasted_rate": round(self.wasted / self.speculations, 4) if self.speculations else 0.0,
+            "wasted_planning_ms": round(self.wasted_ms, 1),
+            "timeouts": dict(self.timeouts),
+            "stages": stages
+        }
+
+
+class _PlanRun:
+    """
+    One plan_trip_stream run in its own task. Days and the final TripPlan
+    are queued as they are produced so the caller can pick them up later,
+    or never if the run is cancelled.
+    """
+
+    def __init__(
+        self,
+        planner: "TripPlannerAgent",
+        message: str,
+        preferences: Dict[str, Any],
+        current_trip: Optional[TripPlan]
+    ):
+        self.key = planning_key(preferences)
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self._items: asyncio.Queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run(planner, message, preferences, current_trip))
+
+    async def _run(self, planner, message, preferences, current_trip):
+        try:
+            async for item in planner.plan_trip_stream(
+                user_input=message,
+                preferences=preferences,
+                current_trip=current_trip
+            ):
+                self._items.put_nowait(item)
+        except Exception as exc:
+            self._items.put_nowait(exc)
+        finally:
+            self.finished = time.perf_counter()
+
+    @property
+    def elapsed_ms(self) -> float:
+        return ((self.finished or time.perf_counter()) - self.started) * 1000
+
+    async def items(self, deadline_ms: float) -> AsyncIterator[Any]:
+        """
+        The run's days, then its TripPlan, within deadline_ms of the run's start
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + deadline_ms / 1000.0 - (time.perf_counter() - self.started)
+        while True:
+            remaining = deadline - loop.time()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                item = await asyncio.wait_for(self._items.get(), remaining)
+            except asyncio.TimeoutError:
+                raise StageTimeout("plan", deadline_ms) from None
+            if isinstance(item, Exception):
+                raise item
+            yield item
+            if isinstance(item, TripPlan):
+                return
+
+    def cancel(self):
+        if not self._task.done():
+            self._task.cancel()
+
+
+async def _until(iterator: AsyncIterator[Any], deadline_ms: float, stage: str) -> AsyncIterator[Any]:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + deadline_ms / 1000.0
+    while True:
+        remaining = deadline - loop.time()
+        try:
+            if remaining <= 0:
+                raise asyncio.TimeoutError
+            item = await asyncio.wait_for(iterator.__anext__(), remaining)
+        except StopAsyncIteration:
+            return
+        except asyncio.TimeoutError:
+            raise StageTimeout(stage, deadline_ms) from None
+        yield item
+
+
+class ChatPipeline:
+    """
+    Runs the chat reply and trip planning concurrently. A fast intent guess
+    starts planning while the reply is still being generated; once the
+    reply's own extraction is known the speculative plan is kept if it was
+    planned from the same preferences, and cancelled otherwise. Each stage
+    has its own deadline.
+    """
+
+    def __init__(
+        self,
+        chat_agent: ChatAgent,
+        trip_planner: "TripPlannerAgent",
+        chat_deadline_ms: float = 30000.0,
+        plan_deadline_ms: float = 30000.0,
+        speculate: bool = True
+    ):
+        self.chat_agent = chat_agent
+        self.trip_planner = trip_planner
+        self.chat_deadline_ms = chat_deadline_ms
+        self.plan_deadline_ms = plan_deadline_ms
+        self.speculate = speculate
+        self.metrics = PipelineMetrics()
+
+    async def run(
+        self,
+        message: str,
+        context: Optional[Dict[str, Any]] = None,
+        current_trip: Optional[TripPlan] = None
+    ) -> PipelineResult:
+        result = None
+        async for event in self.events(message, context, current_trip):
+            if event["type"] == "pipeline_result":
+                result = event["result"]
+        return result
+
+    async def events(
+        self,
+        message: str,
+        context: Optional[Dict[str, Any]] = None,
+        current_trip: Optional[TripPlan] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        {"type": "chat_token", "text"} events as the reply streams,
+        {"type": "trip_day", "day"} once the plan is confirmed and as each
+        day is ready, then {"type": "pipeline_result", "result"}.
+        Raises StageTimeout when a stage misses its deadline.
+        """
+        started = time.perf_counter()
+        timings: Dict[str, float] = {}
+        speculative: Optional[_PlanRun] = None
+        plan_run: Optional[_PlanRun] = None
+        outcome = "none"
+
+        # The same extraction seeds the reply, so the message is read once
+        intent = self.chat_agent.rule_intent(message)
+        requires_planning, guessed, _ = intent
+        timings["intent"] = (time.perf_counter() - started) * 1000
+        if self.speculate and requires_planning:
+            speculative = _PlanRun(self.trip_planner, message, guessed or {}, current_trip)
+            self.metrics.speculations += 1
+
+        try:
+            chat_started = time.perf_counter()
+            chat_response = None
+            stream = self.chat_agent.stream_message(message=message, context=context, current_trip=current_trip, intent=intent)
+            try:
+                with tracer.span("chat_agent.stream_message"):
+                    async for item in _until(stream, self.chat_deadline_ms, "chat"):
+                        if isinstance(item, str):
+                            yield {"type": "chat_token", "text": item}
+                        else:
+                            chat_response = item
+            finally:
+                await stream.aclose()
+            timings["chat"] = (time.perf_counter() - chat_started) * 1000
+
+            if chat_response.requires_planning:
+                preferences = chat_response.extracted_preferences or {}
+                if speculative is not None and speculative.key == planning_key(preferences):
+                    plan_run, speculative = speculative, None
+                    outcome = "reused"
+                    self.metrics.reused += 1
+                else:
+                    outcome = "replanned" if speculative is not None else "none"
+                    plan_run = _PlanRun(self.trip_planner, message, preferences, current_trip)
+            elif speculative is not None:
+                outcome = "discarded"
+            if speculative is not None:
+                self._discard(speculative)
+                speculative = None
+
+            trip_plan = None
+            if plan_run is not None:
+                wait_started = time.perf_counter()
+                async for item in plan_run.items(self.plan_deadline_ms):
+                    if isinstance(item, TripPlan):
+                        trip_plan = item
+                    else:
+                        yield {"type": "trip_day", "day": item}
+                timings["plan"] = plan_run.elapsed_ms
+                timings["plan_wait"] = (time.perf_counter() - wait_started) * 1000
+
+            timings["total"] = (time.perf_counter() - started) * 1000
+            self.metrics.record(timings)
+            yield {
+                "type": "pipeline_result",
+                "result": PipelineResult(
+                    chat_response=chat_response,
+                    trip_plan=trip_plan,
+                    timings_ms={stage: round(duration, 2) for stage, duration in timings.items()},
+                    speculation=outcome
+                )
+            }
+        except StageTimeout as exc:
+            self.metrics.timeouts[exc.stage] = self.metrics.timeouts.get(exc.stage, 0) + 1
+            raise
+        finally:
+            # Reached on errors, timeouts and client disconnects as well
+            if speculative is not None:
+                self._discard(speculative)
+            if plan_run is not None:
+                plan_run.cancel()
+
+    def _discard(self, run: _PlanRun):
+        run.cancel()
+        self.metrics.wasted += 1
+        self.metrics.wasted_ms += run.elapsed_ms
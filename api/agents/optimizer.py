@@ -1,6 +1,39 @@
-from typing import Dict, Any, List
-from models import TripPlan, DayItinerary, TimeSlot, Attraction
-import copy
+from typing import Dict, Any, List, Optional, Tuple
+from pydantic import BaseModel
+import functools
+import math
+from models import TripPlan, DayItinerary, TimeSlot, Attraction, AttractionType
+from services.routing import solve_route, DEFAULT_TIME_BUDGET_MS
+from services.opening_hours import weekly_hours
+from services.travel_matrix import TravelMatrixEngine, TravelMode, travel_matrix_engine
+from services.catalog import CatalogRegistry, catalog_registry
+from services.cpu_executor import CPUExecutor, cpu_executor
+from services.timeline import DayTimeline, DayChanges, diff_slots, minute_to_time, DAY_START_MINUTE
+from services.telemetry import tracer
+
+# Default search radius for the "discover" action, and the largest one
+# it accepts
+DISCOVER_RADIUS_KM = 3.0
+DISCOVER_MAX_RADIUS_KM = 25.0
+
+# Most places one "discover" adds to a day
+DISCOVER_MAX_PLACES = 10
+
+# Nearest attractions considered per place "discover" adds, since some
+# can't be fitted into the day's opening hours
+DISCOVER_CANDIDATES_PER_PLACE = 3
+
+# Attraction types "discover" can filter on; anything else searches every type
+ATTRACTION_TYPES = frozenset(attraction_type.value for attraction_type in AttractionType)
+
+# Actions apply understands; anything else leaves the trip unchanged
+ACTIONS = ("reorder", "remove", "discover")
+
+
+class OptimizationResult(BaseModel):
+    trip: TripPlan
+    # Slots each action rewrote, for sending minimal updates
+    changes: List[DayChanges] = []
 
 class ItineraryOptimizer:
     """
@@ -8,9 +41,22 @@ class ItineraryOptimizer:
     based on user actions (reorder, remove, discover new places)
     """
     
-    def __init__(self):
-        # TODO: Initialize optimization models and tools
-        pass
+    def __init__(
+        self,
+        route_time_budget_ms: float = DEFAULT_TIME_BUDGET_MS,
+        travel_matrix: TravelMatrixEngine = travel_matrix_engine,
+        travel_mode: TravelMode = TravelMode.TRANSIT,
+        catalogs: CatalogRegistry = catalog_registry,
+        executor: CPUExecutor = cpu_executor
+    ):
+        # Wall-clock limit for the "auto" reorder route search
+        self.route_time_budget_ms = route_time_budget_ms
+        self.travel_matrix = travel_matrix
+        self.travel_mode = travel_mode
+        # Catalogs searched by the "discover" action
+        self.catalogs = catalogs
+        # Runs the route search off the event loop
+        self.executor = executor
     
     async def optimize(
         self,
@@ -19,19 +65,57 @@ class ItineraryOptimizer:
         action_data: Dict[str, Any]
     ) -> TripPlan:
         """
-        Optimize the itinerary based on the specified action
+        Optimize the itinerary based on the specified action.
+        The input trip is never modified: actions copy only the day they
+        change (see _copy_day) and share everything else with the original.
+        """
+        return (await self.apply(trip, action, action_data)).trip
+    
+    async def apply(
+        self,
+        trip: TripPlan,
+        action: str,
+        action_data: Dict[str, Any]
+    ) -> OptimizationResult:
+        """
+        Same as optimize, also reporting which slots of which days changed
         """
-        # Create a deep copy to avoid modifying the original
-        optimized_trip = copy.deepcopy(trip)
+        with tracer.span(f"optimizer.{action}" if action in ACTIONS else "optimizer.unknown"):
+            if action == "reorder":
+                new_trip = await self._reorder_attractions(trip, action_data)
+            elif action == "remove":
+                new_trip = await self._remove_attraction(trip, action_data)
+            elif action == "discover":
+                new_trip = await self._discover_attractions(trip, action_data)
+            else:
+                new_trip = trip
         
-        if action == "reorder":
-            return await self._reorder_attractions(optimized_trip, action_data)
-        elif action == "remove":
-            return await self._remove_attraction(optimized_trip, action_data)
-        elif action == "discover":
-            return await self._discover_attractions(optimized_trip, action_data)
-        else:
-            return optimized_trip
+        changes = []
+        for old_day, new_day in zip(trip.days, new_trip.days):
+            if old_day is new_day:
+                continue
+            change = diff_slots(new_day.day_number, old_day.time_slots, new_day.time_slots)
+            if change.changed_slots or change.slot_count != len(old_day.time_slots):
+                changes.append(change)
+        return OptimizationResult(trip=new_trip, changes=changes)
+    
+    def _copy_day(self, trip: TripPlan, day_number: int) -> Tuple[TripPlan, DayItinerary, DayTimeline]:
+        """
+        Shallow-copy the trip and one of its days for modification.
+        Only the day's slot list is copied: the timeline replaces the slots
+        whose timings change, so untouched slots, days and attractions stay
+        shared with the original.
+        """
+        day = trip.days[day_number - 1]
+        new_day = day.model_copy(update={"time_slots": list(day.time_slots)})
+        timeline = DayTimeline.of(new_day, source=day)
+        
+        days = list(trip.days)
+        days[day_number - 1] = new_day
+        return trip.model_copy(update={"days": days}), new_day, timeline
+    
+    def _leg_minutes(self, origin: Attraction, destination: Attraction) -> int:
+        return round(self.travel_matrix.travel_minutes(origin, destination, self.travel_mode))
     
     async def _reorder_attractions(
         self,
@@ -39,17 +123,38 @@ class ItineraryOptimizer:
         data: Dict[str, Any]
     ) -> TripPlan:
         """
-        Reorder attractions within a day to optimize travel time
+        Reorder attractions within a day, either to the order the user
+        dragged them into or ("auto" mode) to minimize travel time
         """
         day_number = data.get("day_number")
         new_order = data.get("new_order", [])  # List of attraction IDs in new order
+        mode = data.get("mode", "manual" if new_order else "auto")
         
         if day_number and 0 < day_number <= len(trip.days):
-            day = trip.days[day_number - 1]
+            trip, day, timeline = self._copy_day(trip, day_number)
+            
+            if mode == "auto":
+                result = await self.executor.run(functools.partial(
+                    solve_route,
+                    travel=self._day_travel_minutes(day),
+                    durations=[slot.attraction.duration_minutes for slot in day.time_slots],
+                    windows=[
+                        weekly_hours(slot.attraction).envelope(timeline.weekday)
+                        for slot in day.time_slots
+                    ],
+                    start_minute=DAY_START_MINUTE,
+                    time_budget_ms=self.route_time_budget_ms
+                ))
+                order = result.order
+            else:
+                # Listed attractions first, anything not listed keeps its relative order
+                position = {attraction_id: i for i, attraction_id in enumerate(new_order)}
+                order = sorted(
+                    range(len(day.time_slots)),
+                    key=lambda i: (position.get(day.time_slots[i].attraction.id, len(position)), i)
+                )
             
-            # TODO: Implement actual reordering logic
-            # For now, just acknowledge the request
-            print(f"Reordering day {day_number} with new order: {new_order}")
+            timeline.reorder(order, self._leg_minutes)
         
         return trip
     
@@ -65,20 +170,20 @@ class ItineraryOptimizer:
         day_number = data.get("day_number")
         
         if day_number and attraction_id and 0 < day_number <= len(trip.days):
-            day = trip.days[day_number - 1]
-            
-            # Filter out the attraction
-            day.time_slots = [
-                slot for slot in day.time_slots 
-                if slot.attraction.id != attraction_id
+            positions = [
+                i for i, slot in enumerate(trip.days[day_number - 1].time_slots)
+                if slot.attraction.id == attraction_id
             ]
+            if not positions:
+                return trip
             
-            # Recalculate timings
-            self._recalculate_day_timings(day)
+            trip, day, timeline = self._copy_day(trip, day_number)
             
-            # Update total cost
-            day.total_cost = sum(slot.attraction.cost_usd for slot in day.time_slots)
-            trip.total_cost = sum(d.total_cost for d in trip.days)
+            # Later positions first so earlier indexes stay valid
+            cost_change = 0.0
+            for position in reversed(positions):
+                cost_change += timeline.remove(position, self._leg_minutes)
+            trip.total_cost += cost_change
         
         return trip
     
@@ -88,45 +193,129 @@ class ItineraryOptimizer:
         data: Dict[str, Any]
     ) -> TripPlan:
         """
-        Discover and suggest new attractions based on preferences
+        Add the nearest catalog attractions of the requested type to a day.
+        Searches around data["location"] ({"lat", "lng"}) or, without one,
+        the centroid of the day's current stops. Attractions that can't be
+        visited while open that day are passed over for the next nearest.
+        An unknown type searches every type; a limit, radius or location
+        that isn't a number leaves the trip unchanged, and limit and radius
+        are capped at DISCOVER_MAX_PLACES and DISCOVER_MAX_RADIUS_KM.
         """
         day_number = data.get("day_number")
         attraction_type = data.get("type")
+        if not isinstance(attraction_type, str) or attraction_type not in ATTRACTION_TYPES:
+            attraction_type = None
         location = data.get("location")
+        limit = data.get("limit")
+        radius_km = data.get("radius_km")
+        
+        if not (isinstance(day_number, int) and 0 < day_number <= len(trip.days)):
+            return trip
+        if limit is None:
+            limit = 1
+        elif isinstance(limit, int) and not isinstance(limit, bool):
+            limit = min(max(limit, 1), DISCOVER_MAX_PLACES)
+        else:
+            return trip
+        if radius_km is None:
+            radius_km = DISCOVER_RADIUS_KM
+        elif isinstance(radius_km, (int, float)) and not isinstance(radius_km, bool) and radius_km > 0:
+            radius_km = min(radius_km, DISCOVER_MAX_RADIUS_KM)
+        else:
+            return trip
         
-        # TODO: Implement actual discovery logic using Google Places API
-        # For now, return the original trip
-        print(f"Discovering {attraction_type} attractions near {location}")
+        day = trip.days[day_number - 1]
+        if isinstance(location, dict) and "lat" in location and "lng" in location:
+            try:
+                lat, lng = float(location["lat"]), float(location["lng"])
+            except (TypeError, ValueError):
+                return trip
+            if not (math.isfinite(lat) and math.isfinite(lng) and -90 <= lat <= 90 and -180 <= lng <= 180):
+                return trip
+        elif day.time_slots:
+            lat = sum(slot.attraction.location.lat for slot in day.time_slots) / len(day.time_slots)
+            lng = sum(slot.attraction.location.lng for slot in day.time_slots) / len(day.time_slots)
+        else:
+            return trip
         
-        return trip
+        # Never suggest something already in the trip
+        planned_ids = {slot.attraction.id for d in trip.days for slot in d.time_slots}
+        found = self.catalogs.get(trip.destination).index.nearest(
+            lat,
+            lng,
+            k=limit * DISCOVER_CANDIDATES_PER_PLACE,
+            attraction_type=attraction_type,
+            radius_km=radius_km,
+            exclude_ids=planned_ids
+        )
+        if not found:
+            return trip
+        
+        new_trip, day, timeline = self._copy_day(trip, day_number)
+        added = 0
+        for attraction, distance_km in found:
+            cost_change = self._insert_attraction(
+                day, timeline, attraction, notes=f"Discovered {distance_km:.1f} km away"
+            )
+            if cost_change is None:
+                continue
+            new_trip.total_cost += cost_change
+            added += 1
+            if added == limit:
+                break
+        
+        return new_trip if added else trip
     
-    def _recalculate_day_timings(self, day: DayItinerary):
+    def _insert_attraction(
+        self,
+        day: DayItinerary,
+        timeline: DayTimeline,
+        attraction: Attraction,
+        notes: Optional[str] = None
+    ) -> Optional[float]:
         """
-        Recalculate time slots after modifications
+        Insert an attraction where it adds the least travel time to the day
+        while every place is still visited inside its opening hours.
+        Returns the change in the day's cost, or None if no position fits.
         """
-        if not day.time_slots:
-            return
-        
-        from datetime import datetime, timedelta
+        ids = [slot.attraction.id for slot in day.time_slots] + [attraction.id]
+        matrix = self.travel_matrix.matrix(
+            [slot.attraction for slot in day.time_slots] + [attraction],
+            self.travel_mode
+        ).submatrix(ids)
+        new = len(ids) - 1
         
-        # Start at 9 AM
-        current_time = datetime.strptime("09:00", "%H:%M").time()
+        added = []
+        for position in range(new + 1):
+            extra = 0.0
+            if position > 0:
+                extra += matrix[position - 1][new]
+            if position < new:
+                extra += matrix[new][position]
+            if 0 < position < new:
+                extra -= matrix[position - 1][position]
+            added.append(extra)
         
-        for i, slot in enumerate(day.time_slots):
-            slot.start_time = current_time
-            
-            # Calculate end time
-            duration = timedelta(minutes=slot.attraction.duration_minutes)
-            end_datetime = datetime.combine(day.date, current_time) + duration
-            slot.end_time = end_datetime.time()
-            
-            # Add travel time for next slot
-            if i < len(day.time_slots) - 1:
-                travel_time = timedelta(minutes=15)  # Default 15 min between attractions
-                current_time = (end_datetime + travel_time).time()
+        positions = sorted(range(new + 1), key=added.__getitem__)
+        best_position = next(
+            (position for position in positions if timeline.insertion_fits(position, attraction, self._leg_minutes)),
+            None
+        )
+        if best_position is None:
+            return None
         
-        # Update total duration
-        day.total_duration_minutes = sum(
-            slot.attraction.duration_minutes + slot.travel_time_minutes 
-            for slot in day.time_slots
+        # The timeline fills in the times
+        start = minute_to_time(timeline.start_minute)
+        return timeline.insert(
+            best_position,
+            TimeSlot(start_time=start, end_time=start, attraction=attraction, notes=notes),
+            self._leg_minutes
         )
+    
+    def _day_travel_minutes(self, day: DayItinerary) -> List[List[float]]:
+        """
+        Travel minutes between the day's stops, in slot order
+        """
+        attractions = [slot.attraction for slot in day.time_slots]
+        matrix = self.travel_matrix.matrix(attractions, self.travel_mode)
+        return matrix.submatrix([attraction.id for attraction in attractions])
@@ -1,35 +1,75 @@
-from typing import Dict, Any, Optional, List
-from datetime import datetime, timedelta, time
-from langchain.chat_models import ChatOpenAI
-from langchain.agents import AgentExecutor, create_openai_tools_agent
-from langchain.tools import Tool
+from typing import Dict, Any, Optional, List, AsyncIterator, Union
+from datetime import datetime, timedelta
+import asyncio
 import uuid
 import os
 from dotenv import load_dotenv
 
-from models import TripPlan, DayItinerary, TimeSlot, Attraction, Location, AttractionType
+from models import TripPlan, DayItinerary, TimeSlot, Attraction
+from services.travel_matrix import TravelMode, travel_matrix_engine
+from services.catalog import AttractionCatalog, CatalogRegistry, catalog_registry
+from services.day_packer import pack_catalog, parse_budget
+from services.intent_extractor import duration_or_default
+from services.cpu_executor import CPUExecutor, cpu_executor
+from services.llm_clients import LLMClientPool, llm_clients
+from services.response_cache import ResponseCache
+from services.single_flight import SingleFlight
+from services.compact_trip import trusted_constructor
+from services.opening_hours import visit_start
+from services.timeline import minute_to_time, DAY_START_MINUTE
+from services.telemetry import tracer
 
 load_dotenv()
 
+
+def create_plan_flights() -> Optional[SingleFlight]:
+    """
+    Shares one plan computation between concurrent identical requests and
+    keeps finished plans for a while (PLAN_CACHE_SIZE=0 keeps none)
+    """
+    return SingleFlight(
+        max_entries=int(os.getenv("PLAN_CACHE_SIZE", "256")),
+        ttl_seconds=float(os.getenv("PLAN_CACHE_TTL_SECONDS", "300"))
+    )
+
 class TripPlannerAgent:
     """
     Specialized agent for creating detailed trip plans
     Uses LangChain tools to search for attractions, optimize routes, etc.
     """
     
-    def __init__(self):
-        self.model = ChatOpenAI(
-            model="gpt-4-turbo-preview",
-            temperature=0.5,
-            openai_api_key=os.getenv("OPENAI_API_KEY")
-        )
+    def __init__(
+        self,
+        catalogs: CatalogRegistry = catalog_registry,
+        cache: Optional[ResponseCache] = None,
+        clients: LLMClientPool = llm_clients,
+        flights: Optional[SingleFlight] = None,
+        executor: CPUExecutor = cpu_executor
+    ):
+        # The model is built on first use (see model)
+        self.model_name = "gpt-4-turbo-preview"
+        self.clients = clients
+        self.travel_matrix = travel_matrix_engine
+        self.catalogs = catalogs
+        # Day packing runs on the CPU executor, off the event loop
+        self.executor = executor
+        self.packing_time_budget_ms = float(os.getenv("PLANNER_TIME_BUDGET_MS", "50"))
+        # Attraction selections for the same or a near-identical request
+        self.cache = cache
+        # Plans being built or recently built, by normalized preferences
+        self.flights = flights if flights is not None else create_plan_flights()
         
-        # TODO: Initialize LangChain tools for:
+        # TODO: Initialize LangChain tools (imported there, not at module
+        # level, to keep them out of start-up) for:
         # - Google Places API search
         # - Route optimization
         # - Weather checking
         # - Cost estimation
         
+    @property
+    def model(self):
+        return self.clients.chat_model("openai", self.model_name, 0.5)
+    
     async def plan_trip(
         self,
         user_input: str,
@@ -39,20 +79,95 @@ class TripPlannerAgent:
         """
         Generate a complete trip plan based on user preferences
         """
+        trip_plan = None
+        async for item in self.plan_trip_stream(user_input, preferences, current_trip):
+            trip_plan = item
+        return trip_plan
+    
+    async def plan_trip_stream(
+        self,
+        user_input: str,
+        preferences: Dict[str, Any],
+        current_trip: Optional[TripPlan] = None
+    ) -> AsyncIterator[Union[DayItinerary, TripPlan]]:
+        """
+        Same as plan_trip, yielding each DayItinerary as soon as it is
+        final and the complete TripPlan last
+        """
+        with tracer.span("planner.plan_trip"):
+            destination = preferences.get("destination", "San Francisco")
+            # Preferences from the model tiers aren't bounded like the extractor's
+            duration_days = duration_or_default(preferences.get("duration_days"))
+            
+            try:
+                travel_mode = TravelMode(preferences.get("travel_mode") or TravelMode.TRANSIT)
+            except (ValueError, TypeError):
+                # A mode the model tiers made up: plan as for the default
+                travel_mode = TravelMode.TRANSIT
+            
+            # Attractions for the destination, validated once and shared by all requests
+            catalog = self.catalogs.get(destination)
+            scope = self._plan_scope(preferences, catalog, duration_days, travel_mode)
+            
+            # Concurrent identical requests share one build; each gets its own copy.
+            # Slots follow opening hours, so builds are shared only by trips
+            # starting on the same weekday.
+            trip_id = str(uuid.uuid4())
+            start_date = datetime.now() + timedelta(days=7)  # Start in a week
+            days = []
+            plans = self.flights.stream(
+                tuple((name, tuple(value) if isinstance(value, list) else value) for name, value in scope.items())
+                + (("start_weekday", start_date.weekday()),),
+                lambda: self._build_plan(user_input, catalog, scope, duration_days, travel_mode, start_date)
+            )
+            async for item in plans:
+                if isinstance(item, DayItinerary):
+                    day = item.model_copy(update={
+                        "date": start_date + timedelta(days=item.day_number - 1),
+                        "time_slots": list(item.time_slots)
+                    })
+                    days.append(day)
+                    yield day
+                else:
+                    yield item.model_copy(update={
+                        "id": trip_id,
+                        "destination": destination,
+                        "start_date": start_date,
+                        "end_date": start_date + timedelta(days=duration_days-1),
+                        "days": days
+                    })
+    
+    async def _build_plan(
+        self,
+        user_input: str,
+        catalog: AttractionCatalog,
+        scope: Dict[str, Any],
+        duration_days: int,
+        travel_mode: TravelMode,
+        start_date: datetime
+    ) -> AsyncIterator[Union[DayItinerary, TripPlan]]:
+        """
+        The plan for one set of preferences and starting weekday. Its days
+        and plan are shared by every request coalesced onto it and must not
+        be changed.
+        """
         # TODO: Implement actual trip planning logic with LangChain
         # This is a placeholder with mock San Francisco data
         
-        destination = preferences.get("destination", "San Francisco")
-        duration_days = preferences.get("duration_days", 3)
+        # Pick each day's attractions by interest, rating and location within the budget
+        with tracer.span("planner.select_attractions"):
+            packed_days = await self._select_attractions(user_input, scope, catalog)
         
-        # Mock San Francisco attractions
-        sf_attractions = self._get_mock_sf_attractions()
-        
-        # Create trip plan
+        # Requests copy the plan with their own id and dates
         trip_id = str(uuid.uuid4())
-        start_date = datetime.now() + timedelta(days=7)  # Start in a week
+        
+        # Slots and days are made from validated catalog attractions and computed
+        # times, so they skip validation
+        new_slot = trusted_constructor(TimeSlot)
+        new_day = trusted_constructor(DayItinerary)
         
         days = []
+        trip_cost = 0.0
         day_colors = ["#3B82F6", "#10B981", "#F59E0B", "#EF4444", "#8B5CF6"]
         
         for day_num in range(duration_days):
@@ -60,204 +175,119 @@ class TripPlannerAgent:
             
             # Create time slots for the day
             time_slots = []
-            current_time = time(9, 0)  # Start at 9 AM
+            current_minute = DAY_START_MINUTE  # Start at 9 AM
+            day_cost = 0.0
             
-            # Add 3-4 attractions per day
-            day_attractions = sf_attractions[day_num*4:(day_num+1)*4]
+            day_attractions = packed_days[day_num]
+            travel_matrix = self.travel_matrix.matrix(day_attractions, travel_mode, catalog.destination)
+            weekday = current_date.weekday()
+            previous = None
             
-            for i, attraction in enumerate(day_attractions):
-                # Calculate end time based on duration
-                start_datetime = datetime.combine(current_date, current_time)
-                end_datetime = start_datetime + timedelta(minutes=attraction.duration_minutes)
+            for attraction in day_attractions:
+                # Travel from the previous attraction
+                travel_minutes = 0
+                if previous is not None:
+                    travel_minutes = round(travel_matrix.travel_minutes(previous.id, attraction.id))
                 
-                time_slot = TimeSlot(
-                    start_time=current_time,
-                    end_time=end_datetime.time(),
-                    attraction=attraction,
-                    travel_time_minutes=15 if i > 0 else 0,  # 15 min travel between attractions
-                    notes=f"Don't miss the {attraction.name}!"
-                )
+                # Wait for the attraction to open; leave it out if it can't
+                # be visited while open any more that day
+                start_minute = visit_start(attraction, weekday, current_minute + travel_minutes)
+                if start_minute is None:
+                    continue
+                end_minute = start_minute + attraction.duration_minutes
+                
+                time_slot = new_slot({
+                    "start_time": minute_to_time(start_minute),
+                    "end_time": minute_to_time(end_minute),
+                    "attraction": attraction,
+                    "travel_time_minutes": travel_minutes,
+                    "notes": f"Don't miss the {attraction.name}!"
+                })
                 time_slots.append(time_slot)
+                day_cost += attraction.cost_usd
                 
                 # Update current time for next slot
-                current_time = (end_datetime + timedelta(minutes=15)).time()
+                current_minute = end_minute
+                previous = attraction
             
             # Create day itinerary
-            day_itinerary = DayItinerary(
-                day_number=day_num + 1,
-                date=current_date,
-                time_slots=time_slots,
-                total_cost=sum(ts.attraction.cost_usd for ts in time_slots),
-                total_duration_minutes=sum(ts.attraction.duration_minutes + ts.travel_time_minutes for ts in time_slots),
-                color_code=day_colors[day_num % len(day_colors)]
-            )
+            day_itinerary = new_day({
+                "day_number": day_num + 1,
+                "date": current_date,
+                "time_slots": time_slots,
+                "total_cost": day_cost,
+                "total_duration_minutes": current_minute - DAY_START_MINUTE,
+                "color_code": day_colors[day_num % len(day_colors)]
+            })
             days.append(day_itinerary)
+            trip_cost += day_cost
+            yield day_itinerary
+            # Let the day go out before building the next one
+            await asyncio.sleep(0)
         
         # Create complete trip plan
         trip_plan = TripPlan(
             id=trip_id,
-            destination=destination,
+            destination=catalog.destination,
             start_date=start_date,
             end_date=start_date + timedelta(days=duration_days-1),
             days=days,
-            total_cost=sum(day.total_cost for day in days),
-            notes="Your personalized San Francisco adventure awaits!"
+            total_cost=trip_cost,
+            notes=f"Your personalized {catalog.destination} adventure awaits!"
         )
         
-        return trip_plan
+        yield trip_plan
+    
+    def _plan_scope(
+        self,
+        preferences: Dict[str, Any],
+        catalog: AttractionCatalog,
+        duration_days: int,
+        travel_mode: TravelMode
+    ) -> Dict[str, Any]:
+        """
+        What the plan depends on, normalized so equivalent preferences
+        compare equal ("sf" and "San Francisco", interests in any order)
+        """
+        return {
+            "destination": catalog.destination,
+            "catalog_mtime": catalog.source_mtime,
+            "duration_days": duration_days,
+            "interests": sorted(preferences.get("interests") or []),
+            "budget": preferences.get("budget"),
+            "travel_mode": travel_mode.value
+        }
     
-    def _get_mock_sf_attractions(self) -> List[Attraction]:
+    async def _select_attractions(
+        self,
+        user_input: str,
+        scope: Dict[str, Any],
+        catalog: AttractionCatalog
+    ) -> List[List[Attraction]]:
         """
-        Return mock San Francisco attractions for demo
+        Each day's attractions, from the response cache when an equivalent
+        request was planned before. Only attraction ids are cached, so a
+        reloaded catalog is never served stale attraction details.
         """
-        return [
-            # Day 1 - Classic SF
-            Attraction(
-                id="1",
-                name="Golden Gate Bridge",
-                type=AttractionType.LANDMARK,
-                location=Location(lat=37.8199, lng=-122.4783, address="Golden Gate Bridge, San Francisco, CA"),
-                description="Iconic suspension bridge with stunning views",
-                duration_minutes=90,
-                cost_usd=0,
-                rating=4.8,
-                tags=["iconic", "photo-spot", "free"],
-                google_maps_url="https://maps.google.com/?q=Golden+Gate+Bridge"
-            ),
-            Attraction(
-                id="2",
-                name="Fisherman's Wharf",
-                type=AttractionType.ENTERTAINMENT,
-                location=Location(lat=37.8080, lng=-122.4177, address="Fisherman's Wharf, San Francisco, CA"),
-                description="Bustling waterfront with sea lions, shops, and restaurants",
-                duration_minutes=120,
-                cost_usd=0,
-                rating=4.2,
-                tags=["waterfront", "sea-lions", "shopping"],
-                google_maps_url="https://maps.google.com/?q=Fishermans+Wharf+SF"
-            ),
-            Attraction(
-                id="3",
-                name="Alcatraz Island",
-                type=AttractionType.LANDMARK,
-                location=Location(lat=37.8267, lng=-122.4230, address="Alcatraz Island, San Francisco, CA"),
-                description="Former federal prison on an island",
-                duration_minutes=180,
-                cost_usd=41.00,
-                rating=4.7,
-                tags=["history", "island", "tour"],
-                google_maps_url="https://maps.google.com/?q=Alcatraz+Island"
-            ),
-            Attraction(
-                id="4",
-                name="Ghirardelli Square",
-                type=AttractionType.SHOPPING,
-                location=Location(lat=37.8059, lng=-122.4230, address="900 North Point St, San Francisco, CA"),
-                description="Historic chocolate factory turned shopping center",
-                duration_minutes=60,
-                cost_usd=20,
-                rating=4.5,
-                tags=["chocolate", "shopping", "historic"],
-                google_maps_url="https://maps.google.com/?q=Ghirardelli+Square"
-            ),
-            
-            # Day 2 - Culture & Parks
-            Attraction(
-                id="5",
-                name="Golden Gate Park",
-                type=AttractionType.PARK,
-                location=Location(lat=37.7694, lng=-122.4862, address="Golden Gate Park, San Francisco, CA"),
-                description="Large urban park with gardens, museums, and trails",
-                duration_minutes=180,
-                cost_usd=0,
-                rating=4.7,
-                tags=["nature", "park", "free"],
-                google_maps_url="https://maps.google.com/?q=Golden+Gate+Park"
-            ),
-            Attraction(
-                id="6",
-                name="California Academy of Sciences",
-                type=AttractionType.MUSEUM,
-                location=Location(lat=37.7699, lng=-122.4661, address="55 Music Concourse Dr, San Francisco, CA"),
-                description="Natural history museum with aquarium and planetarium",
-                duration_minutes=180,
-                cost_usd=39.95,
-                rating=4.6,
-                tags=["museum", "science", "family-friendly"],
-                google_maps_url="https://maps.google.com/?q=California+Academy+of+Sciences"
-            ),
-            Attraction(
-                id="7",
-                name="Haight-Ashbury",
-                type=AttractionType.LANDMARK,
-                location=Location(lat=37.7692, lng=-122.4481, address="Haight-Ashbury, San Francisco, CA"),
-                description="Historic neighborhood, birthplace of 1960s counterculture",
-                duration_minutes=90,
-                cost_usd=0,
-                rating=4.3,
-                tags=["history", "shopping", "culture"],
-                google_maps_url="https://maps.google.com/?q=Haight+Ashbury"
-            ),
-            Attraction(
-                id="8",
-                name="Painted Ladies",
-                type=AttractionType.LANDMARK,
-                location=Location(lat=37.7763, lng=-122.4327, address="Steiner St & Hayes St, San Francisco, CA"),
-                description="Famous Victorian houses from Full House",
-                duration_minutes=30,
-                cost_usd=0,
-                rating=4.4,
-                tags=["architecture", "photo-spot", "free"],
-                google_maps_url="https://maps.google.com/?q=Painted+Ladies+SF"
-            ),
-            
-            # Day 3 - Downtown & Chinatown
-            Attraction(
-                id="9",
-                name="Chinatown",
-                type=AttractionType.LANDMARK,
-                location=Location(lat=37.7941, lng=-122.4078, address="Chinatown, San Francisco, CA"),
-                description="Largest Chinatown outside Asia",
-                duration_minutes=120,
-                cost_usd=30,
-                rating=4.4,
-                tags=["culture", "food", "shopping"],
-                google_maps_url="https://maps.google.com/?q=Chinatown+SF"
-            ),
-            Attraction(
-                id="10",
-                name="Union Square",
-                type=AttractionType.SHOPPING,
-                location=Location(lat=37.7880, lng=-122.4074, address="Union Square, San Francisco, CA"),
-                description="Premier shopping district",
-                duration_minutes=120,
-                cost_usd=0,
-                rating=4.3,
-                tags=["shopping", "dining", "downtown"],
-                google_maps_url="https://maps.google.com/?q=Union+Square+SF"
-            ),
-            Attraction(
-                id="11",
-                name="Ferry Building Marketplace",
-                type=AttractionType.SHOPPING,
-                location=Location(lat=37.7955, lng=-122.3937, address="1 Ferry Building, San Francisco, CA"),
-                description="Gourmet food market with bay views",
-                duration_minutes=90,
-                cost_usd=40,
-                rating=4.6,
-                tags=["food", "market", "waterfront"],
-                google_maps_url="https://maps.google.com/?q=Ferry+Building+SF"
-            ),
-            Attraction(
-                id="12",
-                name="Coit Tower",
-                type=AttractionType.LANDMARK,
-                location=Location(lat=37.8024, lng=-122.4058, address="1 Telegraph Hill Blvd, San Francisco, CA"),
-                description="Art deco tower with panoramic city views",
-                duration_minutes=60,
-                cost_usd=10,
-                rating=4.5,
-                tags=["views", "art-deco", "historic"],
-                google_maps_url="https://maps.google.com/?q=Coit+Tower"
-            )
-        ]
+        if self.cache is not None:
+            cached, _ = self.cache.get(user_input, self.model_name, scope)
+            if cached is not None:
+                days = [[catalog.get(attraction_id) for attraction_id in day] for day in cached["days"]]
+                if all(attraction is not None for day in days for attraction in day):
+                    return days
+        
+        packed_ids = await self.executor.run(
+            pack_catalog,
+            catalog.destination,
+            catalog.source_mtime,
+            scope["duration_days"],
+            scope["interests"],
+            parse_budget(scope["budget"], scope["duration_days"]),
+            self.packing_time_budget_ms,
+            scope["travel_mode"]
+        )
+        if self.cache is not None:
+            self.cache.put(user_input, self.model_name, {"days": packed_ids}, scope)
+        # A worker process may have read a newer catalog than this one
+        days = [[catalog.get(attraction_id) for attraction_id in day] for day in packed_ids]
+        return [[attraction for attraction in day if attraction is not None] for day in days]
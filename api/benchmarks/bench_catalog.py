@@ -0,0 +1,68 @@
+"""
+Catalog loading and per-request lookup cost, against building the
+attraction list from scratch on every plan_trip call as before.
+
+Run from the api directory:
+    python -m benchmarks.bench_catalog
+"""
+import json
+import os
+import random
+import tempfile
+import time
+
+from models import Attraction
+from services.catalog import CatalogRegistry
+from benchmarks.common import build_attraction, summarize, print_table
+
+CATALOG_SIZES = [12, 10000, 50000]
+ROUNDS = 200
+
+
+def write_catalog(directory: str, size: int, rng: random.Random) -> str:
+    attractions = [build_attraction(i, rng).model_dump(mode="json") for i in range(size)]
+    path = os.path.join(directory, "san_francisco.json")
+    with open(path, "w") as f:
+        json.dump({"destination": "San Francisco", "aliases": ["sf"], "attractions": attractions}, f)
+    return path
+
+
+def timed(fn, rounds=ROUNDS):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def main():
+    rng = random.Random(5)
+    rows = []
+    for size in CATALOG_SIZES:
+        with tempfile.TemporaryDirectory() as directory:
+            write_catalog(directory, size, rng)
+            raw = json.load(open(os.path.join(directory, "san_francisco.json")))["attractions"]
+
+            registry = CatalogRegistry(directory)
+            load = timed(lambda: CatalogRegistry(directory).get("San Francisco"), rounds=3)
+            registry.get("San Francisco")
+
+            rows.append({"operation": "load + validate + index", "attractions": size, **load})
+            rows.append({
+                "operation": "per-request get (alias)",
+                "attractions": size,
+                **timed(lambda: registry.get("sf"))
+            })
+            # Old plan_trip behaviour: construct every attraction per request
+            rounds = ROUNDS if size <= 12 else 3
+            rows.append({
+                "operation": "per-request construction",
+                "attractions": size,
+                **timed(lambda: [Attraction(**item) for item in raw], rounds=rounds)
+            })
+    print_table("Attraction catalog", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+End-to-end /chat latency with the reply and trip planning run one after
+the other against the speculative pipeline, using a fake LLM for the
+reply and a planner slowed down to LLM-like latency. Covers the intent
+guess matching the final extraction, disagreeing with it, and a message
+that turns out not to need a plan. Exits with status 1 if a scenario's
+reply doesn't plan the days its agent asked for, if speculating doesn't
+beat the sequential pipeline when the guess matches, or if a wrong
+guess isn't counted as wasted.
+
+Run from the api directory:
+    python -m benchmarks.bench_chat_pipeline
+"""
+import asyncio
+import os
+import sys
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("ANTHROPIC_API_KEY", "bench")
+
+from agents.chat_agent import ChatAgent
+from agents.trip_planner import TripPlannerAgent
+from agents.chat_pipeline import ChatPipeline
+from services.llm_stream import FakeLLM
+from benchmarks.common import summarize, print_table, report_checks
+
+ROUNDS = 5
+FIRST_TOKEN_MS = 300
+TOKENS_PER_SECOND = 50
+PLANNING_DELAY_MS = 1200
+MESSAGE = "Plan a trip to San Francisco"
+
+
+class SlowPlanner(TripPlannerAgent):
+    """
+    Planner that first waits as long as an LLM planning call would
+    """
+
+    async def plan_trip_stream(self, user_input, preferences, current_trip=None):
+        await asyncio.sleep(PLANNING_DELAY_MS / 1000.0)
+        async for item in super().plan_trip_stream(user_input, preferences, current_trip):
+            yield item
+
+
+class ChangedMindAgent(ChatAgent):
+    """
+    The final extraction asks for a longer trip than the intent guess
+    """
+
+    def _draft_response(self, message, intent):
+        draft = super()._draft_response(message, intent)
+        preferences = dict(draft.extracted_preferences or {}, duration_days=5)
+        return draft.model_copy(update={"extracted_preferences": preferences})
+
+
+class NoPlanAgent(ChatAgent):
+    """
+    The guess says plan, the final reply decides not to
+    """
+
+    def _draft_response(self, message, intent):
+        return super()._draft_response(message, intent).model_copy(update={"requires_planning": False})
+
+
+async def measure(pipeline: ChatPipeline):
+    totals = []
+    days = set()
+    for _ in range(ROUNDS):
+        result = await pipeline.run(MESSAGE)
+        totals.append(result.timings_ms["total"])
+        days.add(len(result.trip_plan.days) if result.trip_plan else 0)
+    # Every round should plan the same: a mix means replies leaked between rounds
+    return {**summarize(totals), "trip_days": days.pop() if len(days) == 1 else sorted(days)}
+
+
+async def main():
+    fake_llm = FakeLLM(first_token_ms=FIRST_TOKEN_MS, tokens_per_second=TOKENS_PER_SECOND)
+    planner = SlowPlanner()
+    rows = []
+    # Trip days each scenario's final reply asks for
+    scenarios = (("guess matches", ChatAgent, 3), ("guess differs", ChangedMindAgent, 5), ("no plan needed", NoPlanAgent, 0))
+    for scenario, agent_class, days in scenarios:
+        for speculate in (False, True):
+            pipeline = ChatPipeline(agent_class(token_source=fake_llm), planner, speculate=speculate)
+            row = {"scenario": scenario, "pipeline": "speculative" if speculate else "sequential", **(await measure(pipeline))}
+            stats = pipeline.metrics.stats()
+            row["wasted_rate"] = stats["wasted_rate"]
+            row["plan_wait_p50_ms"] = stats["stages"].get("plan_wait", {}).get("p50_ms", "")
+            row["passed"] = row["trip_days"] == days
+            if speculate and scenario == "guess matches":
+                row["passed"] = row["passed"] and row["median_ms"] < rows[-1]["median_ms"]
+            elif speculate:
+                row["passed"] = row["passed"] and row["wasted_rate"] > 0
+            rows.append(row)
+
+    print_table(
+        f"/chat total latency: reply {FIRST_TOKEN_MS} ms + {TOKENS_PER_SECOND} tokens/s, planning {PLANNING_DELAY_MS} ms",
+        rows
+    )
+    if not report_checks(rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
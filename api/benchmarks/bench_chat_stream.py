@@ -0,0 +1,199 @@
+"""
+Time to first token and first trip day for streamed /chat replies over
+SSE and WebSocket, with a fake LLM that emits tokens on a fixed schedule.
+Also checks that every stream's tokens add up to its final reply, that
+trip days arrive before chat_done, and that slow readers still get every
+token: over TCP, and through the bounded event buffer, where queued
+tokens are coalesced. Exits with status 1 if any check fails.
+
+Run from the api directory:
+    python -m benchmarks.bench_chat_stream
+"""
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("ANTHROPIC_API_KEY", "bench")
+
+import httpx
+import uvicorn
+import websockets
+
+import main
+from services.llm_stream import FakeLLM, word_tokens, buffered, merge_tokens
+from benchmarks.common import summarize, print_table, report_checks
+
+FIRST_TOKEN_MS = 300
+TOKENS_PER_SECOND = 50
+ROUNDS = 5
+SLOW_READER_DELAY = 0.1
+BUFFER_SIZE = 4
+MESSAGE = "Plan a 3 day trip to San Francisco"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def parse_sse(buffer: str):
+    events = []
+    while "\n\n" in buffer:
+        frame, buffer = buffer.split("\n\n", 1)
+        data = next(line[len("data: "):] for line in frame.split("\n") if line.startswith("data: "))
+        events.append(json.loads(data))
+    return events, buffer
+
+
+class StreamLog:
+    """
+    What one streamed reply delivered: when each event type first
+    arrived, the order of the events, the token text and the final reply
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.marks = {}
+        self.types = []
+        self.text = ""
+        self.reply = None
+
+    def add(self, event: dict):
+        self.marks.setdefault(event.get("type"), (time.perf_counter() - self.start) * 1000)
+        self.types.append(event.get("type"))
+        if event.get("type") == "chat_token":
+            self.text += event["text"]
+        elif event.get("type") == "chat_done":
+            self.reply = event["response"]
+
+    def check(self, name: str) -> dict:
+        done = self.types.index("chat_done") if "chat_done" in self.types else -1
+        days = [position for position, kind in enumerate(self.types) if kind == "trip_day"]
+        trip = (self.reply or {}).get("trip_plan") or {}
+        planned = len(trip.get("days", []))
+        text_matches = self.reply is not None and self.text == self.reply["text"]
+        days_first = bool(days) and len(days) == planned and days[-1] < done
+        return {
+            "name": name,
+            "text_matches_reply": text_matches,
+            "days_before_done": days_first,
+            "passed": text_matches and days_first
+        }
+
+
+async def sse_run(client: httpx.AsyncClient, base_url: str, session_id: str, reader_delay: float = 0.0):
+    log = StreamLog()
+    frames = 0
+    buffer = ""
+    async with client.stream("POST", f"{base_url}/chat/stream", json={"message": MESSAGE, "session_id": session_id}) as response:
+        async for chunk in response.aiter_text():
+            events, buffer = parse_sse(buffer + chunk)
+            for event in events:
+                frames += 1
+                log.add(event)
+            if reader_delay:
+                await asyncio.sleep(reader_delay)
+    log.marks["done"] = (time.perf_counter() - log.start) * 1000
+    return log, frames
+
+
+async def ws_run(base_url: str, session_id: str):
+    async with websockets.connect(f"{base_url.replace('http', 'ws')}/ws/{session_id}?protocol=full") as ws:
+        log = StreamLog()
+        await ws.send(json.dumps({"type": "chat", "message": MESSAGE}))
+        while True:
+            event = json.loads(await ws.recv())
+            log.add(event)
+            if event.get("type") == "chat_done":
+                break
+    log.marks["done"] = log.marks["chat_done"]
+    return log
+
+
+async def buffer_run(draft: str):
+    # A consumer slower than the token rate, reading straight from the buffer
+    async def events():
+        async for token in FakeLLM(first_token_ms=0, tokens_per_second=TOKENS_PER_SECOND * 10).stream([], draft):
+            yield {"type": "chat_token", "text": token}
+
+    frames = 0
+    text = ""
+    async for event in buffered(events(), max_pending=BUFFER_SIZE, coalesce=merge_tokens):
+        frames += 1
+        text += event["text"]
+        await asyncio.sleep(SLOW_READER_DELAY / 5)
+    return frames, text
+
+
+async def run(base_url: str):
+    agent = main.app_agents.chat_agent
+    draft = agent._draft_response(MESSAGE, agent.rule_intent(MESSAGE)).text
+    rows = []
+    checks = []
+    async with httpx.AsyncClient(timeout=30) as client:
+        for name in ("sse", "websocket"):
+            samples = {"chat_token": [], "trip_day": [], "done": []}
+            for i in range(ROUNDS):
+                if name == "sse":
+                    log, _ = await sse_run(client, base_url, f"bench-sse-{i}")
+                else:
+                    log = await ws_run(base_url, f"bench-ws-{i}")
+                for key in samples:
+                    samples[key].append(log.marks[key])
+                checks.append(log.check(f"{name} round {i + 1}"))
+            for key, label in (("chat_token", "first token"), ("trip_day", "first day"), ("done", "complete")):
+                rows.append({"transport": name, "milestone": label, **summarize(samples[key])})
+
+        slow, frames = await sse_run(client, base_url, "bench-slow", reader_delay=SLOW_READER_DELAY)
+        checks.append(slow.check("slow sse reader"))
+    buffer_frames, buffer_text = await buffer_run(draft)
+    checks.append({"name": "slow buffer reader", "text_matches_reply": buffer_text == draft, "days_before_done": "", "passed": buffer_text == draft})
+
+    print_table(
+        f"Streamed /chat, fake LLM: {FIRST_TOKEN_MS} ms to first token, {TOKENS_PER_SECOND} tokens/s "
+        f"({len(word_tokens(draft))} tokens); a blocking reply arrives at 'complete'",
+        rows
+    )
+    print(
+        f"\nSlow SSE reader ({SLOW_READER_DELAY * 1000:.0f} ms per read): {frames} frames, "
+        f"done after {slow.marks['done']:.0f} ms"
+    )
+    print(
+        f"Slow reader on a {BUFFER_SIZE}-event buffer ({SLOW_READER_DELAY * 200:.0f} ms per event, "
+        f"{TOKENS_PER_SECOND * 10} tokens/s): {buffer_frames} frames for {len(word_tokens(draft))} tokens"
+    )
+    print_table("Stream checks", checks)
+    return report_checks(checks)
+
+
+def main_benchmark():
+    # Every round sends the same message: cached replies would skip the fake LLM
+    main.app_agents.chat_agent.cache = None
+    main.app_agents.chat_agent.token_source = FakeLLM(first_token_ms=FIRST_TOKEN_MS, tokens_per_second=TOKENS_PER_SECOND)
+    port = free_port()
+    server = start_server(port)
+    try:
+        passed = asyncio.run(run(f"http://127.0.0.1:{port}"))
+    finally:
+        server.should_exit = True
+    if not passed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,130 @@
+"""
+Compact session trips against the pydantic models: memory held per 1000
+stored trips as validated models, as the compressed JSON the in-memory
+session store used to keep, and as CompactTrips; then per-trip time to
+store (encode) and load (decode) each form, to build a plan's slots and
+days with and without validation, and to serialize the loaded trip.
+
+Run from the api directory:
+    python -m benchmarks.bench_compact_trip
+"""
+import asyncio
+import os
+import time
+import tracemalloc
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("ANTHROPIC_API_KEY", "bench")
+
+from models import TripPlan, DayItinerary, TimeSlot
+from agents.trip_planner import TripPlannerAgent
+from services.compact_trip import AttractionTable, CompactTrip, trusted_constructor
+from services.session_store import encode_trip, decode_trip
+from benchmarks.common import summarize, print_table
+
+TRIPS = 1000
+INTERESTS = (["food", "culture"], ["nature"], ["art", "history"], ["sightseeing", "food"], ["shopping", "nightlife"])
+
+
+async def plan_trips(count: int):
+    planner = TripPlannerAgent(cache=None)
+    return [
+        await planner.plan_trip("Plan a trip", {
+            "destination": "San Francisco",
+            "duration_days": 2 + i % 5,
+            "interests": INTERESTS[i % len(INTERESTS)]
+        })
+        for i in range(count)
+    ]
+
+
+def retained_bytes(build) -> int:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+
+def per_trip_us(trips, operation):
+    samples = []
+    for trip in trips:
+        start = time.perf_counter()
+        operation(trip)
+        samples.append((time.perf_counter() - start) * 1000)
+    return {key.replace("_ms", "_us"): round(value * 1000, 1) for key, value in summarize(samples).items()}
+
+
+def build_validated(trip: TripPlan):
+    return [
+        DayItinerary(
+            day_number=day.day_number, date=day.date, total_cost=day.total_cost,
+            total_duration_minutes=day.total_duration_minutes, color_code=day.color_code,
+            time_slots=[
+                TimeSlot(
+                    start_time=slot.start_time, end_time=slot.end_time, attraction=slot.attraction,
+                    travel_time_minutes=slot.travel_time_minutes, notes=slot.notes
+                )
+                for slot in day.time_slots
+            ]
+        )
+        for day in trip.days
+    ]
+
+
+def build_trusted(trip: TripPlan):
+    new_slot = trusted_constructor(TimeSlot)
+    new_day = trusted_constructor(DayItinerary)
+    return [
+        new_day({
+            "day_number": day.day_number, "date": day.date,
+            "time_slots": [
+                new_slot({
+                    "start_time": slot.start_time, "end_time": slot.end_time, "attraction": slot.attraction,
+                    "travel_time_minutes": slot.travel_time_minutes, "notes": slot.notes
+                })
+                for slot in day.time_slots
+            ],
+            "total_cost": day.total_cost, "total_duration_minutes": day.total_duration_minutes,
+            "color_code": day.color_code
+        })
+        for day in trip.days
+    ]
+
+
+def main():
+    trips = asyncio.run(plan_trips(TRIPS))
+    slots = sum(len(day.time_slots) for trip in trips for day in trip.days)
+    payloads = [trip.model_dump_json() for trip in trips]
+
+    table = AttractionTable()
+    compact = [CompactTrip.of(trip, table) for trip in trips]
+    for trip, stored in zip(trips, compact):
+        assert stored.expand(table).model_dump_json() == trip.model_dump_json()
+
+    rows = [
+        {"stored_as": "pydantic models", "kb": retained_bytes(lambda: [TripPlan.model_validate_json(p) for p in payloads]) // 1024},
+        {"stored_as": "zlib JSON (previous store)", "kb": retained_bytes(lambda: [encode_trip(trip) for trip in trips]) // 1024},
+        {"stored_as": "CompactTrip", "kb": retained_bytes(lambda: [CompactTrip.of(trip, AttractionTable()) for trip in trips]) // 1024},
+    ]
+    print_table(f"Memory for {TRIPS} stored trips ({slots / TRIPS:.1f} slots per trip)", rows)
+    print(f"CompactTrip.nbytes estimate: {sum(stored.nbytes for stored in compact) // 1024} kb")
+
+    encoded = [encode_trip(trip) for trip in trips]
+    rows = [
+        {"operation": "store: model_dump_json + zlib", **per_trip_us(trips, encode_trip)},
+        {"operation": "store: CompactTrip.of", **per_trip_us(trips, lambda trip: CompactTrip.of(trip, table))},
+        {"operation": "load: zlib + model_validate_json", **per_trip_us(encoded, decode_trip)},
+        {"operation": "load: CompactTrip.expand", **per_trip_us(compact, lambda stored: stored.expand(table))},
+        {"operation": "build slots/days: validated", **per_trip_us(trips, build_validated)},
+        {"operation": "build slots/days: trusted", **per_trip_us(trips, build_trusted)},
+        {"operation": "serialize validated trip", **per_trip_us([decode_trip(p) for p in encoded], TripPlan.model_dump_json)},
+        {"operation": "serialize expanded trip", **per_trip_us([stored.expand(table) for stored in compact], TripPlan.model_dump_json)},
+    ]
+    print_table("Per trip", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Latency of light requests while route searches and day packing run, with
+that CPU work on the event loop ("inline", as before), on a thread pool
+and on a process pool. Heavy load is auto reorders of long days through
+/optimize plus uncached trip plans; light load is GET / probes, whose
+p99 shows how long the loop was blocked. A last run with a small queue
+limit shows excess work being shed with 503s instead of queueing. Exits
+with status 1 if the thread or process pool lets the probe p99 exceed
+LIGHT_P99_LIMIT_MS, or if the small queue sheds nothing.
+
+Run from the api directory:
+    python -m benchmarks.bench_cpu_offload
+"""
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("ANTHROPIC_API_KEY", "bench")
+
+import httpx
+
+import main
+from services.cpu_executor import CPUExecutor
+from services.single_flight import SingleFlight
+from benchmarks.common import build_trip, summarize, print_table, report_checks
+
+HEAVY_CLIENTS = 8
+HEAVY_ROUNDS = 6
+STOPS_PER_DAY = 24
+ROUTE_BUDGET_MS = 40.0
+PROBE_INTERVAL_MS = 5.0
+SHED_QUEUE = 2
+
+# Probe p99 allowed with the CPU work off the loop: several times what a
+# 1-CPU host measures, far below the inline run's search-length stalls
+LIGHT_P99_LIMIT_MS = 50.0
+
+
+async def heavy_client(client: httpx.AsyncClient, index: int, statuses: list, samples: list):
+    session_id = f"heavy-{index}"
+    trip = build_trip(3, STOPS_PER_DAY, seed=index)
+    version = main.user_trips.set(session_id, trip)
+    main.record_trip(session_id, trip, version)
+    for round_number in range(HEAVY_ROUNDS):
+        start = time.perf_counter()
+        if round_number % 3 == 2:
+            # Distinct scopes so every plan is packed, not coalesced or cached
+            try:
+                await main.app_agents.trip_planner.plan_trip(
+                    "Plan a trip",
+                    {"destination": "San Francisco", "duration_days": 3 + index, "interests": ["food"]}
+                )
+                statuses.append(200)
+            except Exception as exc:
+                statuses.append(type(exc).__name__)
+        else:
+            response = await client.post("/optimize", json={
+                "session_id": session_id,
+                "action": "reorder",
+                "data": {"day_number": round_number % 3 + 1, "mode": "auto"}
+            })
+            statuses.append(response.status_code)
+        samples.append((time.perf_counter() - start) * 1000)
+
+
+async def probe(client: httpx.AsyncClient, done: asyncio.Event, samples: list):
+    """
+    A probe every PROBE_INTERVAL_MS, timed from when it was due rather than
+    from when the blocked loop got round to sending it
+    """
+    due = time.perf_counter()
+    while not done.is_set():
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        await client.get("/")
+        finished = time.perf_counter()
+        samples.append((finished - due) * 1000)
+        due = max(due + PROBE_INTERVAL_MS / 1000.0, finished)
+
+
+async def scenario(kind: str, max_queue: int = 64) -> dict:
+    executor = CPUExecutor(kind=kind, max_queue=max_queue)
+    executor.warm_up()
+    main.app_agents.optimizer.executor = executor
+    main.app_agents.trip_planner.executor = executor
+    main.app_agents.trip_planner.flights = SingleFlight(max_entries=0)
+
+    transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+    light, heavy, statuses = [], [], []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        done = asyncio.Event()
+        prober = asyncio.create_task(probe(client, done, light))
+        start = time.perf_counter()
+        await asyncio.gather(*(heavy_client(client, i, statuses, heavy) for i in range(HEAVY_CLIENTS)))
+        wall_ms = (time.perf_counter() - start) * 1000
+        done.set()
+        await prober
+    executor.shutdown()
+
+    light_stats = summarize(light)
+    return {
+        "executor": kind,
+        "max_queue": max_queue,
+        "heavy_ok": sum(1 for status in statuses if status == 200),
+        "shed_503": sum(1 for status in statuses if status in (503, "ExecutorOverloaded")),
+        "heavy_median_ms": summarize(heavy)["median_ms"],
+        "probes": len(light),
+        "light_median_ms": light_stats["median_ms"],
+        "light_p99_ms": light_stats["p99_ms"],
+        "light_max_ms": light_stats["max_ms"],
+        "wall_ms": round(wall_ms, 1)
+    }
+
+
+async def run():
+    main.catalog_registry.load_all()
+    main.app_agents.optimizer.route_time_budget_ms = ROUTE_BUDGET_MS
+    main.app_agents.trip_planner.cache = None
+
+    rows = [await scenario(kind) for kind in ("inline", "thread", "process")]
+    rows.append(await scenario("thread", max_queue=SHED_QUEUE))
+    for row in rows:
+        if row["max_queue"] == SHED_QUEUE:
+            row["passed"] = row["shed_503"] > 0
+        elif row["executor"] == "inline":
+            # The blocking baseline, not checked
+            row["passed"] = ""
+        else:
+            row["passed"] = row["heavy_ok"] == HEAVY_CLIENTS * HEAVY_ROUNDS and row["light_p99_ms"] <= LIGHT_P99_LIMIT_MS
+    print_table(
+        f"GET / probes while {HEAVY_CLIENTS} clients run auto reorders of {STOPS_PER_DAY}-stop days and trip plans "
+        f"({os.cpu_count()} CPUs, probe p99 limit {LIGHT_P99_LIMIT_MS:.0f} ms off the loop)",
+        rows
+    )
+    if not report_checks(rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    # Guarded so process pool workers can import this module
+    asyncio.run(run())
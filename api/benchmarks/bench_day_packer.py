@@ -0,0 +1,68 @@
+"""
+Day packing for 3 to 30 day trips over a 5k synthetic catalog, against
+the old "next four catalog entries per day" slicing.
+
+Run from the api directory:
+    python -m benchmarks.bench_day_packer
+"""
+import random
+import time
+
+from services.day_packer import DayPacker, expand_interests, score_attraction
+from services.travel_matrix import travel_matrix_engine
+from benchmarks.common import build_attraction, summarize, print_table
+
+CATALOG_SIZE = 5000
+TRIP_DAYS = [3, 7, 14, 30]
+RUNS = 20
+INTERESTS = ["food", "nature"]
+BUDGET_PER_DAY = 60.0
+
+
+def slicing_plan(attractions, num_days):
+    return [list(attractions[day_num * 4:(day_num + 1) * 4]) for day_num in range(num_days)]
+
+
+def main():
+    rng = random.Random(8)
+    attractions = [build_attraction(i, rng) for i in range(CATALOG_SIZE)]
+    interest_terms = expand_interests(INTERESTS)
+    packer = DayPacker()
+
+    rows = []
+    for num_days in TRIP_DAYS:
+        budget = BUDGET_PER_DAY * num_days
+        samples = []
+        plan = None
+        timeouts = 0
+        for _ in range(RUNS):
+            # Matrices are cached per attraction set; measure cold planning
+            travel_matrix_engine._cache.clear()
+            start = time.perf_counter()
+            plan = packer.pack(attractions, num_days, interests=INTERESTS, budget_usd=budget)
+            samples.append((time.perf_counter() - start) * 1000)
+            timeouts += plan.timed_out
+
+        sliced = slicing_plan(attractions, num_days)
+        sliced_score = sum(score_attraction(a, interest_terms) for day in sliced for a in day)
+        sliced_cost = sum(a.cost_usd for day in sliced for a in day)
+        rows.append({
+            "days": num_days,
+            **summarize(samples),
+            "timeouts": timeouts,
+            "stops": sum(len(day) for day in plan.days),
+            "empty_days": sum(1 for day in plan.days if not day),
+            "score": plan.score,
+            "slicing_score": round(sliced_score, 2),
+            "cost": plan.total_cost,
+            "slicing_cost": round(sliced_cost, 2),
+            "budget": budget,
+        })
+
+    print_table(
+        f"Packing {CATALOG_SIZE} attractions, interests {INTERESTS}, ${BUDGET_PER_DAY:.0f}/day", rows
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Local intent and preference extraction: field accuracy of the compiled
+extractor against the keyword checks it replaced on a labelled set of
+messages, then latency per message as the destination gazetteer grows
+to tens of thousands of aliases, next to scanning for every alias with
+substring checks. Exits with status 1 if the compiled extractor gets
+any labelled message wrong or its p99 exceeds P99_LIMIT_US at any
+gazetteer size.
+
+Run from the api directory:
+    python -m benchmarks.bench_intent_extractor
+"""
+import random
+import sys
+import time
+
+from services.intent_extractor import IntentExtractor
+from benchmarks.common import summarize, print_table, report_checks
+
+SEED = 11
+LOOKUPS = 5000
+GAZETTEER_SIZES = (0, 10000, 50000)
+
+# Lookups stay in tens of microseconds however many aliases there are;
+# scanning for each alias takes milliseconds at 10k destinations
+P99_LIMIT_US = 200.0
+
+# message, expected requires_planning, expected preferences (fields that must match)
+LABELLED = (
+    ("Plan a trip to San Francisco", True, {"destination": "San Francisco", "duration_days": 3}),
+    ("Plan a 5-day trip to SF with museums and hiking", True, {"destination": "San Francisco", "duration_days": 5, "interests": {"art", "nature"}}),
+    ("I want to visit sf for a couple of days by car", True, {"destination": "San Francisco", "duration_days": 2, "travel_mode": "drive"}),
+    ("weekend in frisco on a budget, walking only", True, {"destination": "San Francisco", "duration_days": 2, "budget": "budget", "travel_mode": "walk"}),
+    ("Two weeks in the Bay Area, $100 per day, love food and bars", True, {"destination": "San Francisco", "duration_days": 14, "budget": "$100 per day", "interests": {"food", "nightlife"}}),
+    ("3 nights in san fran, budget $1,200 total", True, {"destination": "San Francisco", "duration_days": 3, "budget": "$1200"}),
+    ("Itinerary for San Francisco, we have kids", True, {"destination": "San Francisco", "interests": {"family"}}),
+    ("Going to San Francisco for a week, cheap eats and markets", True, {"destination": "San Francisco", "duration_days": 7, "budget": "cheap", "interests": {"food"}}),
+    ("Can you plan four days in SF using public transport?", True, {"destination": "San Francisco", "duration_days": 4, "travel_mode": "transit"}),
+    ("Trip to San Francisco, 500 dollars, history and architecture", True, {"destination": "San Francisco", "budget": "$500", "interests": {"history", "culture"}}),
+    ("Hello there!", False, None),
+    ("Can you arrange a transfer from the airport?", False, None),
+    ("What's the weather like today?", False, None),
+    ("Thanks, that looks great", False, None),
+    ("Is the SFO airport far from downtown?", False, None),
+    ("Tell me something fun", False, None),
+    ("Plan a 5 day food trip", True, {"duration_days": 5, "interests": {"food"}}),
+    ("I love the Bay Area", False, {"destination": "San Francisco"}),
+    ("what can we do in sf", False, {"destination": "San Francisco"}),
+    ("Transform my itinerary please", True, None),
+)
+
+
+def legacy_rules(message: str):
+    """
+    The keyword checks ChatAgent used before the extractor
+    """
+    planning_keywords = ["plan", "trip", "itinerary", "visit", "travel to", "going to"]
+    requires_planning = any(keyword in message.lower() for keyword in planning_keywords)
+    preferences = None
+    if "san francisco" in message.lower() or "sf" in message.lower():
+        preferences = {"destination": "San Francisco", "interests": ["sightseeing", "food", "culture"], "duration_days": 3}
+    return requires_planning, preferences
+
+
+def field_matches(expected, actual) -> bool:
+    if expected is None:
+        return actual is None or "destination" not in actual
+    if actual is None:
+        return False
+    for field, value in expected.items():
+        got = actual.get(field)
+        if isinstance(value, set):
+            got = set(got or [])
+        if got != value:
+            return False
+    return True
+
+
+def accuracy(extract) -> dict:
+    planning = preferences = both = 0
+    for message, expected_planning, expected_preferences in LABELLED:
+        requires_planning, extracted = extract(message)
+        planning_ok = requires_planning == expected_planning
+        preferences_ok = field_matches(expected_preferences, extracted)
+        planning += planning_ok
+        preferences += preferences_ok
+        both += planning_ok and preferences_ok
+    total = len(LABELLED)
+    return {
+        "requires_planning": f"{planning}/{total}",
+        "preferences": f"{preferences}/{total}",
+        "fully_correct": f"{both}/{total}"
+    }
+
+
+def synthetic_destinations(count: int, rng: random.Random):
+    syllables = ["ka", "lo", "ve", "ri", "san", "tor", "mi", "na", "bel", "du", "qua", "zen", "por", "vik", "ost"]
+    destinations = {}
+    while len(destinations) < count:
+        name = " ".join(
+            "".join(rng.choice(syllables) for _ in range(rng.randint(2, 3)))
+            for _ in range(rng.randint(1, 3))
+        ).title()
+        destinations[name] = [name.lower().replace(" ", ""), f"{name.split()[0].lower()} city"]
+    return destinations
+
+
+def timed(extract, messages):
+    samples = []
+    for message in messages:
+        start = time.perf_counter()
+        extract(message)
+        samples.append((time.perf_counter() - start) * 1000)
+    return {key.replace("_ms", "_us"): round(value * 1000, 2) for key, value in summarize(samples).items()}
+
+
+def main():
+    extractor = IntentExtractor()
+
+    def compiled(message):
+        extraction = extractor.extract(message)
+        return extraction.requires_planning, extraction.preferences
+
+    total = len(LABELLED)
+    checks = [
+        {"extractor": "keyword checks", **accuracy(legacy_rules), "passed": ""},
+        {"extractor": "compiled gazetteer", **accuracy(compiled)}
+    ]
+    checks[-1]["passed"] = checks[-1]["fully_correct"] == f"{total}/{total}"
+    print_table(f"Accuracy on {total} labelled messages", checks)
+
+    rng = random.Random(SEED)
+    rows = []
+    for size in GAZETTEER_SIZES:
+        destinations = synthetic_destinations(size, rng)
+        extractor = IntentExtractor()
+        extractor.add_destinations(destinations)
+        start = time.perf_counter()
+        gazetteer = extractor.gazetteer()
+        build_ms = (time.perf_counter() - start) * 1000
+
+        names = list(destinations) or ["San Francisco"]
+        messages = [
+            rng.choice((
+                "Plan a {n}-day trip to {d} with museums and hiking, budget ${b}",
+                "weekend in {d} on a budget, walking only",
+                "Can you arrange a transfer from the airport in {d}?",
+                "Hello there! Any ideas for {n} days somewhere warm?",
+            )).format(d=rng.choice(names), n=rng.randint(2, 9), b=rng.randint(200, 2000))
+            for _ in range(LOOKUPS)
+        ]
+        found = sum(extractor.extract(message).preferences is not None for message in messages[:500])
+        rows.append({
+            "approach": "compiled gazetteer",
+            "phrases": len(gazetteer),
+            "build_ms": round(build_ms, 1),
+            "found_in_500": found,
+            **timed(extractor.extract, messages)
+        })
+        rows[-1]["passed"] = rows[-1]["p99_us"] <= P99_LIMIT_US
+
+        aliases = [alias.lower() for name, names_aliases in destinations.items() for alias in (name, *names_aliases)]
+        if aliases:
+            def substring_scan(message):
+                lowered = message.lower()
+                return [alias for alias in aliases if alias in lowered]
+            rows.append({
+                "approach": "substring scan",
+                "phrases": len(aliases),
+                "build_ms": 0.0,
+                "found_in_500": "",
+                **timed(substring_scan, messages[:200]),
+                "passed": ""
+            })
+
+    print_table(f"Latency per message as the destination gazetteer grows (p99 limit {P99_LIMIT_US:.0f} us)", rows)
+
+    if not report_checks(checks + rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
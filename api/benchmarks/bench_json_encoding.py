@@ -0,0 +1,93 @@
+"""
+Serialization work per trip update: the /optimize reply and its broadcast
+as they were (trip.dict() for the broadcast, stdlib json for the socket
+frames, FastAPI's jsonable_encoder for the HTTP reply) against encoding
+the trip once with pydantic-core and splicing those bytes into both, and
+the initial state a "full" client gets on connect with and without the
+per-version cache.
+
+Run from the api directory:
+    python -m benchmarks.bench_json_encoding
+"""
+from datetime import datetime, date, time as clock
+from enum import Enum
+import json
+import time
+import zlib
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from services.json_encoding import EncodedJSON, TripJSONCache, encode_json
+from benchmarks.common import build_trip, summarize, print_table
+
+ROUNDS = 200
+SHAPES = ((3, 4), (7, 6), (14, 8))
+
+
+def legacy_default(value):
+    if isinstance(value, (datetime, date, clock)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    raise TypeError(value.__class__.__name__)
+
+
+def legacy_encode(data) -> str:
+    return json.dumps(data, default=legacy_default, separators=(",", ":"))
+
+
+def legacy_update(trip):
+    # Broadcast to a JSON and a zlib client, then the HTTP reply
+    message = {"type": "trip_update", "trip_plan": trip.dict(), "changes": [], "session_id": "bench"}
+    text = legacy_encode(message)
+    zlib.compress(text.encode("utf-8"))
+    return json.dumps(jsonable_encoder({"success": True, "trip_plan": trip, "changes": [], "version": 2})).encode("utf-8")
+
+
+def encoded_update(trip):
+    trip_json = EncodedJSON.of(trip)
+    message = EncodedJSON.of({"type": "trip_update", "trip_plan": trip_json, "changes": [], "session_id": "bench"})
+    message.text
+    message.compressed
+    return encode_json({"success": True, "trip_plan": trip_json, "changes": [], "version": 2})
+
+
+def timed(operation, trip):
+    samples = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        operation(trip)
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def main():
+    rows = []
+    for days, slots in SHAPES:
+        trip = build_trip(days, slots)
+        shape = f"{days}d x {slots}"
+        assert json.loads(legacy_update(trip)) == json.loads(encoded_update(trip))
+        rows.append({"trip": shape, "path": "dict + json + jsonable_encoder", **timed(legacy_update, trip)})
+        rows.append({"trip": shape, "path": "encode once, splice", **timed(encoded_update, trip)})
+    print_table("Trip update: broadcast (JSON and zlib clients) plus HTTP reply", rows)
+
+    rows = []
+    for days, slots in SHAPES:
+        trip = build_trip(days, slots)
+        cache = TripJSONCache()
+        cache.encode("bench", trip, 1)
+        shape = f"{days}d x {slots}"
+        rows.append({"trip": shape, "path": "trip.dict() + json", **timed(
+            lambda t: legacy_encode({"type": "initial_state", "trip_plan": t.dict()}), trip
+        )})
+        rows.append({"trip": shape, "path": "cached version", **timed(
+            lambda t: encode_json({"type": "initial_state", "trip_plan": cache.get("bench", t.id, 1)}), trip
+        )})
+    print_table("Initial state for a connecting client", rows)
+
+
+if __name__ == "__main__":
+    main()
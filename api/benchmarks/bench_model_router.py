@@ -0,0 +1,160 @@
+"""
+Model routing with local stub providers: cost, latency and escalation
+rate of cheap-first intent extraction against sending every message to
+the large models, then reply first-token latency when one provider has
+a slow tail or fails, with and without hedging. Exits with status 1 if
+cheap-first routing costs more than MAX_COST_RATIO of always-large, if
+hedged replies' p99 exceeds HEDGED_P99_LIMIT_MS, or if any reply fails.
+
+Run from the api directory:
+    python -m benchmarks.bench_model_router
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("ANTHROPIC_API_KEY", "bench")
+
+from agents.chat_agent import ChatAgent
+from services.model_router import ModelRouter, ModelTier, StubProvider
+from benchmarks.common import summarize, print_table, report_checks
+
+REQUESTS = 200
+SEED = 7
+
+# Cheap-first intent extraction must cost at most this share of always-large
+MAX_COST_RATIO = 0.33
+
+# p99 first token with a 4 s slow tail once hedging kicks in after 900 ms:
+# the backup's ~700 ms on top of the hedge delay, with room to spare
+HEDGED_P99_LIMIT_MS = 2000.0
+
+MESSAGES = (
+    # Rules are sure: known destination, or small talk
+    ("Plan a trip to San Francisco", 0.5),
+    ("Hello there!", 0.2),
+    # Rules can't tell: the small model can
+    ("Plan a trip to Tokyo", 0.2),
+    # Too vague for the small model as well
+    ("Help me plan a getaway somewhere warm", 0.1),
+)
+
+
+def intent_reply(messages):
+    message = messages[-1][1].lower()
+    if "tokyo" in message:
+        answer = {"requires_planning": True, "preferences": {"destination": "Tokyo", "duration_days": 3}, "confidence": 0.9}
+    else:
+        answer = {"requires_planning": True, "preferences": None, "confidence": 0.6}
+    return json.dumps(answer)
+
+
+def large_reply(messages):
+    if messages and messages[0][1].startswith("Decide whether"):
+        return json.dumps({"requires_planning": True, "preferences": {"destination": "Lisbon"}, "confidence": 0.9})
+    return "Here is a day-by-day plan with the best neighbourhoods, food and sights for your trip. " * 3
+
+
+def providers(slow_rate=0.0, fail_rate=0.0, seed=SEED):
+    return {
+        ModelTier.SMALL: [
+            StubProvider("openai", "small-a", intent_reply, latency_ms=120, input_cost_per_1k=0.0005, output_cost_per_1k=0.0015, seed=seed),
+            StubProvider("anthropic", "small-b", intent_reply, latency_ms=150, input_cost_per_1k=0.00025, output_cost_per_1k=0.00125, seed=seed + 1),
+        ],
+        ModelTier.LARGE: [
+            StubProvider(
+                "openai", "large-a", large_reply, latency_ms=600, tokens_per_second=200, slow_rate=slow_rate, slow_ms=4000,
+                fail_rate=fail_rate, input_cost_per_1k=0.01, output_cost_per_1k=0.03, seed=seed + 2
+            ),
+            StubProvider(
+                "anthropic", "large-b", large_reply, latency_ms=700, tokens_per_second=200,
+                input_cost_per_1k=0.015, output_cost_per_1k=0.075, seed=seed + 3
+            ),
+        ],
+    }
+
+
+def message_mix(count: int):
+    rng = random.Random(SEED)
+    texts, weights = zip(*MESSAGES)
+    return rng.choices(texts, weights=weights, k=count)
+
+
+async def run_intents(router: ModelRouter, messages):
+    agent = ChatAgent(cache=None, router=router)
+    samples = []
+
+    async def one(message):
+        start = time.perf_counter()
+        await router.route_intent(message, agent.rule_intent)
+        samples.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(one(message) for message in messages))
+    stats = router.stats()
+    cost = sum(route["cost_usd"] for route in stats["routes"].values())
+    return {
+        **summarize(samples),
+        "escalation_rate": stats["escalation_rate"],
+        "routes": stats["intent_routes"],
+        "cost_per_1k_requests_usd": round(cost / len(messages) * 1000, 4)
+    }
+
+
+async def run_replies(router: ModelRouter, count: int):
+    samples = []
+
+    async def one():
+        start = time.perf_counter()
+        first = None
+        async for _ in router.stream("reply", ModelTier.LARGE, [("system", "You plan trips."), ("human", "Plan a trip")]):
+            if first is None:
+                first = (time.perf_counter() - start) * 1000
+        samples.append(first)
+
+    await asyncio.gather(*(one() for _ in range(count)), return_exceptions=True)
+    route = router.stats()["routes"]["reply:large"]
+    return {
+        **summarize(samples),
+        "failed": count - len(samples),
+        "hedges": route["hedges"],
+        "answered_by_backup": route["hedge_wins"]
+    }
+
+
+async def main():
+    messages = message_mix(REQUESTS)
+    rows = [
+        {"policy": "cheap first", **(await run_intents(ModelRouter(providers()), messages))},
+        # Skip the rules and the small tier: every message goes to the large models
+        {"policy": "always large", **(await run_intents(
+            ModelRouter({ModelTier.LARGE: providers()[ModelTier.LARGE]}, confidence_threshold=1.01), messages
+        ))},
+    ]
+    cheap, large = rows
+    cheap["passed"] = cheap["cost_per_1k_requests_usd"] <= MAX_COST_RATIO * large["cost_per_1k_requests_usd"]
+    large["passed"] = ""
+    print_table(f"Intent extraction for {REQUESTS} messages (small tier ~120 ms, large ~600 ms)", rows)
+    checks = rows
+
+    rows = []
+    for scenario, slow_rate, fail_rate in (("10% slow primary (4 s)", 0.1, 0.0), ("20% failing primary", 0.0, 0.2)):
+        for label, hedge_after_ms in (("no hedge", 1e9), ("hedge after 900 ms", 900.0)):
+            router = ModelRouter(providers(slow_rate=slow_rate, fail_rate=fail_rate), hedge_after_ms=hedge_after_ms)
+            row = {"scenario": scenario, "policy": label, **(await run_replies(router, REQUESTS))}
+            row["passed"] = row["failed"] == 0
+            if hedge_after_ms < 1e9:
+                row["passed"] = row["passed"] and row["p99_ms"] <= HEDGED_P99_LIMIT_MS
+            rows.append(row)
+    print_table(f"Large-tier reply, time to first token over {REQUESTS} requests (hedged p99 limit {HEDGED_P99_LIMIT_MS:.0f} ms)", rows)
+    checks += rows
+
+    if not report_checks(checks):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,334 @@
+"""
+Several uvicorn workers sharing sessions through the Redis session store
+and bus, with services.mini_redis standing in for Redis. Nothing is
+sticky: every request and WebSocket goes to a randomly chosen worker.
+
+First it checks correctness (and exits with 1 if anything fails):
+- edits made through any worker reach delta and full WebSocket clients
+  on every worker, every version, in order
+- concurrent removals through all workers lose no update and never
+  share a version
+- an edit against a version another worker replaced gets a 409
+Then it measures /optimize throughput with 1, 2, 4... workers, next to a
+single worker with the in-memory store and bus.
+
+Run from the api directory:
+    python -m benchmarks.bench_multi_worker [--workers 1,2,4] [--duration 10] [--json results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("ANTHROPIC_API_KEY", "bench")
+
+import httpx
+import websockets
+
+from benchmarks.common import summarize, print_table, write_results, report_checks
+from services.resp import RespClient
+
+SEED = 7
+MESSAGE = "Plan a 3 day trip to San Francisco for food and culture"
+CHECK_WORKERS = 3
+CHECK_EDITS = 20
+SESSIONS = 40
+CLIENTS = 32
+STARTUP_TIMEOUT_SECONDS = 30
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def wait_for_port(port: int, process: subprocess.Popen):
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args} exited with {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Nothing listening on {port}")
+
+
+class Cluster:
+    """
+    Worker processes, each on its own port so the benchmark, not a
+    balancer, decides where each request goes
+    """
+
+    def __init__(self, workers: int, env: Dict[str, str]):
+        self.ports = [free_port() for _ in range(workers)]
+        self.processes = []
+        for port in self.ports:
+            self.processes.append(subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                env={**os.environ, **env},
+                stdout=subprocess.DEVNULL
+            ))
+        for port, process in zip(self.ports, self.processes):
+            wait_for_port(port, process)
+        self.urls = [f"http://127.0.0.1:{port}" for port in self.ports]
+
+    def close(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.wait()
+
+
+async def plan(client: httpx.AsyncClient, url: str, session_id: str) -> Dict[str, Any]:
+    response = await client.post(f"{url}/chat", json={"message": MESSAGE, "session_id": session_id})
+    response.raise_for_status()
+    return response.json()
+
+
+async def optimize(client: httpx.AsyncClient, url: str, body: Dict[str, Any], retries: int = 5) -> httpx.Response:
+    """
+    POST /optimize, retrying while the trip keeps changing under it
+    """
+    for _ in range(retries):
+        response = await client.post(f"{url}/optimize", json=body)
+        if response.status_code != 409 or "version" in body:
+            return response
+    return response
+
+
+class Listener:
+    """
+    A WebSocket client recording every trip version it is sent
+    """
+
+    def __init__(self, url: str, session_id: str, protocol: str):
+        self.url = f"{url.replace('http', 'ws')}/ws/{session_id}?protocol={protocol}"
+        self.protocol = protocol
+        self.messages: List[Dict[str, Any]] = []
+        self.socket = None
+        self.task = None
+
+    async def start(self):
+        self.socket = await websockets.connect(self.url, max_size=None)
+        self.task = asyncio.create_task(self._read())
+
+    async def _read(self):
+        async for data in self.socket:
+            self.messages.append(json.loads(data))
+
+    async def close(self):
+        await self.socket.close()
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+
+    def versions(self) -> List[Any]:
+        """
+        (base_version, version) of each snapshot and patch a delta client got
+        """
+        return [
+            (message.get("base_version"), message["version"])
+            for message in self.messages if message.get("type") in ("snapshot", "patch")
+        ]
+
+    def trips(self) -> List[Any]:
+        return [message["trip_plan"] for message in self.messages if message.get("type") in ("initial_state", "trip_update")]
+
+
+async def check_fan_out(client: httpx.AsyncClient, urls: List[str], rng: random.Random) -> Dict[str, Any]:
+    session_id = "check-fan-out"
+    reply = await plan(client, urls[0], session_id)
+    listeners = [Listener(url, session_id, protocol) for url in urls for protocol in ("delta", "full")]
+    await asyncio.gather(*(listener.start() for listener in listeners))
+
+    day = reply["trip_plan"]["days"][0]
+    ids = [slot["attraction"]["id"] for slot in day["time_slots"]]
+    versions = [reply["version"]]
+    last_trip = reply["trip_plan"]
+    for _ in range(CHECK_EDITS):
+        response = await optimize(client, rng.choice(urls), {
+            "session_id": session_id, "action": "reorder", "data": {"day_number": 1, "new_order": rng.sample(ids, len(ids))}
+        })
+        body = response.json()
+        versions.append(body["version"])
+        last_trip = body["trip_plan"]
+    await asyncio.sleep(0.5)
+    await asyncio.gather(*(listener.close() for listener in listeners))
+
+    expected = list(zip([None] + versions[:-1], versions))
+    delta_ok = all(
+        listener.versions() == [(None, versions[0])] + expected[1:]
+        for listener in listeners if listener.protocol == "delta"
+    )
+    full_ok = all(
+        len(listener.trips()) == CHECK_EDITS + 1 and listener.trips()[-1] == last_trip
+        for listener in listeners if listener.protocol == "full"
+    )
+    return {
+        "name": "edits reach clients on every worker",
+        "passed": delta_ok and full_ok and versions == list(range(versions[0], versions[0] + len(versions))),
+        "detail": f"{len(listeners)} sockets, versions {versions[0]}..{versions[-1]}"
+    }
+
+
+async def check_lost_updates(client: httpx.AsyncClient, urls: List[str], rng: random.Random) -> Dict[str, Any]:
+    session_id = "check-lost-updates"
+    reply = await plan(client, urls[0], session_id)
+    removals = [
+        {"session_id": session_id, "action": "remove", "data": {"day_number": day["day_number"], "attraction_id": slot["attraction"]["id"]}}
+        for day in reply["trip_plan"]["days"] for slot in day["time_slots"]
+    ]
+    responses = await asyncio.gather(*(optimize(client, rng.choice(urls), removal) for removal in removals))
+    bodies = [response.json() for response in responses]
+    succeeded = sum(1 for response in responses if response.status_code == 200)
+    versions = [body["version"] for body in bodies if "version" in body]
+    final = bodies[versions.index(max(versions))]["trip_plan"]
+    left = sum(len(day["time_slots"]) for day in final["days"])
+    return {
+        "name": "concurrent removals on every worker",
+        "passed": succeeded == len(removals) and left == 0 and len(set(versions)) == len(versions),
+        "detail": f"{succeeded}/{len(removals)} succeeded, {left} left, {len(set(versions))} distinct versions"
+    }
+
+
+async def check_stale_version(client: httpx.AsyncClient, urls: List[str]) -> Dict[str, Any]:
+    session_id = "check-stale-version"
+    reply = await plan(client, urls[0], session_id)
+    slots = reply["trip_plan"]["days"][0]["time_slots"]
+    edits = [
+        {"session_id": session_id, "action": "remove", "version": reply["version"],
+         "data": {"day_number": 1, "attraction_id": slot["attraction"]["id"]}}
+        for slot in slots[:2]
+    ]
+    first = await optimize(client, urls[0], edits[0])
+    second = await optimize(client, urls[-1], edits[1])
+    return {
+        "name": "edit against a replaced version",
+        "passed": first.status_code == 200 and second.status_code == 409,
+        "detail": f"first {first.status_code}, second {second.status_code}"
+    }
+
+
+async def run_checks(env: Dict[str, str]) -> List[Dict[str, Any]]:
+    cluster = Cluster(CHECK_WORKERS, env)
+    try:
+        rng = random.Random(SEED)
+        async with httpx.AsyncClient(timeout=30) as client:
+            return [
+                await check_fan_out(client, cluster.urls, rng),
+                await check_lost_updates(client, cluster.urls, rng),
+                await check_stale_version(client, cluster.urls),
+            ]
+    finally:
+        cluster.close()
+
+
+async def throughput(name: str, workers: int, env: Dict[str, str], duration: float) -> Dict[str, Any]:
+    cluster = Cluster(workers, env)
+    rng = random.Random(SEED)
+    try:
+        limits = httpx.Limits(max_connections=CLIENTS, max_keepalive_connections=CLIENTS)
+        async with httpx.AsyncClient(timeout=30, limits=limits) as client:
+            replies = await asyncio.gather(*(
+                plan(client, cluster.urls[i % workers], f"throughput-{i}") for i in range(SESSIONS)
+            ))
+            days = {
+                f"throughput-{i}": [[slot["attraction"]["id"] for slot in day["time_slots"]] for day in reply["trip_plan"]["days"]]
+                for i, reply in enumerate(replies)
+            }
+            # One delta client per session, on a random worker, so every edit is broadcast
+            listeners = [Listener(rng.choice(cluster.urls), session_id, "delta") for session_id in days]
+            await asyncio.gather(*(listener.start() for listener in listeners))
+
+            samples: List[float] = []
+            statuses: Dict[int, int] = {}
+            deadline = time.perf_counter() + duration
+
+            async def worker_client(seed: int):
+                client_rng = random.Random(seed)
+                while time.perf_counter() < deadline:
+                    session_id = client_rng.choice(list(days))
+                    day_number = client_rng.randrange(len(days[session_id]))
+                    ids = days[session_id][day_number]
+                    data: Dict[str, Any] = {"day_number": day_number + 1}
+                    if client_rng.random() < 0.7:
+                        data["new_order"] = client_rng.sample(ids, len(ids))
+                    else:
+                        data["mode"] = "auto"
+                    start = time.perf_counter()
+                    response = await client.post(
+                        f"{client_rng.choice(cluster.urls)}/optimize",
+                        json={"session_id": session_id, "action": "reorder", "data": data}
+                    )
+                    samples.append((time.perf_counter() - start) * 1000)
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker_client(SEED + i) for i in range(CLIENTS)))
+            elapsed = time.perf_counter() - started
+            await asyncio.gather(*(listener.close() for listener in listeners))
+    finally:
+        cluster.close()
+    return {
+        "name": f"optimize.{name}",
+        "workers": workers,
+        "requests": len(samples),
+        "per_second": round(len(samples) / elapsed, 1),
+        **summarize(samples),
+        "statuses": statuses
+    }
+
+
+async def run(args):
+    redis_port = free_port()
+    redis = subprocess.Popen(
+        [sys.executable, "-m", "services.mini_redis", "--port", str(redis_port)],
+        stdout=subprocess.DEVNULL
+    )
+    try:
+        wait_for_port(redis_port, redis)
+        redis_url = f"redis://127.0.0.1:{redis_port}/0"
+        shared = {"SESSION_STORE": "redis", "SESSION_BUS": "redis", "REDIS_URL": redis_url}
+
+        checks = await run_checks(shared)
+        print_table(f"Correctness with {CHECK_WORKERS} workers, requests spread at random", checks)
+
+        rows = [await throughput("memory", 1, {"SESSION_STORE": "memory", "SESSION_BUS": "local"}, args.duration)]
+        for workers in args.workers:
+            RespClient(redis_url).execute("FLUSHDB")
+            rows.append(await throughput(f"redis.{workers}w", workers, shared, args.duration))
+        print_table(
+            f"POST /optimize reorders, {CLIENTS} concurrent clients over {SESSIONS} sessions, {os.cpu_count()} CPUs",
+            [{key: value for key, value in row.items() if key != "statuses"} for row in rows]
+        )
+        for row in rows:
+            print(f"{row['name']} statuses: {row['statuses']}")
+    finally:
+        redis.terminate()
+        redis.wait()
+
+    if args.json:
+        write_results(args.json, "multi_worker", checks + rows, {"workers": args.workers, "duration": args.duration})
+    if not report_checks(checks):
+        sys.exit(1)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--workers", type=lambda value: [int(count) for count in value.split(",")], default=[1, 2, 4])
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per setup")
+    parser.add_argument("--json", help="Write results to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
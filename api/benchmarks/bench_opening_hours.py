@@ -0,0 +1,182 @@
+"""
+Opening-hours checks against the parsed weekly index: thousands of
+candidate (attraction, weekday, minute) slots per plan answered by
+WeeklyHours against re-parsing the attraction's opening_hours for every
+check, and discover-style insertion checks on a long day against
+retiming a copy of the day for each candidate position. Exits with
+status 1 if the index and the reference implementation disagree on any
+answer.
+
+Run from the api directory:
+    python -m benchmarks.bench_opening_hours
+"""
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("ANTHROPIC_API_KEY", "bench")
+
+from models import TimeSlot
+from agents.optimizer import ItineraryOptimizer
+from services.opening_hours import WEEKDAYS, weekly_hours, _parse
+from services.timeline import DayTimeline, minute_to_time
+from benchmarks.common import build_trip, build_attraction, summarize, print_table, report_checks
+
+ATTRACTIONS = 400
+PLANS = 20
+CANDIDATES_PER_PLAN = 5000
+INSERTION_SLOTS = 32
+INSERTION_CANDIDATES = 40
+
+HOURS_PATTERNS = [
+    "09:00-17:00",
+    "10:00-18:00",
+    "11:00-14:30, 17:30-22:00",
+    "18:00-02:00",
+    "07:00-11:00; 12:00-16:00; 18:00-21:00",
+    "closed",
+    "24 hours"
+]
+
+
+def random_hours(rng: random.Random):
+    """
+    Hours as catalogs carry them: mostly one pattern, some days different
+    or closed, sometimes a day missing
+    """
+    usual = rng.choice(HOURS_PATTERNS[:5])
+    hours = {}
+    for day in WEEKDAYS:
+        roll = rng.random()
+        if roll < 0.1:
+            continue
+        hours[day.capitalize() if rng.random() < 0.5 else day] = rng.choice(HOURS_PATTERNS) if roll < 0.3 else usual
+    return hours
+
+
+def reparsed_earliest_start(attraction, weekday, minute):
+    # Without the index every check parses the attraction's hours again
+    hours = _parse.__wrapped__(tuple(sorted(attraction.opening_hours.items())))
+    return hours.earliest_start(weekday, minute, attraction.duration_minutes)
+
+
+def reparsed_is_open(attraction, weekday, minute):
+    hours = _parse.__wrapped__(tuple(sorted(attraction.opening_hours.items())))
+    return hours.is_open(weekday, minute)
+
+
+def indexed_earliest_start(attraction, weekday, minute):
+    return weekly_hours(attraction).earliest_start(weekday, minute, attraction.duration_minutes)
+
+
+def indexed_is_open(attraction, weekday, minute):
+    return weekly_hours(attraction).is_open(weekday, minute)
+
+
+def bench_candidates(rows):
+    rng = random.Random(11)
+    attractions = []
+    for index in range(ATTRACTIONS):
+        attraction = build_attraction(index, rng)
+        attraction.opening_hours = random_hours(rng)
+        attractions.append(attraction)
+    plans = [
+        [(rng.choice(attractions), rng.randrange(7), rng.randrange(6 * 60, 26 * 60)) for _ in range(CANDIDATES_PER_PLAN)]
+        for _ in range(PLANS)
+    ]
+
+    for query, reparsed, indexed in (
+        ("is_open", reparsed_is_open, indexed_is_open),
+        ("earliest_start", reparsed_earliest_start, indexed_earliest_start)
+    ):
+        answers = {}
+        for name, check in (("reparse", reparsed), ("index", indexed)):
+            samples = []
+            results = []
+            for candidates in plans:
+                start = time.perf_counter()
+                results = [check(attraction, weekday, minute) for attraction, weekday, minute in candidates]
+                samples.append((time.perf_counter() - start) * 1000)
+            answers[name] = results
+            rows.append({"query": query, "impl": name, "checks_per_plan": CANDIDATES_PER_PLAN, **summarize(samples)})
+        rows[-1]["passed"] = answers["reparse"] == answers["index"]
+        rows[-2]["passed"] = ""
+
+
+def copy_fits(optimizer, day, position, attraction):
+    # Without insertion_fits: retime a copy with the slot inserted, then check every slot
+    copied = day.model_copy(update={"time_slots": list(day.time_slots)})
+    timeline = DayTimeline.of(copied, source=day)
+    start = minute_to_time(timeline.start_minute)
+    timeline.insert(position, TimeSlot(start_time=start, end_time=start, attraction=attraction), optimizer._leg_minutes)
+    before = DayTimeline.of(day)
+    was_open = {
+        slot.attraction.id: before._visit(slot.attraction, end - slot.attraction.duration_minutes)[1]
+        for slot, end in zip(day.time_slots, before.ends)
+    }
+    for slot, end in zip(copied.time_slots, timeline.ends):
+        start_minute = end - slot.attraction.duration_minutes
+        is_open = timeline._visit(slot.attraction, start_minute) == (start_minute, True)
+        if not is_open and was_open.get(slot.attraction.id, True):
+            return False
+    return True
+
+
+def bench_insertions(rows):
+    optimizer = ItineraryOptimizer()
+    rng = random.Random(5)
+    trip = build_trip(1, INSERTION_SLOTS, seed=5)
+    day = trip.days[0]
+    for slot in day.time_slots:
+        slot.attraction.opening_hours = random_hours(rng)
+        slot.attraction._weekly_hours = None
+    day._timeline = None
+    timeline = DayTimeline.of(day)
+    candidates = []
+    for index in range(INSERTION_CANDIDATES):
+        attraction = build_attraction(10 ** 6 + index, rng)
+        attraction.opening_hours = random_hours(rng)
+        candidates.append(attraction)
+    checks = INSERTION_CANDIDATES * (INSERTION_SLOTS + 1)
+
+    answers = {}
+    for name, fits in (
+        ("retime_copy", lambda position, attraction: copy_fits(optimizer, day, position, attraction)),
+        ("insertion_fits", lambda position, attraction: timeline.insertion_fits(position, attraction, optimizer._leg_minutes))
+    ):
+        samples = []
+        results = []
+        for _ in range(5):
+            start = time.perf_counter()
+            results = [
+                fits(position, attraction)
+                for attraction in candidates
+                for position in range(INSERTION_SLOTS + 1)
+            ]
+            samples.append((time.perf_counter() - start) * 1000)
+        answers[name] = results
+        rows.append({"impl": name, "checks_per_plan": checks, "fitting": sum(results), **summarize(samples)})
+    rows[-1]["passed"] = answers["retime_copy"] == answers["insertion_fits"]
+    rows[-2]["passed"] = ""
+
+
+def main():
+    rows = []
+    bench_candidates(rows)
+    print_table(f"Candidate slot checks, {ATTRACTIONS} attractions (ms per plan)", rows)
+
+    checks = rows
+
+    rows = []
+    bench_insertions(rows)
+    print_table(f"Discover insertion checks, {INSERTION_SLOTS}-slot day (ms per plan)", rows)
+    checks += rows
+
+    if not report_checks(checks):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
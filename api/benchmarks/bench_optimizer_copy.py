@@ -0,0 +1,69 @@
+"""
+Cost of an /optimize "remove" with the old full deepcopy against the
+copy-on-write path that only copies the touched day.
+
+Run from the api directory:
+    python -m benchmarks.bench_optimizer_copy
+"""
+import asyncio
+import copy
+import time
+
+from agents.optimizer import ItineraryOptimizer
+from benchmarks.common import build_trip, summarize, print_table, full_recalculate_day_timings
+
+TRIP_DAYS = [1, 7, 30]
+SLOTS_PER_DAY = [4, 8, 12]
+ROUNDS = 200
+
+
+async def legacy_remove(optimizer: ItineraryOptimizer, trip, data):
+    # Pre-change behaviour: deep-copy the whole trip, then mutate the copy
+    copied = copy.deepcopy(trip)
+    day = copied.days[data["day_number"] - 1]
+    day.time_slots = [
+        slot for slot in day.time_slots
+        if slot.attraction.id != data["attraction_id"]
+    ]
+    full_recalculate_day_timings(optimizer, day)
+    day.total_cost = sum(slot.attraction.cost_usd for slot in day.time_slots)
+    copied.total_cost = sum(d.total_cost for d in copied.days)
+    return copied
+
+
+async def cow_remove(optimizer: ItineraryOptimizer, trip, data):
+    return await optimizer.optimize(trip, "remove", data)
+
+
+async def measure(runner, optimizer, trip, data):
+    samples = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        await runner(optimizer, trip, data)
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+async def main():
+    optimizer = ItineraryOptimizer()
+    rows = []
+    for num_days in TRIP_DAYS:
+        for slots in SLOTS_PER_DAY:
+            trip = build_trip(num_days, slots)
+            middle = trip.days[num_days // 2]
+            data = {
+                "day_number": middle.day_number,
+                "attraction_id": middle.time_slots[slots // 2].attraction.id
+            }
+            for name, runner in (("deepcopy", legacy_remove), ("copy-on-write", cow_remove)):
+                rows.append({
+                    "impl": name,
+                    "days": num_days,
+                    "slots_per_day": slots,
+                    **(await measure(runner, optimizer, trip, data))
+                })
+    print_table("ItineraryOptimizer remove action", rows)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+"""
+Bursts of duplicate plan requests, as when many sessions ask for the same
+destination at once: latency, builds and wall time per burst with every
+request planned on its own, with concurrent identical requests coalesced
+onto one build, and with finished plans also kept in the result cache.
+The planner waits as long as an LLM planning call would before packing.
+
+Run from the api directory:
+    python -m benchmarks.bench_plan_coalescing
+"""
+import asyncio
+import os
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("ANTHROPIC_API_KEY", "bench")
+
+from agents.trip_planner import TripPlannerAgent
+from services.single_flight import SingleFlight
+from services.cpu_executor import CPUExecutor
+from benchmarks.common import summarize, print_table
+
+BURSTS = 5
+BURST_SIZE = 200
+PLANNING_DELAY_MS = 300
+
+# Equivalent spellings of four distinct requests
+REQUESTS = (
+    {"destination": "San Francisco", "duration_days": 3, "interests": ["food", "culture"]},
+    {"destination": "sf", "duration_days": 3, "interests": ["culture", "food"]},
+    {"destination": "San Francisco", "duration_days": 5, "interests": ["nature"], "travel_mode": "walk"},
+    {"destination": "San Francisco", "duration_days": 7, "interests": ["art", "history"], "budget": "$150 per day"},
+    {"destination": "San Francisco", "duration_days": 2, "interests": ["nightlife"], "budget": "cheap"},
+)
+
+
+class Uncoalesced(SingleFlight):
+    """
+    Every request builds its own plan
+    """
+
+    async def stream(self, key, produce):
+        async for item in produce():
+            yield item
+
+
+class SlowPlanner(TripPlannerAgent):
+    """
+    Planner whose builds first wait as long as an LLM planning call would
+    """
+
+    def __init__(self, flights):
+        # Room for every build of a burst: this measures coalescing, not shedding
+        super().__init__(cache=None, flights=flights, executor=CPUExecutor(max_queue=BURST_SIZE))
+        self.builds = 0
+
+    async def _build_plan(self, *args):
+        self.builds += 1
+        await asyncio.sleep(PLANNING_DELAY_MS / 1000.0)
+        async for item in super()._build_plan(*args):
+            yield item
+
+
+async def run(planner: SlowPlanner) -> dict:
+    samples = []
+    walls = []
+    trip_ids = set()
+
+    async def one(preferences):
+        start = time.perf_counter()
+        trip = await planner.plan_trip("Plan a trip", preferences)
+        samples.append((time.perf_counter() - start) * 1000)
+        trip_ids.add(trip.id)
+        return trip
+
+    for _ in range(BURSTS):
+        start = time.perf_counter()
+        trips = await asyncio.gather(*(one(REQUESTS[i % len(REQUESTS)]) for i in range(BURST_SIZE)))
+        walls.append((time.perf_counter() - start) * 1000)
+        # Coalesced sessions must not share days they may go on to edit
+        assert len({id(day) for trip in trips for day in trip.days}) == sum(len(trip.days) for trip in trips)
+
+    return {
+        **summarize(samples),
+        "burst_wall_ms": round(sum(walls) / len(walls), 1),
+        "builds": planner.builds,
+        "distinct_trip_ids": len(trip_ids)
+    }
+
+
+async def main():
+    rows = [
+        {"planner": "each request", **(await run(SlowPlanner(Uncoalesced())))},
+        {"planner": "coalesced", **(await run(SlowPlanner(SingleFlight(max_entries=0))))},
+        {"planner": "coalesced + cache", **(await run(SlowPlanner(SingleFlight())))},
+    ]
+    print_table(
+        f"{BURSTS} bursts of {BURST_SIZE} requests over {len(REQUESTS)} spellings of 4 plans "
+        f"(planning call {PLANNING_DELAY_MS} ms)",
+        rows
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
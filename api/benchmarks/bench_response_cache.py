@@ -0,0 +1,159 @@
+"""
+Response cache: hit rates on reworded prompts at several similarity
+thresholds (and how often a prompt that needs a different answer is hit
+by mistake), lookup latency per tier with a full cache, reload time for
+the SQLite cache, and streamed chat latency with a fake LLM with the
+cache cold and warm.
+
+Run from the api directory:
+    python -m benchmarks.bench_response_cache
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("ANTHROPIC_API_KEY", "bench")
+
+from agents.chat_agent import ChatAgent
+from services.llm_stream import FakeLLM
+from services.response_cache import ResponseCache
+from benchmarks.common import summarize, print_table
+
+MODEL = "gpt-4-turbo-preview"
+ENTRIES = 10000
+LOOKUPS = 2000
+THRESHOLDS = (0.85, 0.88, 0.9, 0.92, 0.95)
+FIRST_TOKEN_MS = 300
+TOKENS_PER_SECOND = 50
+
+BASE_PROMPTS = (
+    "Plan a trip to San Francisco",
+    "What should I see in San Francisco",
+    "Find me good restaurants near the Ferry Building",
+    "Which museums are open on Monday",
+)
+
+# Same answer as the base prompt
+REWORDINGS = (
+    "plan a trip to san francisco!",
+    "Please plan a trip to San Francisco",
+    "Plan me a trip to San Francisco",
+    "Can you plan a trip to San Francisco?",
+    "what should i see in san francisco?",
+    "So, what should I see in San Francisco",
+    "Find me some good restaurants near the Ferry Building",
+    "Find good restaurants near the Ferry Building please",
+    "which museums are open on monday??",
+    "Which museums are open on Mondays",
+)
+
+# Need a different answer than the closest base prompt
+DIFFERENT = (
+    "Plan a trip to Seattle",
+    "Cancel my trip to San Francisco",
+    "Plan a trip from San Francisco",
+    "Find me good bars near the Ferry Building",
+    "Which museums are open on Sunday",
+    "Which parks are open on Monday",
+)
+
+
+def threshold_rows():
+    rows = []
+    for threshold in THRESHOLDS:
+        cache = ResponseCache(similarity_threshold=threshold)
+        for prompt in BASE_PROMPTS:
+            cache.put(prompt, MODEL, {"text": prompt})
+        hits = sum(cache.get(prompt, MODEL)[0] is not None for prompt in REWORDINGS)
+        false_hits = sum(cache.get(prompt, MODEL)[0] is not None for prompt in DIFFERENT)
+        rows.append({
+            "threshold": threshold,
+            "reworded_hit_rate": round(hits / len(REWORDINGS), 2),
+            "false_hit_rate": round(false_hits / len(DIFFERENT), 2)
+        })
+    return rows
+
+
+def timed_lookups(cache: ResponseCache, prompts):
+    samples = []
+    for prompt in prompts:
+        start = time.perf_counter()
+        cache.get(prompt, MODEL)
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def latency_rows():
+    cache = ResponseCache(max_entries=ENTRIES)
+    # No digits, so all prompts share one namespace and a semantic lookup scores every entry
+    words = [f"{a}{b}{c}" for a in "bcdfghjklm" for b in "aeiou" for c in "nprst"]
+    prompts = [
+        f"{BASE_PROMPTS[i % len(BASE_PROMPTS)]} with {words[i % len(words)]} and {words[i // len(words)]}"
+        for i in range(ENTRIES)
+    ]
+    start = time.perf_counter()
+    for prompt in prompts:
+        cache.put(prompt, MODEL, {"text": prompt})
+    fill_ms = (time.perf_counter() - start) * 1000
+
+    rows = [
+        {"lookup": "exact hit", **timed_lookups(cache, prompts[:LOOKUPS])},
+        {"lookup": "semantic scan", **timed_lookups(cache, [f"please {prompt}?" for prompt in prompts[:LOOKUPS]])},
+        {"lookup": "miss (empty namespace)", **timed_lookups(cache, [f"trip number {i}" for i in range(LOOKUPS)])},
+    ]
+    return rows, fill_ms, len(cache)
+
+
+def persistence_row():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cache.db")
+        cache = ResponseCache(max_entries=ENTRIES, path=path)
+        for i in range(2000):
+            cache.put(f"trip idea {i}", MODEL, {"text": f"reply {i}"})
+        cache.close()
+        start = time.perf_counter()
+        reloaded = ResponseCache(max_entries=ENTRIES, path=path)
+        reload_ms = (time.perf_counter() - start) * 1000
+        value, tier = reloaded.get("trip idea 7", MODEL)
+        reloaded.close()
+        return reload_ms, len(reloaded), value == {"text": "reply 7"} and tier == "exact"
+
+
+async def chat_latency():
+    fake_llm = FakeLLM(first_token_ms=FIRST_TOKEN_MS, tokens_per_second=TOKENS_PER_SECOND)
+    agent = ChatAgent(token_source=fake_llm, cache=ResponseCache())
+
+    async def reply(message: str) -> float:
+        start = time.perf_counter()
+        async for _ in agent.stream_message(message):
+            pass
+        return (time.perf_counter() - start) * 1000
+
+    rows = []
+    for label, message in (
+        ("cold", BASE_PROMPTS[0]),
+        ("exact repeat", BASE_PROMPTS[0]),
+        ("reworded", "Please plan a trip to San Francisco"),
+    ):
+        rows.append({"request": label, "total_ms": round(await reply(message), 2)})
+    return rows, agent.cache.stats()
+
+
+def main():
+    print_table("Hit rates by similarity threshold", threshold_rows())
+
+    rows, fill_ms, size = latency_rows()
+    print_table(f"Lookup latency with {size} cached entries (filled in {fill_ms:.0f} ms)", rows)
+
+    reload_ms, reloaded, correct = persistence_row()
+    print(f"\nSQLite cache: reloaded {reloaded} entries in {reload_ms:.1f} ms, exact hit after reload: {correct}")
+
+    rows, stats = asyncio.run(chat_latency())
+    print_table(f"Streamed chat reply, fake LLM {FIRST_TOKEN_MS} ms + {TOKENS_PER_SECOND} tokens/s", rows)
+    print(f"Cache stats: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Latency and route quality of the "auto" reorder solver, from typical
+4-8 stop days (exact DP) up to 80 stops (time-bounded local search).
+
+Run from the api directory:
+    python -m benchmarks.bench_route_optimizer
+"""
+import asyncio
+import random
+import time
+import numpy as np
+
+from agents.optimizer import ItineraryOptimizer
+from services.routing import solve_route, evaluate_route
+from services.travel_matrix import haversine_matrix, SPEED_PROFILES, TravelMode
+from benchmarks.common import build_trip, summarize, print_table, SF_CENTER
+
+STOP_COUNTS = [4, 6, 8, 10, 12, 20, 50, 80]
+ROUNDS = 30
+
+
+def random_day(stops: int, with_windows: bool, rng: random.Random):
+    points = [
+        (SF_CENTER[0] + rng.uniform(-0.06, 0.06), SF_CENTER[1] + rng.uniform(-0.08, 0.08))
+        for _ in range(stops)
+    ]
+    durations = [rng.choice([30, 45, 60, 90]) for _ in range(stops)]
+    windows = [
+        (rng.choice([8, 9, 10, 11]) * 60, rng.choice([17, 18, 20, 22]) * 60)
+        if with_windows and rng.random() < 0.6 else None
+        for _ in range(stops)
+    ]
+    profile = SPEED_PROFILES[TravelMode.TRANSIT]
+    minutes = haversine_matrix(np.array(points), np.array(points)) * (profile.detour_factor / profile.speed_kmh * 60)
+    return minutes.tolist(), durations, windows
+
+
+def bench_solver():
+    rng = random.Random(7)
+    rows = []
+    for stops in STOP_COUNTS:
+        for with_windows in (False, True):
+            samples = []
+            savings = []
+            method = ""
+            for _ in range(ROUNDS):
+                matrix, durations, windows = random_day(stops, with_windows, rng)
+                start = time.perf_counter()
+                result = solve_route(matrix, durations, windows)
+                samples.append((time.perf_counter() - start) * 1000)
+                baseline, _ = evaluate_route(list(range(stops)), matrix, durations, windows, 9 * 60)
+                savings.append(1 - result.travel_minutes / baseline if baseline else 0.0)
+                method = result.method
+            rows.append({
+                "stops": stops,
+                "windows": with_windows,
+                "method": method,
+                "travel_saved": f"{sum(savings) / len(savings):.0%}",
+                **summarize(samples)
+            })
+    print_table("solve_route latency (travel saved vs. input order)", rows)
+
+
+async def bench_reorder_action():
+    optimizer = ItineraryOptimizer()
+    rows = []
+    for slots in (4, 6, 8, 12):
+        trip = build_trip(7, slots)
+        samples = []
+        for _ in range(ROUNDS):
+            start = time.perf_counter()
+            await optimizer.optimize(trip, "reorder", {"day_number": 4, "mode": "auto"})
+            samples.append((time.perf_counter() - start) * 1000)
+        rows.append({"slots_per_day": slots, **summarize(samples)})
+    print_table("ItineraryOptimizer reorder action (auto), end to end", rows)
+
+
+if __name__ == "__main__":
+    bench_solver()
+    asyncio.run(bench_reorder_action())
@@ -0,0 +1,198 @@
+"""
+Concurrency stress for /optimize with an optimizer that yields to the
+event loop mid-edit, as one that awaits a worker or a remote service
+does. Checks that concurrent removals on one session are all kept (and
+how many the previous read-modify-write handler lost), that versions
+are unique and gapless, that a burst of reorders of one day collapses
+into few edits ending on the last order, that stale edits are reported
+as conflicts, and that busy sessions don't hold each other up. Exits
+with status 1 if any check fails.
+
+Run from the api directory:
+    python -m benchmarks.bench_session_mutations
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("ANTHROPIC_API_KEY", "bench")
+
+import main
+from agents.optimizer import ItineraryOptimizer
+from benchmarks.common import summarize, print_table, connected_request, report_checks
+
+SEED = 5
+SESSIONS = 50
+EDITS_PER_SESSION = 10
+REORDER_BURST = 50
+JITTER_MS = (1.0, 5.0)
+
+
+class JitterOptimizer(ItineraryOptimizer):
+    """
+    Yields for a few milliseconds before each edit and counts edits
+    """
+
+    def __init__(self, seed: int = SEED):
+        super().__init__()
+        self.rng = random.Random(seed)
+        self.applied = 0
+
+    async def apply(self, trip, action, action_data):
+        self.applied += 1
+        await asyncio.sleep(self.rng.uniform(*JITTER_MS) / 1000.0)
+        return await super().apply(trip, action, action_data)
+
+
+async def legacy_optimize(request):
+    """
+    The handler before edits were queued per session
+    """
+    session_id = request["session_id"]
+    current_trip = main.user_trips.get(session_id)
+    result = await main.app_agents.optimizer.apply(trip=current_trip, action=request["action"], action_data=request["data"])
+    version = main.user_trips.set(session_id, result.trip)
+    await main.publish_trip(session_id, result.trip, version, result.changes)
+    return {"success": True, "version": version}
+
+
+async def queued_optimize(request):
+    response = await main.optimize_itinerary(request, connected_request())
+    return {"status": response.status_code, **json.loads(response.body)}
+
+
+async def new_session(session_id: str, duration_days: int = 5):
+    trip = await main.app_agents.trip_planner.plan_trip("Plan a trip", {"destination": "San Francisco", "duration_days": duration_days})
+    version = main.user_trips.set(session_id, trip)
+    main.record_trip(session_id, trip, version)
+    return trip
+
+
+def planned_ids(session_id: str):
+    return {slot.attraction.id for day in main.user_trips.get(session_id).days for slot in day.time_slots}
+
+
+async def lost_updates(handler, session_id: str) -> dict:
+    trip = await new_session(session_id)
+    removals = [
+        {"session_id": session_id, "action": "remove", "data": {"day_number": day.day_number, "attraction_id": slot.attraction.id}}
+        for day in trip.days for slot in day.time_slots
+    ]
+    responses = await asyncio.gather(*(handler(request) for request in removals))
+    versions = sorted(response["version"] for response in responses)
+    lost = len(planned_ids(session_id))
+    gapless = versions == list(range(versions[0], versions[0] + len(versions)))
+    return {
+        "handler": "read-modify-write" if handler is legacy_optimize else "per-session queue",
+        "removals": len(removals),
+        "lost": lost,
+        "unique_versions": len(set(versions)),
+        "gapless": gapless,
+        # The old handler is shown for comparison, not checked
+        "passed": lost == 0 and len(set(versions)) == len(versions) and gapless if handler is queued_optimize else ""
+    }
+
+
+async def reorder_burst(session_id: str) -> dict:
+    trip = await new_session(session_id)
+    ids = [slot.attraction.id for slot in trip.days[0].time_slots]
+    rng = random.Random(SEED)
+    orders = [rng.sample(ids, len(ids)) for _ in range(REORDER_BURST)]
+    before = main.app_agents.optimizer.applied
+    responses = await asyncio.gather(*(
+        queued_optimize({"session_id": session_id, "action": "reorder", "data": {"day_number": 1, "new_order": order}})
+        for order in orders
+    ))
+    final = [slot.attraction.id for slot in main.user_trips.get(session_id).days[0].time_slots]
+    applied = main.app_agents.optimizer.applied - before
+    succeeded = all(response["status"] == 200 for response in responses)
+    return {
+        "requests": REORDER_BURST,
+        "edits_applied": applied,
+        "all_succeeded": succeeded,
+        "ends_on_last_order": final == orders[-1],
+        "passed": succeeded and final == orders[-1] and applied < REORDER_BURST
+    }
+
+
+async def conflicts(session_id: str) -> dict:
+    trip = await new_session(session_id)
+    version = main.user_trips.version(session_id)
+    day = trip.days[0]
+    edits = [
+        {"session_id": session_id, "action": "remove", "version": version,
+         "data": {"day_number": 1, "attraction_id": slot.attraction.id}}
+        for slot in day.time_slots[:2]
+    ]
+    first, second = await asyncio.gather(*(queued_optimize(edit) for edit in edits))
+    return {
+        "first": first["status"],
+        "second": second["status"],
+        "second_told_version": second.get("version"),
+        "passed": first["status"] == 200 and second["status"] == 409 and second.get("version") == first.get("version")
+    }
+
+
+async def parallel_sessions(label: str, handler) -> dict:
+    rng = random.Random(SEED)
+    trips = {f"{label}-{i}": await new_session(f"{label}-{i}", 3) for i in range(SESSIONS)}
+    samples = []
+
+    async def edit(session_id, trip):
+        day = rng.choice(trip.days)
+        slot = rng.choice(day.time_slots)
+        request = {"session_id": session_id, "action": "remove", "data": {"day_number": day.day_number, "attraction_id": slot.attraction.id}}
+        start = time.perf_counter()
+        await handler(request)
+        samples.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        edit(session_id, trip)
+        for session_id, trip in trips.items()
+        for _ in range(EDITS_PER_SESSION)
+    ))
+    wall_ms = (time.perf_counter() - start) * 1000
+    return {
+        "serialized": label,
+        "edits": SESSIONS * EDITS_PER_SESSION,
+        "wall_ms": round(wall_ms, 1),
+        **summarize(samples)
+    }
+
+
+async def run():
+    main.catalog_registry.load_all()
+    main.app_agents.optimizer = JitterOptimizer()
+
+    queued = await lost_updates(queued_optimize, "queued")
+    print_table("Concurrent removals of every attraction of one session", [
+        await lost_updates(legacy_optimize, "legacy"),
+        queued,
+    ])
+    burst = await reorder_burst("burst")
+    print_table(f"Burst of {REORDER_BURST} reorders of one day", [burst])
+    conflict = await conflicts("conflict")
+    print_table("Two edits made against the same version", [conflict])
+    one_lock = asyncio.Lock()
+
+    async def globally_locked(request):
+        async with one_lock:
+            return await legacy_optimize(request)
+
+    print_table(f"{EDITS_PER_SESSION} removals on each of {SESSIONS} sessions at once", [
+        await parallel_sessions("all sessions", globally_locked),
+        await parallel_sessions("per session", queued_optimize),
+    ])
+    print(f"\nmutations: {main.session_actors.stats()}")
+
+    if not report_checks([queued, burst, conflict]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
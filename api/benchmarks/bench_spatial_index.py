@@ -0,0 +1,87 @@
+"""
+k-nearest "discover" queries on the attraction grid index with 100k
+synthetic attractions, against a linear scan.
+
+Run from the api directory:
+    python -m benchmarks.bench_spatial_index
+"""
+import math
+import random
+import time
+
+from models import AttractionType
+from services.spatial_index import AttractionIndex, KM_PER_DEGREE_LAT, KM_PER_DEGREE_LNG_EQUATOR
+from benchmarks.common import build_attraction, summarize, print_table, SF_CENTER
+
+CATALOG_SIZE = 100000
+QUERIES = 1000
+K = 5
+RADIUS_KM = 2.0
+
+
+def linear_nearest(attractions, lat, lng, k, attraction_type, radius_km, exclude_ids):
+    km_per_lng = KM_PER_DEGREE_LNG_EQUATOR * math.cos(math.radians(lat))
+    scored = []
+    for attraction in attractions:
+        if attraction.type != attraction_type or attraction.id in exclude_ids:
+            continue
+        dy = (attraction.location.lat - lat) * KM_PER_DEGREE_LAT
+        dx = (attraction.location.lng - lng) * km_per_lng
+        distance = math.sqrt(dx * dx + dy * dy)
+        if distance <= radius_km:
+            scored.append((distance, attraction.id))
+    return sorted(scored)[:k]
+
+
+def main():
+    rng = random.Random(11)
+    build_start = time.perf_counter()
+    attractions = [build_attraction(i, rng) for i in range(CATALOG_SIZE)]
+    print(f"Generated {CATALOG_SIZE} attractions in {time.perf_counter() - build_start:.1f}s")
+
+    start = time.perf_counter()
+    index = AttractionIndex(attractions)
+    index_build_ms = (time.perf_counter() - start) * 1000
+
+    queries = []
+    for _ in range(QUERIES):
+        queries.append((
+            SF_CENTER[0] + rng.uniform(-0.05, 0.05),
+            SF_CENTER[1] + rng.uniform(-0.07, 0.07),
+            rng.choice(list(AttractionType)),
+            {f"syn-{rng.randrange(CATALOG_SIZE)}" for _ in range(20)}
+        ))
+
+    grid_samples = []
+    for lat, lng, attraction_type, exclude in queries:
+        start = time.perf_counter()
+        index.nearest(lat, lng, k=K, attraction_type=attraction_type, radius_km=RADIUS_KM, exclude_ids=exclude)
+        grid_samples.append((time.perf_counter() - start) * 1000)
+
+    linear_samples = []
+    mismatches = 0
+    for lat, lng, attraction_type, exclude in queries[:50]:
+        start = time.perf_counter()
+        expected = linear_nearest(attractions, lat, lng, K, attraction_type, RADIUS_KM, exclude)
+        linear_samples.append((time.perf_counter() - start) * 1000)
+        found = index.nearest(lat, lng, k=K, attraction_type=attraction_type, radius_km=RADIUS_KM, exclude_ids=exclude)
+        if [attraction.id for attraction, _ in found] != [attraction_id for _, attraction_id in expected]:
+            mismatches += 1
+
+    add_samples = []
+    for i in range(1000):
+        attraction = build_attraction(CATALOG_SIZE + i, rng)
+        start = time.perf_counter()
+        index.add(attraction)
+        add_samples.append((time.perf_counter() - start) * 1000)
+
+    print(f"Index build: {index_build_ms:.0f} ms, mismatches vs linear scan: {mismatches}/50")
+    print_table(f"k={K} nearest of a type within {RADIUS_KM} km, {CATALOG_SIZE} attractions", [
+        {"impl": "grid index", **summarize(grid_samples)},
+        {"impl": "linear scan", **summarize(linear_samples)},
+        {"impl": "incremental add", **summarize(add_samples)},
+    ])
+
+
+if __name__ == "__main__":
+    main()
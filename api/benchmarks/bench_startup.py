@@ -0,0 +1,129 @@
+"""
+Cold start of the Lambda handler: how long `import main` takes, then the
+first requests through `handler = Mangum(app)` in the same fresh
+interpreter (GET /, then POST /chat), and what building the first LLM
+model costs now that it happens on first use. Each round runs in a new
+process so nothing is already imported.
+
+Also a `python -X importtime` budget check: exits with status 1 when
+`import main` takes longer than IMPORT_BUDGET_MS (median of the rounds)
+or pulls in a module that should only load on first use.
+
+Run from the api directory:
+    python -m benchmarks.bench_startup
+"""
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks.common import summarize, print_table
+
+ROUNDS = 5
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "2000"))
+# Loaded on the first model call, or with the agents on the first request
+# that needs them, never at start-up
+DEFERRED_MODULES = ("langchain", "langchain_core", "langchain_community", "openai", "anthropic", "httpx", "numpy")
+
+ENV = dict(os.environ, OPENAI_API_KEY="bench", ANTHROPIC_API_KEY="bench", RESPONSE_CACHE="off")
+
+# Runs in the child process; prints one JSON line of timings
+COLD_START = r"""
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+def event(method, path, body=None):
+    return {
+        "resource": path, "path": path, "httpMethod": method,
+        "headers": {"content-type": "application/json", "host": "localhost"},
+        "multiValueHeaders": {}, "queryStringParameters": None,
+        "multiValueQueryStringParameters": None, "pathParameters": None,
+        "stageVariables": None, "body": body, "isBase64Encoded": False,
+        "requestContext": {"resourcePath": path, "httpMethod": method, "path": path,
+                           "stage": "bench", "identity": {"sourceIp": "127.0.0.1"}},
+    }
+
+class Context:
+    function_name = "bench"
+
+root = main.handler(event("GET", "/"), Context())
+root_done = time.perf_counter()
+chat = main.handler(event("POST", "/chat", json.dumps({"message": "Plan a trip to San Francisco"})), Context())
+chat_done = time.perf_counter()
+main.app_agents.chat_agent.openai_model
+model_done = time.perf_counter()
+main.app_agents.trip_planner.model
+shared_done = time.perf_counter()
+
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "first_get_ms": (root_done - imported) * 1000,
+    "first_chat_ms": (chat_done - root_done) * 1000,
+    "first_model_ms": (model_done - chat_done) * 1000,
+    "second_model_ms": (shared_done - model_done) * 1000,
+    "status": [root["statusCode"], chat["statusCode"]],
+}))
+"""
+
+
+def cold_start():
+    output = subprocess.run(
+        [sys.executable, "-c", COLD_START], env=ENV, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def import_profile():
+    """
+    Per-module cumulative import times (ms) for `import main`
+    """
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"], env=ENV, capture_output=True, text=True, check=True
+    ).stderr
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative) / 1000
+    return modules
+
+
+def main():
+    runs = [cold_start() for _ in range(ROUNDS)]
+    rows = [
+        {"stage": label, **summarize([run[key] for run in runs])}
+        for key, label in (
+            ("import_ms", "import main"),
+            ("first_get_ms", "first GET / via Mangum"),
+            ("first_chat_ms", "first POST /chat via Mangum"),
+            ("first_model_ms", "first LLM model (lazy)"),
+            ("second_model_ms", "second agent's model (shared pool)"),
+        )
+    ]
+    print_table(f"Cold start, {ROUNDS} fresh interpreters (status codes {runs[0]['status']})", rows)
+
+    profiles = [import_profile() for _ in range(3)]
+    total_ms = sorted(profile["main"] for profile in profiles)[1]
+    latest = profiles[-1]
+    top = sorted(
+        ((name, ms) for name, ms in latest.items() if "." not in name and name != "main"),
+        key=lambda item: item[1],
+        reverse=True
+    )[:8]
+    print_table("Slowest top-level imports under `import main` (-X importtime)", [
+        {"module": name, "cumulative_ms": round(ms, 1)} for name, ms in top
+    ])
+
+    deferred = sorted({name.split(".")[0] for name in latest} & set(DEFERRED_MODULES))
+    within_budget = total_ms <= IMPORT_BUDGET_MS
+    print(f"\nimport main: {total_ms:.0f} ms (budget {IMPORT_BUDGET_MS:.0f} ms) - {'ok' if within_budget else 'OVER BUDGET'}")
+    print(f"Deferred modules imported at start-up: {', '.join(deferred) or 'none'}")
+    if not within_budget or deferred:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
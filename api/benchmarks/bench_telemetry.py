@@ -0,0 +1,112 @@
+"""
+Cost of the built-in instrumentation: a span and a histogram observation
+on their own, rendering /metrics, and /optimize requests end to end with
+tracing off, on, and on with the slow-request profiler sampling.
+
+Run from the api directory:
+    python -m benchmarks.bench_telemetry
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("ANTHROPIC_API_KEY", "bench")
+
+import httpx
+
+import main
+from services.telemetry import MetricsRegistry, SlowRequestProfiler, Tracer
+from benchmarks.common import build_trip, summarize, print_table
+
+ROUNDS = 100000
+REQUESTS = 2000
+SESSIONS = 20
+
+
+def per_call_ns(operation, rounds: int = ROUNDS) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        operation()
+    return round((time.perf_counter() - start) / rounds * 1e9, 1)
+
+
+def micro() -> list:
+    registry = MetricsRegistry()
+    on = Tracer(registry)
+    off = Tracer(MetricsRegistry(), enabled=False)
+    histogram = registry.histogram("bench_seconds", "bench", ("route",))
+
+    def span_on():
+        with on.span("bench"):
+            pass
+
+    def span_off():
+        with off.span("bench"):
+            pass
+
+    def span_in_trace():
+        with on.span("bench.child"):
+            pass
+
+    root = on.start_trace("bench")
+    in_trace = per_call_ns(span_in_trace, 200)
+    on.finish_trace(root, "GET", "bench", 200)
+    for route in range(50):
+        for i in range(100):
+            histogram.observe(i / 1000.0, str(route))
+    return [
+        {"operation": "span, tracing off", "ns": per_call_ns(span_off)},
+        {"operation": "span, no request", "ns": per_call_ns(span_on)},
+        {"operation": "span inside a request", "ns": in_trace},
+        {"operation": "histogram observe", "ns": per_call_ns(lambda: histogram.observe(0.004, "7"))},
+        {"operation": "render /metrics (50 series)", "ns": per_call_ns(registry.render, 200)},
+    ]
+
+
+async def requests(profiler: SlowRequestProfiler) -> list:
+    """
+    The three setups take turns request by request, so drift in the
+    process (trip history, garbage) affects them all alike
+    """
+    modes = ("off", "tracing", "tracing + profiler")
+    samples = {mode: [] for mode in modes}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for i in range(REQUESTS * len(modes)):
+            mode = modes[i % len(modes)]
+            main.tracer.enabled = mode != "off"
+            main.tracer.profiler = profiler if mode == "tracing + profiler" else None
+            start = time.perf_counter()
+            response = await client.post("/optimize", json={
+                "session_id": f"telemetry-{i % SESSIONS}",
+                "action": "reorder",
+                "data": {"day_number": i % 3 + 1, "mode": "auto"}
+            })
+            samples[mode].append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200
+    main.tracer.enabled = True
+    main.tracer.profiler = None
+    return [{"instrumentation": mode, "requests": REQUESTS, **summarize(samples[mode])} for mode in modes]
+
+
+async def run():
+    main.catalog_registry.load_all()
+    for i in range(SESSIONS):
+        trip = build_trip(3, 6, seed=i)
+        version = main.user_trips.set(f"telemetry-{i}", trip)
+        main.record_trip(f"telemetry-{i}", trip, version)
+
+    print_table("Per call", micro())
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        # Everything counts as slow, so every profiled request is sampled and dumped
+        profiler = SlowRequestProfiler(slow_ms=0.0, interval_ms=5.0, out_dir=out_dir, max_files=REQUESTS)
+        rows = await requests(profiler)
+        dumps = profiler.dumps
+    print_table(f"POST /optimize (auto reorder of a 6-stop day); profiler wrote {dumps} stack files", rows)
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
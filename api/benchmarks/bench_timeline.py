@@ -0,0 +1,87 @@
+"""
+Incremental day retiming (prefix sums, suffix-only updates) against the
+old full recompute, for remove, insert and move edits on long days.
+
+Run from the api directory:
+    python -m benchmarks.bench_timeline
+"""
+import random
+import time
+
+from models import TimeSlot
+from agents.optimizer import ItineraryOptimizer
+from services.timeline import DayTimeline, minute_to_time
+from benchmarks.common import build_trip, build_attraction, summarize, print_table, full_recalculate_day_timings
+
+SLOTS_PER_DAY = [8, 32, 128]
+ROUNDS = 300
+
+
+def full_edit(optimizer, day, edit, position, extra):
+    # Old path: copy every slot, edit the list, recompute the whole day
+    copied = day.model_copy(update={"time_slots": [slot.model_copy() for slot in day.time_slots]})
+    slots = copied.time_slots
+    if edit == "remove":
+        del slots[position]
+    elif edit == "insert":
+        slots.insert(position, TimeSlot(start_time=minute_to_time(540), end_time=minute_to_time(540), attraction=extra))
+    else:
+        slots.insert(len(slots) - 1, slots.pop(position))
+    full_recalculate_day_timings(optimizer, copied)
+    copied.total_cost = sum(slot.attraction.cost_usd for slot in slots)
+    return copied
+
+
+def incremental_edit(optimizer, day, edit, position, extra):
+    copied = day.model_copy(update={"time_slots": list(day.time_slots)})
+    timeline = DayTimeline.of(copied, source=day)
+    if edit == "remove":
+        timeline.remove(position, optimizer._leg_minutes)
+    elif edit == "insert":
+        start = minute_to_time(timeline.start_minute)
+        timeline.insert(position, TimeSlot(start_time=start, end_time=start, attraction=extra), optimizer._leg_minutes)
+    else:
+        timeline.move(position, len(copied.time_slots) - 1, optimizer._leg_minutes)
+    return copied
+
+
+def main():
+    optimizer = ItineraryOptimizer()
+    extra = build_attraction(10 ** 6, random.Random(3))
+    rows = []
+    for slots in SLOTS_PER_DAY:
+        trip = build_trip(1, slots, seed=slots)
+        day = trip.days[0]
+        # Start from consistent timings, as a planned day would have
+        full_recalculate_day_timings(optimizer, day)
+        DayTimeline.of(day)
+
+        for edit in ("remove", "insert", "move"):
+            # Edits three quarters of the way through the day, the common case
+            position = (slots * 3) // 4
+            results = {}
+            for name, runner in (("full", full_edit), ("incremental", incremental_edit)):
+                samples = []
+                for _ in range(ROUNDS):
+                    start = time.perf_counter()
+                    edited = runner(optimizer, day, edit, position, extra)
+                    samples.append((time.perf_counter() - start) * 1000)
+                results[name] = edited
+                rows.append({"edit": edit, "slots": slots, "impl": name, **summarize(samples)})
+
+            full, incremental = results["full"], results["incremental"]
+            same = [
+                (a.attraction.id, a.start_time, a.end_time, a.travel_time_minutes)
+                for a in full.time_slots
+            ] == [
+                (b.attraction.id, b.start_time, b.end_time, b.travel_time_minutes)
+                for b in incremental.time_slots
+            ] and full.total_duration_minutes == incremental.total_duration_minutes
+            rows[-1]["matches_full"] = same
+            rows[-2]["matches_full"] = ""
+
+    print_table("Day edit and retime", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Batched NumPy travel matrices against pairwise pure-Python haversine,
+cold and from the engine cache.
+
+Run from the api directory:
+    python -m benchmarks.bench_travel_matrix
+"""
+import math
+import random
+import time
+
+from services.travel_matrix import TravelMatrixEngine, TravelMode, EARTH_RADIUS_KM
+from benchmarks.common import build_attraction, summarize, print_table
+
+SET_SIZES = [4, 12, 50, 200, 1000]
+ROUNDS = 20
+
+
+def python_matrix(attractions):
+    # Pairwise scalar haversine, one call per pair
+    matrix = []
+    for a in attractions:
+        row = []
+        for b in attractions:
+            phi1, phi2 = math.radians(a.location.lat), math.radians(b.location.lat)
+            d_phi = phi2 - phi1
+            d_lambda = math.radians(b.location.lng - a.location.lng)
+            h = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+            row.append(2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h)) * 1.3 / 18.0 * 60 + 5)
+        matrix.append(row)
+    return matrix
+
+
+def timed(fn, rounds=ROUNDS):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def main():
+    rng = random.Random(3)
+    rows = []
+    for size in SET_SIZES:
+        attractions = [build_attraction(i, rng) for i in range(size)]
+        rounds = ROUNDS if size <= 200 else 3
+        rows.append({"impl": "python pairwise", "attractions": size, **timed(lambda: python_matrix(attractions), rounds)})
+        rows.append({
+            "impl": "numpy cold",
+            "attractions": size,
+            **timed(lambda: TravelMatrixEngine().matrix(attractions, TravelMode.TRANSIT, "sf"), rounds)
+        })
+        engine = TravelMatrixEngine()
+        engine.matrix(attractions, TravelMode.TRANSIT, "sf")
+        rows.append({
+            "impl": "numpy cached",
+            "attractions": size,
+            **timed(lambda: engine.matrix(attractions, TravelMode.TRANSIT, "sf"), rounds)
+        })
+    print_table("Travel-time matrix construction", rows)
+
+
+if __name__ == "__main__":
+    main()
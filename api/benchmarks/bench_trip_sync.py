@@ -0,0 +1,70 @@
+"""
+Bytes on the wire and server time per /optimize edit for a 14-day trip:
+the full trip dump against versioned JSON patches, with and without zlib.
+
+Run from the api directory:
+    python -m benchmarks.bench_trip_sync
+"""
+import asyncio
+import random
+import time
+import zlib
+
+from agents.optimizer import ItineraryOptimizer
+from services.connection_manager import encode_message
+from services.trip_sync import TripSyncHub
+from benchmarks.common import build_trip, summarize, print_table
+
+TRIP_DAYS = 14
+SLOTS_PER_DAY = 6
+EDITS = 200
+
+
+def random_edit(trip, rng):
+    day = rng.choice(trip.days)
+    if len(day.time_slots) > 2 and rng.random() < 0.5:
+        return "remove", {"day_number": day.day_number, "attraction_id": rng.choice(day.time_slots).attraction.id}
+    order = [slot.attraction.id for slot in day.time_slots]
+    rng.shuffle(order)
+    return "reorder", {"day_number": day.day_number, "new_order": order}
+
+
+async def main():
+    rng = random.Random(10)
+    optimizer = ItineraryOptimizer()
+    hub = TripSyncHub()
+    trip = build_trip(TRIP_DAYS, SLOTS_PER_DAY)
+
+    snapshot = encode_message(hub.snapshot("bench", trip))
+    full_bytes, patch_bytes, zlib_bytes = [], [], []
+    full_ms, patch_ms = [], []
+    for _ in range(EDITS):
+        action, data = random_edit(trip, rng)
+        result = await optimizer.apply(trip, action, data)
+        trip = result.trip
+
+        start = time.perf_counter()
+        full = encode_message({"type": "trip_update", "trip_plan": trip.model_dump(), "session_id": "bench"})
+        full_ms.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        patch = encode_message(hub.update("bench", trip, result.changes))
+        patch_ms.append((time.perf_counter() - start) * 1000)
+
+        full_bytes.append(len(full.encode()))
+        patch_bytes.append(len(patch.encode()))
+        zlib_bytes.append(len(zlib.compress(patch.encode())))
+
+    def mean(values):
+        return round(sum(values) / len(values))
+
+    print(f"Snapshot on connect: {len(snapshot.encode())} bytes, {len(zlib.compress(snapshot.encode()))} with zlib")
+    print_table(f"{EDITS} edits on a {TRIP_DAYS}-day trip, {SLOTS_PER_DAY} slots per day", [
+        {"message": "full trip", "mean_bytes": mean(full_bytes), **summarize(full_ms)},
+        {"message": "patch", "mean_bytes": mean(patch_bytes), **summarize(patch_ms)},
+        {"message": "patch + zlib", "mean_bytes": mean(zlib_bytes)},
+    ])
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,138 @@
+"""
+Fan-out latency of the session-scoped ConnectionManager against the old
+global broadcast loop, with 1k-10k simulated sockets.
+
+Run from the api directory:
+    python -m benchmarks.bench_websocket_fanout
+"""
+from typing import List
+from datetime import datetime
+import asyncio
+import time
+
+from services.connection_manager import ConnectionManager, encode_message
+from benchmarks.common import summarize, print_table
+
+SOCKET_COUNTS = [1000, 5000, 10000]
+ROUNDS = 5
+SLOW_CLIENT_DELAY = 0.05
+
+
+class FakeWebSocket:
+    """
+    Simulated client that records delivery; optionally slow to drain
+    """
+
+    def __init__(self, tracker: "DeliveryTracker", delay: float = 0.0):
+        self.tracker = tracker
+        self.delay = delay
+
+    async def send_text(self, payload: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        else:
+            await asyncio.sleep(0)
+        self.tracker.mark()
+
+    async def send_json(self, data):
+        await self.send_text(encode_message(data))
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+class DeliveryTracker:
+    def __init__(self, expected: int):
+        self.expected = expected
+        self.received = 0
+        self.done = asyncio.Event()
+
+    def mark(self):
+        self.received += 1
+        if self.received >= self.expected:
+            self.done.set()
+
+
+def sample_payload():
+    return {
+        "type": "trip_update",
+        "session_id": "bench",
+        "trip_plan": {
+            "id": "trip-1",
+            "destination": "San Francisco",
+            "start_date": datetime(2025, 7, 1),
+            "days": [
+                {
+                    "day_number": day + 1,
+                    "time_slots": [
+                        {"attraction": {"id": str(i), "name": f"Stop {i}", "tags": ["a", "b"]}}
+                        for i in range(4)
+                    ]
+                }
+                for day in range(3)
+            ]
+        }
+    }
+
+
+async def legacy_broadcast(connections: List[FakeWebSocket], data):
+    # Pre-change behaviour: serial awaits, encode per socket
+    for connection in connections:
+        await connection.send_json(data)
+
+
+async def run_legacy(socket_count: int, session_size: int, slow: bool) -> float:
+    # The old loop ignores sessions and sends to every socket
+    tracker = DeliveryTracker(socket_count)
+    sockets = [FakeWebSocket(tracker) for _ in range(socket_count)]
+    if slow:
+        sockets[0].delay = SLOW_CLIENT_DELAY
+    start = time.perf_counter()
+    await legacy_broadcast(sockets, sample_payload())
+    return (time.perf_counter() - start) * 1000
+
+
+async def run_manager(socket_count: int, session_size: int, slow: bool) -> float:
+    manager = ConnectionManager(queue_size=8)
+    # A slow client only delays its own delivery, so measure the rest
+    expected = session_size - 1 if slow else session_size
+    tracker = DeliveryTracker(expected)
+    for i in range(socket_count):
+        if i < session_size:
+            socket = FakeWebSocket(tracker)
+            if slow and i == 0:
+                socket = FakeWebSocket(DeliveryTracker(1), delay=SLOW_CLIENT_DELAY)
+            await manager.connect("bench", socket)
+        else:
+            await manager.connect(f"other-{i // session_size}", FakeWebSocket(DeliveryTracker(1)))
+    # Let every writer task park on its queue, as it would on a live server
+    await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await manager.broadcast("bench", sample_payload())
+    await tracker.done.wait()
+    elapsed = (time.perf_counter() - start) * 1000
+    await manager.close_all()
+    return elapsed
+
+
+async def main():
+    rows = []
+    for socket_count in SOCKET_COUNTS:
+        # One hot session holding every socket, then realistic sessions of 4 tabs
+        for session_size in (socket_count, 4):
+            for slow in (False, True):
+                for name, runner in (("legacy", run_legacy), ("manager", run_manager)):
+                    samples = [await runner(socket_count, session_size, slow) for _ in range(ROUNDS)]
+                    rows.append({
+                        "impl": name,
+                        "sockets": socket_count,
+                        "session_size": session_size,
+                        "slow_client": slow,
+                        **summarize(samples)
+                    })
+    print_table("WebSocket fan-out latency (until every fast client in the session received)", rows)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
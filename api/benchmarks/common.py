@@ -0,0 +1,206 @@
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timedelta, time
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+
+from starlette.requests import Request
+
+from models import TripPlan, DayItinerary, TimeSlot, Attraction, Location, AttractionType
+
+# Downtown San Francisco, used as the centre of synthetic attractions
+SF_CENTER = (37.7749, -122.4194)
+
+
+def summarize(samples_ms: List[float]) -> Dict[str, float]:
+    """
+    Reduce a list of millisecond timings to the numbers we compare
+    """
+    ordered = sorted(samples_ms)
+    p99_index = max(0, int(round(len(ordered) * 0.99)) - 1)
+    return {
+        "min_ms": round(ordered[0], 3),
+        "median_ms": round(statistics.median(ordered), 3),
+        "p99_ms": round(ordered[p99_index], 3),
+        "max_ms": round(ordered[-1], 3)
+    }
+
+
+def print_table(title: str, rows: List[Dict[str, Any]]):
+    """
+    Print benchmark rows as an aligned table
+    """
+    print(f"\n{title}")
+    if not rows:
+        return
+    columns = list(rows[0].keys())
+    widths = {
+        column: max(len(column), *(len(str(row.get(column, ""))) for row in rows))
+        for column in columns
+    }
+    print("  ".join(column.ljust(widths[column]) for column in columns))
+    for row in rows:
+        print("  ".join(str(row.get(column, "")).ljust(widths[column]) for column in columns))
+
+
+def report_checks(rows: List[Dict[str, Any]]) -> bool:
+    """
+    Whether every checked row passed, printing the ones that didn't.
+    Checked rows carry a "passed" column; rows where it is "" are
+    baselines shown for comparison. Benchmarks exit with status 1 when
+    this is False.
+    """
+    checked = [row for row in rows if row.get("passed", "") != ""]
+    failed = [row for row in checked if not row["passed"]]
+    if failed:
+        print(f"\nFAILED: {len(failed)} of {len(checked)} checks")
+        for row in failed:
+            print("  " + ", ".join(f"{column}={value}" for column, value in row.items() if column != "passed"))
+    return not failed
+
+
+def build_attraction(index: int, rng: random.Random) -> Attraction:
+    """
+    A synthetic attraction as rich as the catalog ones (images, tags, hours)
+    """
+    return Attraction(
+        id=f"syn-{index}",
+        name=f"Synthetic Attraction {index}",
+        type=rng.choice(list(AttractionType)),
+        location=Location(
+            lat=SF_CENTER[0] + rng.uniform(-0.06, 0.06),
+            lng=SF_CENTER[1] + rng.uniform(-0.08, 0.08),
+            address=f"{index} Market St, San Francisco, CA"
+        ),
+        description="A generated attraction used for benchmarking the planner",
+        duration_minutes=rng.choice([30, 60, 90, 120]),
+        cost_usd=round(rng.uniform(0, 50), 2),
+        rating=round(rng.uniform(3.5, 5.0), 1),
+        images=[f"https://example.com/img/{index}/{i}.jpg" for i in range(3)],
+        tags=rng.sample(["food", "culture", "history", "nature", "shopping", "views", "free"], 3),
+        opening_hours={
+            day: "09:00-18:00"
+            for day in ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+        },
+        website=f"https://example.com/{index}",
+        google_maps_url=f"https://maps.google.com/?q=syn-{index}"
+    )
+
+
+def build_trip(num_days: int, slots_per_day: int, seed: int = 0) -> TripPlan:
+    """
+    A synthetic trip with the same shape TripPlannerAgent produces
+    """
+    rng = random.Random(seed)
+    start_date = datetime(2025, 7, 1)
+    days = []
+    index = 0
+    for day_num in range(num_days):
+        current_date = start_date + timedelta(days=day_num)
+        current = datetime.combine(current_date, time(9, 0))
+        time_slots = []
+        for i in range(slots_per_day):
+            attraction = build_attraction(index, rng)
+            index += 1
+            end = current + timedelta(minutes=attraction.duration_minutes)
+            time_slots.append(TimeSlot(
+                start_time=current.time(),
+                end_time=end.time(),
+                attraction=attraction,
+                travel_time_minutes=15 if i > 0 else 0,
+                notes=f"Don't miss the {attraction.name}!"
+            ))
+            current = end + timedelta(minutes=15)
+        days.append(DayItinerary(
+            day_number=day_num + 1,
+            date=current_date,
+            time_slots=time_slots,
+            total_cost=sum(ts.attraction.cost_usd for ts in time_slots),
+            total_duration_minutes=sum(
+                ts.attraction.duration_minutes + ts.travel_time_minutes for ts in time_slots
+            )
+        ))
+    return TripPlan(
+        id=f"bench-{num_days}-{slots_per_day}",
+        destination="San Francisco",
+        start_date=start_date,
+        end_date=start_date + timedelta(days=num_days - 1),
+        days=days,
+        total_cost=sum(day.total_cost for day in days)
+    )
+
+
+def full_recalculate_day_timings(optimizer, day: DayItinerary):
+    """
+    The optimizer's timing pass before days kept prefix sums: rebuild the
+    day's travel matrix and re-derive every slot from 09:00
+    """
+    if not day.time_slots:
+        return
+    travel_minutes = optimizer._day_travel_minutes(day)
+    current_time = time(9, 0)
+    for i, slot in enumerate(day.time_slots):
+        if i == 0:
+            slot.travel_time_minutes = 0
+        else:
+            slot.travel_time_minutes = round(travel_minutes[i - 1][i])
+            current_time = (datetime.combine(day.date, current_time) + timedelta(minutes=slot.travel_time_minutes)).time()
+        slot.start_time = current_time
+        slot.end_time = (datetime.combine(day.date, current_time) + timedelta(minutes=slot.attraction.duration_minutes)).time()
+        current_time = slot.end_time
+    day.total_duration_minutes = sum(
+        slot.attraction.duration_minutes + slot.travel_time_minutes
+        for slot in day.time_slots
+    )
+
+
+def connected_request() -> Request:
+    """
+    A Request whose client never disconnects, for calling HTTP handlers directly
+    """
+    async def receive():
+        await asyncio.Event().wait()
+
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": []}, receive)
+
+
+def git_revision() -> Dict[str, Any]:
+    """
+    The commit being measured, and whether the tree had local changes
+    """
+    def git(*args) -> Optional[str]:
+        try:
+            return subprocess.run(
+                ["git", *args], capture_output=True, text=True, timeout=10, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    revision = git("rev-parse", "--short", "HEAD")
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {"revision": revision, "dirty": bool(status) if status is not None else None}
+
+
+def write_results(path: str, suite: str, results: List[Dict[str, Any]], config: Optional[Dict[str, Any]] = None):
+    """
+    Save benchmark rows with what they were measured on, for
+    benchmarks.compare. Every row needs a "name" unique within the suite.
+    """
+    document = {
+        "suite": suite,
+        **git_revision(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": config or {},
+        "results": results
+    }
+    with open(path, "w") as output:
+        json.dump(document, output, indent=2)
+        output.write("\n")
+    print(f"\nResults written to {path}")
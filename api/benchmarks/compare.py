@@ -0,0 +1,78 @@
+"""
+Compare two result files written by benchmarks.suite or benchmarks.load
+(--json), benchmark by benchmark. A benchmark regressed when its metric
+grew by more than --threshold percent and by more than --min-delta ms,
+which keeps sub-microsecond jitter from being reported. Exits with 1 if
+anything regressed, so it can gate CI.
+
+Run from the api directory:
+    python -m benchmarks.compare base.json head.json [--metric median_ms] [--threshold 10]
+"""
+import argparse
+import json
+import sys
+
+from benchmarks.common import print_table
+
+
+def load(path: str) -> dict:
+    with open(path) as source:
+        return json.load(source)
+
+
+def describe(document: dict) -> str:
+    revision = document.get("revision") or "unknown"
+    if document.get("dirty"):
+        revision += " (modified)"
+    return f"{document.get('suite')} @ {revision}, {document.get('timestamp')}"
+
+
+def compare(base: dict, head: dict, metric: str, threshold: float, min_delta: float):
+    base_rows = {row["name"]: row for row in base["results"]}
+    rows = []
+    regressions = []
+    for row in head["results"]:
+        name = row["name"]
+        before = base_rows.get(name, {}).get(metric)
+        after = row.get(metric)
+        if before is None or after is None:
+            rows.append({"name": name, "base": before if before is not None else "-", "head": after, "change": "new"})
+            continue
+        delta = after - before
+        change = delta / before * 100 if before else 0.0
+        verdict = ""
+        if change > threshold and delta > min_delta:
+            verdict = "REGRESSED"
+            regressions.append(name)
+        elif change < -threshold and -delta > min_delta:
+            verdict = "improved"
+        rows.append({"name": name, "base": before, "head": after, "change": f"{change:+.1f}%", "verdict": verdict})
+    missing = sorted(set(base_rows) - {row["name"] for row in head["results"]})
+    return rows, regressions, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--metric", default="median_ms", help="Result field to compare (median_ms, p99_ms, ...)")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Percent growth that counts as a regression")
+    parser.add_argument("--min-delta", type=float, default=0.01, help="Smallest growth, in the metric's unit, that counts")
+    args = parser.parse_args()
+
+    base, head = load(args.base), load(args.head)
+    if base.get("suite") != head.get("suite"):
+        sys.exit(f"Cannot compare suite {base.get('suite')!r} with {head.get('suite')!r}")
+    rows, regressions, missing = compare(base, head, args.metric, args.threshold, args.min_delta)
+    print(f"base: {describe(base)}\nhead: {describe(head)}")
+    if base.get("cpus") != head.get("cpus") or base.get("python") != head.get("python"):
+        print("warning: measured on different machines or Python versions")
+    print_table(f"{args.metric}, regression above {args.threshold:g}%", rows)
+    if missing:
+        print(f"\nNot in head: {', '.join(missing)}")
+    print(f"\n{len(regressions)} regressed")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+End-to-end load: many sessions, each with several WebSocket clients,
+plan a trip through /chat and then keep editing it through /optimize
+(manual and automatic reorders, removals, discoveries, and the odd new
+chat) with random think time. Reports latency per endpoint, WebSocket
+connect time, and how long edits take to reach "delta" clients (from
+the request being sent to the patch arriving), and checks that every
+client got every update.
+
+By default the app runs on a local uvicorn in this process, with chat
+replies streamed by fake providers (see model_router.fake_providers)
+at a configurable first-token latency and token rate. --url targets a
+server started separately, e.g. MODEL_ROUTING=fake uvicorn main:app.
+
+Run from the api directory:
+    python -m benchmarks.load [--sessions 20] [--sockets 5] [--duration 20] [--json results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("ANTHROPIC_API_KEY", "bench")
+
+import httpx
+import websockets
+
+from benchmarks.common import summarize, print_table, write_results
+
+MESSAGES = (
+    "Plan a 3 day trip to San Francisco for food and culture",
+    "I'd like a 4 day San Francisco itinerary with museums and parks",
+    "Plan a 2 day trip to San Francisco, we love history",
+)
+# Edit mix: (action, weight)
+ACTIONS = (("reorder", 40), ("auto", 20), ("remove", 15), ("discover", 15), ("chat", 10))
+
+
+class SessionClient:
+    """
+    One session: its sockets, its current trip, and when each version of
+    the trip was requested
+    """
+
+    def __init__(self, session_id: str, rng: random.Random):
+        self.session_id = session_id
+        self.rng = rng
+        self.trip: Optional[Dict[str, Any]] = None
+        self.version_sent: Dict[int, float] = {}
+        self.delta_received: List[Dict[int, float]] = []
+        self.full_updates: List[int] = []
+        self.updates = 0
+        self.sockets = []
+        self.readers: List[asyncio.Task] = []
+
+    async def connect(self, ws_url: str, count: int, connect_samples: list):
+        for i in range(count):
+            protocol = "delta" if i % 2 == 0 else "full"
+            start = time.perf_counter()
+            socket = await websockets.connect(f"{ws_url}/ws/{self.session_id}?protocol={protocol}", max_size=None)
+            connect_samples.append((time.perf_counter() - start) * 1000)
+            self.sockets.append(socket)
+            if protocol == "delta":
+                received: Dict[int, float] = {}
+                self.delta_received.append(received)
+                self.readers.append(asyncio.create_task(self._read_delta(socket, received)))
+            else:
+                self.full_updates.append(0)
+                self.readers.append(asyncio.create_task(self._read_full(socket, len(self.full_updates) - 1)))
+
+    async def _read_delta(self, socket, received: Dict[int, float]):
+        async for data in socket:
+            message = json.loads(data)
+            if message.get("type") in ("patch", "snapshot") and "version" in message:
+                received.setdefault(message["version"], time.perf_counter())
+
+    async def _read_full(self, socket, index: int):
+        async for data in socket:
+            message = json.loads(data)
+            if message.get("type") == "trip_update" or (message.get("type") is None and message.get("trip_plan")):
+                self.full_updates[index] += 1
+
+    async def close(self):
+        for socket in self.sockets:
+            await socket.close()
+        for reader in self.readers:
+            reader.cancel()
+        await asyncio.gather(*self.readers, return_exceptions=True)
+
+    def next_edit(self) -> Optional[Dict[str, Any]]:
+        action = self.rng.choices([name for name, _ in ACTIONS], weights=[weight for _, weight in ACTIONS])[0]
+        if action == "chat" or self.trip is None:
+            return None
+        days = self.trip["days"]
+        day = self.rng.choice(days)
+        ids = [slot["attraction"]["id"] for slot in day["time_slots"]]
+        data: Dict[str, Any] = {"day_number": day["day_number"]}
+        if action == "remove" and len(ids) > 1:
+            data["attraction_id"] = self.rng.choice(ids)
+        elif action == "reorder" and len(ids) > 1:
+            action, data["new_order"] = "reorder", self.rng.sample(ids, len(ids))
+        elif action == "auto" and len(ids) > 1:
+            action, data["mode"] = "reorder", "auto"
+        else:
+            action, data["limit"] = "discover", 1
+        return {"session_id": self.session_id, "action": action, "data": data}
+
+
+async def drive(
+    client: httpx.AsyncClient,
+    session: SessionClient,
+    deadline: float,
+    think_ms: float,
+    samples: Dict[str, list],
+    statuses: Dict[str, Counter]
+):
+    async def call(endpoint: str, body: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        start = time.perf_counter()
+        try:
+            response = await client.post(endpoint, json=body)
+            status = response.status_code
+        except httpx.HTTPError as exc:
+            statuses[endpoint][type(exc).__name__] += 1
+            return None
+        samples[endpoint].append((time.perf_counter() - start) * 1000)
+        statuses[endpoint][status] += 1
+        if status != 200:
+            return None
+        reply = response.json()
+        if reply.get("trip_plan") is not None and reply.get("version") is not None:
+            session.trip = reply["trip_plan"]
+            session.version_sent[reply["version"]] = start
+            session.updates += 1
+        return reply
+
+    await call("/chat", {"message": session.rng.choice(MESSAGES), "session_id": session.session_id})
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(session.rng.expovariate(1.0 / think_ms) / 1000.0 if think_ms > 0 else 0)
+        edit = session.next_edit()
+        if edit is None:
+            await call("/chat", {"message": session.rng.choice(MESSAGES), "session_id": session.session_id})
+        else:
+            await call("/optimize", edit)
+
+
+def delivery(sessions: List[SessionClient]) -> Dict[str, Any]:
+    latencies = []
+    missing = 0
+    for session in sessions:
+        for received in session.delta_received:
+            for version, sent in session.version_sent.items():
+                if version in received:
+                    latencies.append((received[version] - sent) * 1000)
+                else:
+                    missing += 1
+        missing += sum(max(0, session.updates - count) for count in session.full_updates)
+    return {"latencies": latencies, "missing": missing}
+
+
+def start_local_server(first_token_ms: float, tokens_per_second: float, reply_tokens: int) -> str:
+    import socket
+    import threading
+    import uvicorn
+    import main
+    from services.model_router import fake_providers
+
+    main.model_router.providers = fake_providers(first_token_ms, tokens_per_second, reply_tokens)
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning", ws_max_size=2 ** 24))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}"
+
+
+async def run(args):
+    url = args.url or start_local_server(args.first_token_ms, args.tokens_per_second, args.reply_tokens)
+    ws_url = "ws" + url[len("http"):]
+    rng = random.Random(args.seed)
+    sessions = [SessionClient(f"load-{i}", random.Random(rng.random())) for i in range(args.sessions)]
+    samples: Dict[str, list] = {"/chat": [], "/optimize": []}
+    statuses: Dict[str, Counter] = {endpoint: Counter() for endpoint in samples}
+    connect_samples: list = []
+
+    limits = httpx.Limits(max_connections=args.sessions, max_keepalive_connections=args.sessions)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        await asyncio.gather(*(session.connect(ws_url, args.sockets, connect_samples) for session in sessions))
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(
+            drive(client, session, deadline, args.think_ms, samples, statuses) for session in sessions
+        ))
+        elapsed = time.perf_counter() - started
+        # Let the last broadcasts arrive
+        await asyncio.sleep(args.drain)
+        server_stats = (await client.get("/stats")).json()
+    await asyncio.gather(*(session.close() for session in sessions))
+
+    delivered = delivery(sessions)
+    requests = sum(len(endpoint_samples) for endpoint_samples in samples.values())
+    results = []
+    for endpoint, endpoint_samples in samples.items():
+        if endpoint_samples:
+            results.append({
+                "name": f"http{endpoint.replace('/', '.')}",
+                "requests": len(endpoint_samples),
+                "per_second": round(len(endpoint_samples) / elapsed, 1),
+                **summarize(endpoint_samples),
+                "statuses": {str(status): count for status, count in statuses[endpoint].items()}
+            })
+    results.append({"name": "ws.connect", "requests": len(connect_samples), **summarize(connect_samples)})
+    if delivered["latencies"]:
+        results.append({
+            "name": "ws.update_delivery",
+            "requests": len(delivered["latencies"]),
+            **summarize(delivered["latencies"]),
+            "missing": delivered["missing"]
+        })
+
+    print_table(
+        f"{args.sessions} sessions x {args.sockets} sockets for {args.duration:g} s, "
+        f"{requests / elapsed:.1f} requests/s ({'fake LLM' if not args.url else args.url})",
+        [{key: value for key, value in row.items() if key != "statuses"} for row in results]
+    )
+    for row in results:
+        if "statuses" in row:
+            print(f"{row['name']} statuses: {row['statuses']}")
+    print(f"updates missed by WebSocket clients: {delivered['missing']}")
+    print(f"server mutations: {server_stats.get('mutations')}")
+
+    if args.json:
+        config = {key: value for key, value in vars(args).items() if key != "json"}
+        write_results(args.json, "load", results, config)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--url", help="Server to load instead of starting one in this process")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--sockets", type=int, default=5, help="WebSocket clients per session, alternately delta and full")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of edits after the first chat")
+    parser.add_argument("--think-ms", type=float, default=100.0, help="Mean pause between a session's requests")
+    parser.add_argument("--first-token-ms", type=float, default=300.0, help="Fake LLM latency to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="Fake LLM token rate")
+    parser.add_argument("--reply-tokens", type=int, default=60, help="Fake LLM reply length")
+    parser.add_argument("--drain", type=float, default=1.0, help="Seconds to wait for broadcasts after the last request")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="Write results to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
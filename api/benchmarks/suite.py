@@ -0,0 +1,147 @@
+"""
+Microbenchmarks for the hot paths, with stable names so runs on
+different commits can be compared (see benchmarks.compare): trip
+planning (packing every time, and served by the plan cache), each
+optimizer action, recomputing a day's timings, and building,
+serializing and parsing trip models. CPU work runs inline so the
+numbers are the algorithms', not the executor's.
+
+Run from the api directory:
+    python -m benchmarks.suite [--json results.json] [--rounds 200] [--filter optimizer]
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("ANTHROPIC_API_KEY", "bench")
+
+from models import TripPlan
+from agents.trip_planner import TripPlannerAgent
+from agents.optimizer import ItineraryOptimizer
+from services.catalog import catalog_registry
+from services.compact_trip import AttractionTable, CompactTrip
+from services.cpu_executor import CPUExecutor
+from services.json_encoding import encode_json
+from services.single_flight import SingleFlight
+from services.timeline import DayTimeline
+from benchmarks.common import build_trip, full_recalculate_day_timings, summarize, print_table, write_results
+
+SEED = 23
+DEFAULT_ROUNDS = 200
+
+
+async def measure(operation, rounds: int, warmup: int = 3) -> dict:
+    """
+    Timings of an operation, awaited if it returns a coroutine
+    """
+    samples = []
+    for i in range(warmup + rounds):
+        start = time.perf_counter()
+        result = operation()
+        if asyncio.iscoroutine(result):
+            await result
+        if i >= warmup:
+            samples.append((time.perf_counter() - start) * 1000)
+    return {"rounds": rounds, **summarize(samples)}
+
+
+def planning_cases(inline: CPUExecutor):
+    fresh = TripPlannerAgent(cache=None, flights=SingleFlight(max_entries=0), executor=inline)
+    cached = TripPlannerAgent(cache=None, executor=inline)
+    for days in (3, 7):
+        preferences = {"destination": "San Francisco", "duration_days": days, "interests": ["food", "culture"]}
+        yield f"plan_trip.packed.{days}d", lambda p=preferences: fresh.plan_trip("Plan a trip", p)
+        yield f"plan_trip.cached.{days}d", lambda p=preferences: cached.plan_trip("Plan a trip", p)
+
+
+def optimizer_cases(inline: CPUExecutor, trip: TripPlan):
+    optimizer = ItineraryOptimizer(executor=inline)
+    rng = random.Random(SEED)
+    day = trip.days[0]
+    ids = [slot.attraction.id for slot in day.time_slots]
+    orders = [rng.sample(ids, len(ids)) for _ in range(16)]
+    counter = iter(range(10 ** 9))
+
+    def reorder_manual():
+        order = orders[next(counter) % len(orders)]
+        return optimizer.apply(trip, "reorder", {"day_number": 1, "new_order": order})
+
+    yield "optimizer.reorder.manual", reorder_manual
+    yield "optimizer.reorder.auto", lambda: optimizer.apply(trip, "reorder", {"day_number": 1, "mode": "auto"})
+    yield "optimizer.remove", lambda: optimizer.apply(trip, "remove", {"day_number": 1, "attraction_id": ids[len(ids) // 2]})
+    yield "optimizer.discover", lambda: optimizer.apply(trip, "discover", {"day_number": 1, "limit": 2})
+
+
+def timing_cases(trip: TripPlan):
+    optimizer = ItineraryOptimizer()
+    day = trip.days[0]
+    order = list(reversed(range(len(day.time_slots))))
+
+    def full_recalculate():
+        copy = day.model_copy(update={"time_slots": [slot.model_copy() for slot in day.time_slots]})
+        full_recalculate_day_timings(optimizer, copy)
+
+    def timeline_reorder():
+        copy = day.model_copy(update={"time_slots": list(day.time_slots)})
+        DayTimeline.of(copy, source=day).reorder(order, optimizer._leg_minutes)
+
+    yield "timings.full_recalculate", full_recalculate
+    yield "timings.timeline_reorder", timeline_reorder
+
+
+def model_cases():
+    for days, slots in ((3, 4), (7, 6), (14, 8)):
+        trip = build_trip(days, slots, seed=SEED)
+        document = trip.model_dump(mode="json")
+        text = trip.model_dump_json()
+        table = AttractionTable()
+        compact = CompactTrip.of(trip, table)
+        shape = f"{days}d{slots}"
+        yield f"model.build.{shape}", lambda d=document: TripPlan.model_validate(d)
+        yield f"model.serialize.{shape}", lambda t=trip: encode_json(t)
+        yield f"model.parse.{shape}", lambda t=text: TripPlan.model_validate_json(t)
+        yield f"model.compact.{shape}", lambda t=trip, a=table: CompactTrip.of(t, a)
+        yield f"model.expand.{shape}", lambda c=compact, a=table: c.expand(a)
+
+
+async def run(args):
+    catalog_registry.load_all()
+    inline = CPUExecutor(kind="inline")
+    trip = await TripPlannerAgent(cache=None, executor=inline).plan_trip(
+        "Plan a trip", {"destination": "San Francisco", "duration_days": 5}
+    )
+
+    groups = (
+        ("Trip planning", planning_cases(inline)),
+        ("Optimizer actions (day 1 of a planned 5-day trip)", optimizer_cases(inline, trip)),
+        ("Recomputing a day's timings after a reorder", timing_cases(trip)),
+        ("Trip models (days x slots per day)", model_cases()),
+    )
+    results = []
+    for title, cases in groups:
+        rows = []
+        for name, operation in cases:
+            if args.filter and args.filter not in name:
+                continue
+            rows.append({"name": name, **await measure(operation, args.rounds)})
+        if rows:
+            print_table(title, rows)
+            results.extend(rows)
+
+    if args.json:
+        write_results(args.json, "micro", results, {"rounds": args.rounds, "filter": args.filter})
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS, help="Timed runs per benchmark")
+    parser.add_argument("--filter", help="Only benchmarks whose name contains this")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
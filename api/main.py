@@ -1,26 +1,91 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict, Any
+from fastapi.responses import StreamingResponse
+from typing import Dict, Any, List, Optional, AsyncIterator, Awaitable, TypeVar, TYPE_CHECKING
 from datetime import datetime
 from contextlib import asynccontextmanager
+from functools import cached_property
 from mangum import Mangum
+import asyncio
+import json
+import os
 
 from models import ChatRequest, ChatResponse, TripPlan
-from agents.trip_planner import TripPlannerAgent
-from agents.chat_agent import ChatAgent
-from agents.optimizer import ItineraryOptimizer
+from agents.chat_pipeline import PipelineResult, StageTimeout
+from services.connection_manager import ConnectionManager, SlowConsumerPolicy, MessageEncoding, encode_message
+from services.session_store import SessionStore, VersionConflict, create_session_store
+from services.session_bus import create_session_bus
+from services.catalog import catalog_registry
+from services.timeline import DayChanges
+from services.trip_sync import TripSyncHub
+from services.llm_stream import buffered, merge_tokens, format_sse
+from services.llm_clients import llm_clients
+from services.model_router import model_router
+from services.json_encoding import EncodedJSON, TripJSONCache, encode_json
+from services.session_actor import SessionActors, SessionBusy
+from services.cpu_executor import ExecutorOverloaded, cpu_executor
+from services.telemetry import TracingMiddleware, metrics, tracer
 
-# Store active connections and trip data in memory
-active_connections: List[WebSocket] = []
-user_trips: Dict[str, TripPlan] = {}
+if TYPE_CHECKING:
+    from agents.chat_agent import ChatAgent
+    from agents.chat_pipeline import ChatPipeline
+    from agents.optimizer import ItineraryOptimizer
+    from agents.trip_planner import TripPlannerAgent
+    from services.response_cache import ResponseCache
+
+# Store active connections and trip data, in memory unless shared with
+# other workers through SESSION_STORE and SESSION_BUS
+session_bus = create_session_bus()
+connection_manager = ConnectionManager(
+    queue_size=int(os.getenv("WS_SEND_QUEUE_SIZE", "64")),
+    policy=SlowConsumerPolicy(os.getenv("WS_SLOW_CONSUMER_POLICY", "drop_oldest")),
+    bus=session_bus
+)
+user_trips: SessionStore = create_session_store()
+
+# Versioned trip state for "delta" WebSocket clients, which get patches
+# instead of the full trip on every change. Versions come from user_trips.
+trip_sync = TripSyncHub(history_size=int(os.getenv("WS_SYNC_HISTORY", "32")))
+DEFAULT_WS_PROTOCOL = os.getenv("WS_PROTOCOL", "delta")
+
+# Each session's current trip serialized once per version, for replies,
+# broadcasts and the initial state of "full" WebSocket clients
+trip_json_cache = TripJSONCache(max_entries=int(os.getenv("SESSION_STORE_MAX_ENTRIES", "10000")))
+
+# Changes to a session's trip are applied one at a time, in order
+session_actors = SessionActors(max_pending=int(os.getenv("SESSION_MAX_PENDING_CHANGES", "64")))
+
+# Events a streaming chat may generate ahead of a slow client
+CHAT_STREAM_BUFFER = int(os.getenv("CHAT_STREAM_BUFFER", "32"))
+
+# How often a running request checks that its client is still connected
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_MS", "100")) / 1000.0
+
+# Seconds a client shed by the CPU executor is asked to wait
+OVERLOAD_RETRY_AFTER_SECONDS = 1
+
+# Times an edit is applied again after another worker changed the trip first
+SESSION_WRITE_ATTEMPTS = 3
+
+T = TypeVar("T")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print("Starting up AI Travel Planner...")
+    # Validate the attraction catalogs and build their indexes once
+    catalog_registry.load_all()
+    cpu_executor.warm_up()
+    await session_bus.start()
     yield
     # Shutdown
     print("Shutting down...")
+    await session_actors.close()
+    await connection_manager.close_all()
+    await session_bus.close()
+    await llm_clients.aclose()
+    app_agents.close()
+    cpu_executor.shutdown()
 
 app = FastAPI(title="AI Travel Planner API", lifespan=lifespan)
 
@@ -33,84 +98,347 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize agents
-chat_agent = ChatAgent()
-trip_planner = TripPlannerAgent()
-optimizer = ItineraryOptimizer()
+# Request and step latencies for /metrics, slow requests for /traces/slow
+app.add_middleware(TracingMiddleware, tracer=tracer)
+
+# Current sizes, read when /metrics is scraped. The session count is
+# fetched just before (see prometheus_metrics): the store may ask Redis.
+stored_sessions = 0
+metrics.gauge("sessions", "Sessions with a stored trip", lambda: stored_sessions)
+metrics.gauge("websocket_connections", "Open WebSocket connections", connection_manager.connection_count)
+metrics.gauge("pending_session_changes", "Edits and replies waiting for their session", lambda: session_actors.stats()["pending"])
+metrics.gauge("cpu_tasks_in_flight", "Tasks queued or running on the CPU executor", lambda: cpu_executor.in_flight)
+
+class AppAgents:
+    """
+    The agents requests are served by, each built (and its module
+    imported) on first use, so importing main loads neither the planner
+    and optimizer nor the numpy-backed services behind them. Assigning
+    an attribute replaces that agent.
+    """
+    
+    @cached_property
+    def response_cache(self) -> Optional["ResponseCache"]:
+        from services.response_cache import response_cache
+        return response_cache
+    
+    @cached_property
+    def chat_agent(self) -> "ChatAgent":
+        from agents.chat_agent import ChatAgent
+        return ChatAgent(cache=self.response_cache)
+    
+    @cached_property
+    def trip_planner(self) -> "TripPlannerAgent":
+        from agents.trip_planner import TripPlannerAgent
+        return TripPlannerAgent(cache=self.response_cache)
+    
+    @cached_property
+    def optimizer(self) -> "ItineraryOptimizer":
+        from agents.optimizer import ItineraryOptimizer
+        return ItineraryOptimizer()
+    
+    @cached_property
+    def chat_pipeline(self) -> "ChatPipeline":
+        # Chat reply and trip planning run concurrently, each with its own deadline
+        from agents.chat_pipeline import ChatPipeline
+        return ChatPipeline(
+            self.chat_agent,
+            self.trip_planner,
+            chat_deadline_ms=float(os.getenv("CHAT_DEADLINE_MS", "30000")),
+            plan_deadline_ms=float(os.getenv("PLAN_DEADLINE_MS", "30000")),
+            speculate=os.getenv("SPECULATIVE_PLANNING", "true").lower() == "true"
+        )
+    
+    def close(self):
+        """
+        Flush the response cache if it was ever loaded
+        """
+        cache = vars(self).get("response_cache")
+        if cache is not None:
+            cache.close()
+
+app_agents = AppAgents()
+
+class ClientDisconnected(Exception):
+    """
+    The HTTP client went away before its request finished
+    """
+
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected(request: Request, exc: ClientDisconnected):
+    # Nobody reads this; 499 is nginx's "client closed request" for the logs
+    return Response(status_code=499)
+
+@app.exception_handler(ExecutorOverloaded)
+async def executor_overloaded(request: Request, exc: ExecutorOverloaded):
+    return json_response(
+        {"detail": "Server busy, try again shortly"},
+        status_code=503,
+        headers={"Retry-After": str(OVERLOAD_RETRY_AFTER_SECONDS)}
+    )
+
+async def unless_disconnected(http_request: Request, work: Awaitable[T]) -> T:
+    """
+    Await work, cancelling it if the client disconnects first. Cancelling
+    drops CPU executor work that hasn't started, so abandoned requests
+    don't hold up the queue.
+    """
+    task = asyncio.ensure_future(work)
+    try:
+        while not await http_request.is_disconnected():
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+        raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
 
 @app.get("/")
 async def root():
     return {"message": "AI Travel Planner API is running"}
 
+@app.get("/stats")
+async def stats():
+    """
+    Session store and WebSocket counters for capacity sizing
+    """
+    return {
+        "sessions": await user_trips.astats(),
+        "connections": connection_manager.stats(),
+        "bus": session_bus.stats(),
+        "sync": trip_sync.stats(),
+        "pipeline": app_agents.chat_pipeline.metrics.stats(),
+        "catalogs": catalog_registry.stats(),
+        "response_cache": app_agents.response_cache.stats() if app_agents.response_cache is not None else None,
+        "llm_clients": llm_clients.stats(),
+        "model_router": model_router.stats(),
+        "planner": app_agents.trip_planner.flights.stats(),
+        "trip_json": trip_json_cache.stats(),
+        "mutations": session_actors.stats(),
+        "cpu_executor": cpu_executor.stats(),
+        "tracing": tracer.stats()
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    Request, step and model call latency histograms, token counts and
+    current sizes in the Prometheus text format
+    """
+    global stored_sessions
+    stored_sessions = await user_trips.alen()
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/traces/slow")
+async def slow_traces():
+    """
+    Span trees of the latest requests slower than TRACE_SLOW_MS
+    """
+    return {"slow_ms": tracer.slow_ms, "traces": list(tracer.slow_traces)}
+
+@app.post("/catalogs/reload")
+async def reload_catalogs(force: bool = False):
+    """
+    Pick up edited catalog files without restarting or blocking requests
+    """
+    return {"reloaded": await catalog_registry.reload(force=force)}
+
 @app.post("/chat")
-async def chat(request: ChatRequest) -> ChatResponse:
+async def chat(request: ChatRequest, http_request: Request) -> ChatResponse:
     """
     Main chat endpoint that processes user messages and returns both
     conversational responses and trip planning data
     """
     # Get or create user session
     session_id = request.session_id or "default"
+    current_trip = await user_trips.aget(session_id)
+    
+    # Reply and, if needed, plan the trip (see ChatPipeline)
+    try:
+        result = await unless_disconnected(http_request, app_agents.chat_pipeline.run(
+            message=request.message,
+            context=request.context,
+            current_trip=current_trip
+        ))
+    except StageTimeout as exc:
+        raise HTTPException(status_code=504, detail=str(exc))
+    
+    try:
+        reply = await finish_chat(session_id, result)
+    except SessionBusy as exc:
+        raise HTTPException(status_code=429, detail=str(exc))
     
-    # Process message with chat agent
-    chat_response = await chat_agent.process_message(
-        message=request.message,
-        context=request.context,
-        current_trip=user_trips.get(session_id)
+    return json_response(reply, headers={"Server-Timing": result.server_timing()})
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Streaming /chat as Server-Sent Events: chat_token events as the reply
+    is generated, a trip_day event as each day of a new plan is final,
+    then chat_done with the same ChatResponse /chat returns
+    """
+    session_id = request.session_id or "default"
+    events = buffered(
+        stream_chat(session_id, request.message, request.context),
+        max_pending=CHAT_STREAM_BUFFER,
+        coalesce=merge_tokens
     )
     
-    # If trip planning is needed, invoke trip planner
-    trip_plan = None
-    if chat_response.requires_planning:
-        trip_plan = await trip_planner.plan_trip(
-            user_input=request.message,
-            preferences=chat_response.extracted_preferences,
-            current_trip=user_trips.get(session_id)
-        )
-        user_trips[session_id] = trip_plan
-    
-    # Build response
-    response = ChatResponse(
-        text=chat_response.text,
-        trip_plan=trip_plan,
-        session_id=session_id,
-        timestamp=datetime.now()
+    async def frames():
+        async for event in events:
+            yield format_sse(event, encode_message)
+    
+    return StreamingResponse(
+        frames(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
+
+async def stream_chat(session_id: str, message: str, context: Optional[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    The /chat pipeline as a stream of events. The finished reply is stored
+    and broadcast to the session's other clients exactly as /chat does.
+    """
+    current_trip = await user_trips.aget(session_id)
     
-    # Broadcast updates to all connected clients
-    await broadcast_update(response.dict())
+    result = None
+    try:
+        async for event in app_agents.chat_pipeline.events(message=message, context=context, current_trip=current_trip):
+            if event["type"] == "chat_token":
+                yield event
+            elif event["type"] == "trip_day":
+                yield {"type": "trip_day", "day": event["day"]}
+            else:
+                result = event["result"]
+    except StageTimeout as exc:
+        yield {"type": "chat_error", "stage": exc.stage, "detail": str(exc)}
+        return
+    except ExecutorOverloaded as exc:
+        yield {"type": "chat_error", "stage": "plan", "detail": str(exc)}
+        return
+    
+    try:
+        reply = await finish_chat(session_id, result)
+    except SessionBusy as exc:
+        yield {"type": "chat_error", "stage": "store", "detail": str(exc)}
+        return
+    yield {"type": "chat_done", "response": reply, "timings_ms": result.timings_ms}
+
+async def finish_chat(session_id: str, result: PipelineResult) -> EncodedJSON:
+    """
+    Store the reply's trip and broadcast the reply to the clients of its
+    session, as one change to the session after those already queued.
+    Delta clients get the reply without the trip, then the trip as a
+    snapshot or patch. Returns the reply as JSON, encoded once with its
+    trip for the HTTP response and every "full" client.
+    """
+    async def commit() -> EncodedJSON:
+        trip_plan = result.trip_plan
+        trip_json = None
+        update = None
+        if trip_plan is not None:
+            version = await user_trips.aset(session_id, trip_plan)
+            with tracer.span("serialize.trip"):
+                trip_json = EncodedJSON.of(trip_plan)
+            update = record_trip(session_id, trip_plan, version, encoded=trip_json)
+        else:
+            version = await user_trips.aversion(session_id)
+        
+        response = ChatResponse(
+            text=result.chat_response.text,
+            trip_plan=trip_plan,
+            session_id=session_id,
+            timestamp=datetime.now(),
+            version=version
+        )
+        reply = EncodedJSON.of({
+            **{name: getattr(response, name) for name in ChatResponse.model_fields},
+            "trip_plan": trip_json
+        })
+        await connection_manager.broadcast(
+            session_id,
+            response.model_dump(exclude={"trip_plan"}),
+            by_protocol={"full": lambda: reply}
+        )
+        if update is not None:
+            await connection_manager.broadcast(session_id, update, by_protocol={"full": None})
+        return reply
     
-    return response
+    return await session_actors.submit(session_id, commit)
+
+def json_response(data: Any, status_code: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    A JSON response from data that may contain EncodedJSON parts, sent as is
+    """
+    return Response(content=encode_json(data), status_code=status_code, headers=headers, media_type="application/json")
 
 @app.post("/optimize")
-async def optimize_itinerary(request: Dict[str, Any]):
+async def optimize_itinerary(request: Dict[str, Any], http_request: Request):
     """
     Endpoint to re-optimize the itinerary when user makes changes
     """
     session_id = request.get("session_id", "default")
     action = request.get("action")  # "reorder", "remove", "discover"
     data = request.get("data")
+    # Version the client's edit was made against, if it wants conflicts reported
+    try:
+        expected_version = int(request["version"]) if request.get("version") is not None else None
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="version must be an integer")
     
-    current_trip = user_trips.get(session_id)
-    if not current_trip:
-        return {"error": "No trip found for session"}
-    
-    # Optimize based on action
-    optimized_trip = await optimizer.optimize(
-        trip=current_trip,
-        action=action,
-        action_data=data
-    )
-    
-    user_trips[session_id] = optimized_trip
-    
-    # Broadcast updated trip
-    await broadcast_update({
-        "type": "trip_update",
-        "trip_plan": optimized_trip.dict(),
-        "session_id": session_id
-    })
+    async def mutate():
+        for _ in range(SESSION_WRITE_ATTEMPTS):
+            current_trip, version = await user_trips.aget_versioned(session_id)
+            if not current_trip:
+                return 200, {"error": "No trip found for session"}
+            
+            if expected_version is not None and expected_version != version:
+                return 409, {"error": "Trip changed since the edited version", "version": version}
+            
+            # Optimize based on action, unless the client gave up while this waited
+            result = await unless_disconnected(http_request, app_agents.optimizer.apply(
+                trip=current_trip,
+                action=action,
+                action_data=data
+            ))
+            optimized_trip = result.trip
+            changes = result.changes
+            
+            if not changes:
+                # Nothing to store or tell the other clients: the version stays
+                with tracer.span("serialize.trip"):
+                    trip_json = EncodedJSON.of(current_trip)
+                return 200, {"success": True, "trip_plan": trip_json, "changes": changes, "version": version}
+            
+            try:
+                version = await user_trips.aset(session_id, optimized_trip, expected_version=version)
+            except VersionConflict:
+                # Another worker changed the trip meanwhile: apply the edit to its version
+                continue
+            
+            # Broadcast updated trip, serialized once for the clients and the reply
+            with tracer.span("serialize.trip"):
+                trip_json = EncodedJSON.of(optimized_trip)
+            await publish_trip(session_id, optimized_trip, version, changes, encoded=trip_json, previous=current_trip, full_message=lambda: {
+                "type": "trip_update",
+                "trip_plan": trip_json,
+                "changes": changes,
+                "session_id": session_id
+            })
+            return 200, {"success": True, "trip_plan": trip_json, "changes": changes, "version": version}
+        return 409, {"error": "Trip kept changing, try again", "version": await user_trips.aversion(session_id)}
     
-    return {"success": True, "trip_plan": optimized_trip}
+    # A reorder gives the whole order of a day, so one still waiting is
+    # replaced by the next reorder of the same day
+    coalesce_key = None
+    if action == "reorder" and isinstance(data, dict):
+        coalesce_key = ("reorder", data.get("day_number"))
+    try:
+        status_code, body = await session_actors.submit(session_id, mutate, coalesce_key=coalesce_key)
+    except SessionBusy as exc:
+        raise HTTPException(status_code=429, detail=str(exc))
+    return json_response(body, status_code=status_code)
 
 @app.websocket("/ws/{session_id}")
 async def websocket_endpoint(websocket: WebSocket, session_id: str):
@@ -118,34 +446,122 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
     WebSocket endpoint for real-time updates
     """
     await websocket.accept()
-    active_connections.append(websocket)
+    protocol = websocket.query_params.get("protocol", DEFAULT_WS_PROTOCOL)
+    encoding = websocket.query_params.get("encoding", MessageEncoding.JSON)
+    if protocol not in ("delta", "full") or encoding not in set(MessageEncoding):
+        await websocket.close(code=1003)
+        return
+    connection = await connection_manager.connect(session_id, websocket, protocol=protocol, encoding=encoding)
+    chat_task: Optional[asyncio.Task] = None
     
     try:
         # Send current trip data if exists
-        if session_id in user_trips:
-            await websocket.send_json({
+        current_trip, version = await user_trips.aget_versioned(session_id)
+        if current_trip and protocol == "delta":
+            await connection.send(trip_sync.snapshot(session_id, current_trip, version))
+        elif current_trip:
+            trip_json = trip_json_cache.get(session_id, current_trip.id, version)
+            await connection.send({
                 "type": "initial_state",
-                "trip_plan": user_trips[session_id].dict()
+                "trip_plan": trip_json or current_trip
             })
         
         while True:
             # Keep connection alive and handle any incoming messages
             data = await websocket.receive_text()
-            # Process any real-time requests here
+            message = parse_client_message(data)
+            if message.get("type") == "chat" and message.get("message"):
+                # One streamed reply at a time per connection; a new message replaces it
+                if chat_task is not None:
+                    chat_task.cancel()
+                chat_task = asyncio.create_task(stream_chat_to(connection, message["message"], message.get("context")))
+            elif protocol == "delta":
+                await handle_sync_message(connection, message)
             
     except WebSocketDisconnect:
-        active_connections.remove(websocket)
+        pass
+    finally:
+        if chat_task is not None:
+            chat_task.cancel()
+        trip_sync.forget_connection(session_id, id(connection))
+        await connection_manager.disconnect(connection)
+
+def parse_client_message(data: str) -> Dict[str, Any]:
+    try:
+        message = json.loads(data)
+    except ValueError:
+        return {}
+    return message if isinstance(message, dict) else {}
+
+async def stream_chat_to(connection, message: str, context: Optional[Dict[str, Any]]):
+    """
+    Stream a chat reply to one WebSocket client ({"type": "chat", "message": ...}),
+    waiting for room in its send queue rather than dropping tokens
+    """
+    events = buffered(
+        stream_chat(connection.session_id, message, context),
+        max_pending=CHAT_STREAM_BUFFER,
+        coalesce=merge_tokens
+    )
+    async for event in events:
+        if not await connection.send_wait(event):
+            break
+
+async def handle_sync_message(connection, message: Dict[str, Any]):
+    """
+    Delta clients acknowledge each version they apply ({"type": "ack", "version": n})
+    and ask to be caught up when they see a version gap ({"type": "resync", "version": n})
+    """
+    try:
+        kind, version = message.get("type"), int(message.get("version", 0))
+    except (ValueError, TypeError):
+        return
+    
+    if kind == "ack":
+        trip_sync.acknowledge(connection.session_id, id(connection), version)
+    elif kind == "resync":
+        trip, current = await user_trips.aget_versioned(connection.session_id)
+        update = trip_sync.catch_up(connection.session_id, version, trip, current)
+        if update is not None:
+            await connection.send(update)
+
+async def publish_trip(
+    session_id: str,
+    trip: TripPlan,
+    version: int,
+    changes: Optional[List[DayChanges]] = None,
+    full_message=None,
+    encoded: Optional[EncodedJSON] = None,
+    previous: Optional[TripPlan] = None
+):
+    """
+    Record the version of the session's trip just stored and send it to
+    the clients: a patch (or snapshot) to delta clients, full_message to
+    the others
+    """
+    update = record_trip(session_id, trip, version, changes, encoded, previous)
+    await connection_manager.broadcast(session_id, update, by_protocol={"full": full_message})
 
-async def broadcast_update(data: Dict[str, Any]):
+def record_trip(
+    session_id: str,
+    trip: TripPlan,
+    version: int,
+    changes: Optional[List[DayChanges]] = None,
+    encoded: Optional[EncodedJSON] = None,
+    previous: Optional[TripPlan] = None
+) -> Dict[str, Any]:
     """
-    Broadcast updates to all connected WebSocket clients
+    Record the version of the session's trip just stored and return the
+    message for its delta clients. encoded is the trip's JSON if the
+    caller already has it, kept for this version; previous is the trip it
+    replaced, which the patch is computed from if this worker didn't
+    record that version.
     """
-    for connection in active_connections:
-        try:
-            await connection.send_json(data)
-        except:
-            # Remove dead connections
-            active_connections.remove(connection)
+    with tracer.span("sync.update"):
+        update = trip_sync.update(session_id, trip, changes, version=version, previous=previous)
+    if encoded is not None:
+        trip_json_cache.put(session_id, trip.id, version, encoded)
+    return update
 
 handler = Mangum(app, lifespan="off")
 
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 from typing import List, Optional, Dict, Any
 from datetime import datetime, time
 from enum import Enum
@@ -33,6 +33,8 @@ class Attraction(BaseModel):
     phone: Optional[str] = None
     website: Optional[str] = None
     google_maps_url: Optional[str] = None
+    # opening_hours parsed by services.opening_hours.weekly_hours, never serialized
+    _weekly_hours: Any = PrivateAttr(default=None)
 
 class TimeSlot(BaseModel):
     start_time: time
@@ -48,6 +50,8 @@ class DayItinerary(BaseModel):
     total_cost: float = 0.0
     total_duration_minutes: int = 0
     color_code: str = "#3B82F6"  # Default blue
+    # Prefix sums kept by services.timeline.DayTimeline, never serialized
+    _timeline: Any = PrivateAttr(default=None)
 
 class TripPlan(BaseModel):
     id: str
@@ -71,6 +75,8 @@ class ChatResponse(BaseModel):
     session_id: str
     timestamp: datetime
     suggestions: List[str] = []
+    # Trip version after this reply, to send back with /optimize edits
+    version: Optional[int] = None
     
 
 class OptimizationRequest(BaseModel):
@@ -0,0 +1,201 @@
+from typing import Dict, List, Optional, Tuple
+from types import MappingProxyType
+from pydantic import BaseModel, TypeAdapter
+import asyncio
+import os
+import re
+import threading
+
+from models import Attraction, AttractionType
+from services.spatial_index import AttractionIndex
+from services.opening_hours import weekly_hours
+
+# Catalog files shipped with the API, one JSON document per destination
+DEFAULT_CATALOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "catalogs")
+
+DEFAULT_DESTINATION = "San Francisco"
+
+
+class CatalogFile(BaseModel):
+    destination: str
+    aliases: List[str] = []
+    attractions: List[Attraction]
+
+
+_catalog_file_adapter = TypeAdapter(CatalogFile)
+
+
+def normalize_destination(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", name.lower()).strip()
+
+
+class AttractionCatalog:
+    """
+    Validated, read-only attractions for one destination.
+    A catalog is never modified after loading; a reload builds a new one
+    and swaps it in, so requests holding the old one are unaffected.
+    """
+
+    def __init__(self, destination: str, attractions: List[Attraction], aliases: List[str], source_mtime: float = 0.0):
+        self.destination = destination
+        self.aliases = tuple(aliases)
+        self.source_mtime = source_mtime
+        self.attractions: Tuple[Attraction, ...] = tuple(attractions)
+        self.by_id = MappingProxyType({attraction.id: attraction for attraction in self.attractions})
+        by_type: Dict[AttractionType, List[Attraction]] = {}
+        for attraction in self.attractions:
+            by_type.setdefault(attraction.type, []).append(attraction)
+            # Parse opening hours now rather than on a request's first scheduling pass
+            weekly_hours(attraction)
+        self.by_type = MappingProxyType({key: tuple(value) for key, value in by_type.items()})
+        self.index = AttractionIndex(self.attractions)
+
+    def __len__(self) -> int:
+        return len(self.attractions)
+
+    def get(self, attraction_id: str) -> Optional[Attraction]:
+        return self.by_id.get(attraction_id)
+
+
+def load_catalog_file(path: str) -> AttractionCatalog:
+    """
+    Parse and validate a catalog file in a single pydantic-core pass
+    """
+    mtime = os.path.getmtime(path)
+    with open(path, "rb") as f:
+        document = _catalog_file_adapter.validate_json(f.read())
+    return AttractionCatalog(
+        destination=document.destination,
+        attractions=document.attractions,
+        aliases=document.aliases,
+        source_mtime=mtime
+    )
+
+
+class CatalogRegistry:
+    """
+    Catalogs for every destination found in the catalog directory,
+    loaded lazily on first use and shared by all requests
+    """
+
+    def __init__(self, catalog_dir: str = DEFAULT_CATALOG_DIR, default_destination: str = DEFAULT_DESTINATION):
+        self.catalog_dir = catalog_dir
+        self.default_destination = default_destination
+        self._catalogs: Dict[str, AttractionCatalog] = {}
+        self._paths: Dict[str, str] = {}
+        self._aliases: Dict[str, str] = {}
+        self._load_lock = threading.Lock()
+        self._scanned = False
+        self._all_loaded = False
+        # Bumped whenever a catalog is installed, so derived indexes know to rebuild
+        self.generation = 0
+
+    def _scan(self):
+        """
+        Map file names and destination aliases to catalog files
+        """
+        paths: Dict[str, str] = {}
+        if os.path.isdir(self.catalog_dir):
+            for name in sorted(os.listdir(self.catalog_dir)):
+                if name.endswith(".json"):
+                    key = normalize_destination(name[:-len(".json")])
+                    paths[key] = os.path.join(self.catalog_dir, name)
+        self._paths = paths
+        self._scanned = True
+
+    def _resolve(self, destination: Optional[str]) -> Optional[str]:
+        key = normalize_destination(destination or self.default_destination)
+        if key in self._paths:
+            return key
+        return self._aliases.get(key)
+
+    def get(self, destination: Optional[str] = None) -> AttractionCatalog:
+        """
+        Catalog for a destination (or one of its aliases). Unknown
+        destinations fall back to the default destination's catalog.
+        """
+        if not self._scanned:
+            with self._load_lock:
+                if not self._scanned:
+                    self._scan()
+
+        key = self._resolve(destination)
+        if key is None and not self._all_loaded:
+            # Aliases are only known once catalogs are loaded
+            self.load_all()
+            key = self._resolve(destination)
+        if key is None:
+            key = self._resolve(self.default_destination)
+        if key is None:
+            raise KeyError(f"No attraction catalog for {destination!r}")
+
+        catalog = self._catalogs.get(key)
+        if catalog is None:
+            with self._load_lock:
+                catalog = self._catalogs.get(key)
+                if catalog is None:
+                    catalog = self._install(key, load_catalog_file(self._paths[key]))
+        return catalog
+
+    def get_version(self, destination: Optional[str], source_mtime: float) -> AttractionCatalog:
+        """
+        Catalog for a destination, re-read from disk if the one loaded here
+        predates source_mtime. Worker processes use this to catch up with
+        reloads made in the server process.
+        """
+        catalog = self.get(destination)
+        if catalog.source_mtime < source_mtime:
+            key = self._resolve(catalog.destination)
+            with self._load_lock:
+                catalog = self._catalogs[key]
+                if catalog.source_mtime < source_mtime:
+                    catalog = self._install(key, load_catalog_file(self._paths[key]))
+        return catalog
+
+    def _install(self, key: str, catalog: AttractionCatalog) -> AttractionCatalog:
+        self._catalogs[key] = catalog
+        for alias in (catalog.destination, *catalog.aliases):
+            self._aliases[normalize_destination(alias)] = key
+        self.generation += 1
+        return catalog
+
+    def destinations(self) -> Dict[str, Tuple[str, ...]]:
+        """
+        Every destination with its aliases, loading all catalogs if needed
+        """
+        if not self._all_loaded:
+            self.load_all()
+        return {catalog.destination: catalog.aliases for catalog in self._catalogs.values()}
+
+    def load_all(self):
+        with self._load_lock:
+            self._scan()
+            for key, path in self._paths.items():
+                if key not in self._catalogs:
+                    self._install(key, load_catalog_file(path))
+            self._all_loaded = True
+
+    async def reload(self, force: bool = False) -> List[str]:
+        """
+        Re-read catalog files that changed on disk. Parsing happens in a
+        worker thread and each catalog is swapped in with a single
+        assignment, so requests keep being served from the old version
+        until the new one is ready. Returns the reloaded destinations.
+        """
+        self._scan()
+        reloaded = []
+        for key, path in list(self._paths.items()):
+            current = self._catalogs.get(key)
+            if not force and current is not None and os.path.getmtime(path) <= current.source_mtime:
+                continue
+            catalog = await asyncio.to_thread(load_catalog_file, path)
+            self._install(key, catalog)
+            reloaded.append(catalog.destination)
+        return reloaded
+
+    def stats(self) -> Dict[str, int]:
+        return {catalog.destination: len(catalog) for catalog in self._catalogs.values()}
+
+
+# Shared by the planner and the optimizer
+catalog_registry = CatalogRegistry(os.getenv("CATALOG_DIR", DEFAULT_CATALOG_DIR))
@@ -0,0 +1,245 @@
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+from datetime import datetime, time
+from functools import lru_cache
+from itertools import count
+import sys
+import threading
+
+from pydantic import BaseModel
+
+from models import TripPlan, DayItinerary, TimeSlot, Attraction
+
+_set = object.__setattr__
+
+
+@lru_cache(maxsize=None)
+def trusted_constructor(model: Type[BaseModel]) -> Callable[[Dict[str, Any]], BaseModel]:
+    """
+    Build instances of model from a dict holding every field, without
+    validation. For data that came out of a validated model of the same
+    class; the dict becomes the instance's __dict__. Does what
+    model_construct does minus the per-call field scan, which in pydantic
+    2.5 makes model_construct slower than validating.
+    """
+    names = frozenset(model.model_fields)
+    private = {name: attribute.get_default() for name, attribute in model.__private_attributes__.items()}
+
+    def construct(values: Dict[str, Any]) -> BaseModel:
+        instance = model.__new__(model)
+        _set(instance, "__dict__", values)
+        _set(instance, "__pydantic_fields_set__", set(names))
+        _set(instance, "__pydantic_extra__", None)
+        _set(instance, "__pydantic_private__", dict(private) if private else None)
+        return instance
+
+    return construct
+
+
+# (destination, attraction id, version)
+AttractionKey = Tuple[str, str, int]
+
+
+class AttractionTable:
+    """
+    Attractions shared by compact trips, keyed by destination, id and
+    version: catalogs of different destinations may reuse ids, and after a
+    catalog reload changes an attraction, trips stored before it keep the
+    details they were planned with. Attractions are never modified after
+    validation (catalog ones are already shared by all requests), so one
+    object per key serves every trip. Each stored trip holds a reference
+    to the keys it uses and entries are dropped once no trip does, so
+    superseded versions go away with the trips that use them.
+    """
+
+    def __init__(self):
+        # key -> [attraction, trips referencing it]
+        self._entries: Dict[AttractionKey, list] = {}
+        # (destination, id) -> key of the newest version
+        self._latest: Dict[Tuple[str, str], AttractionKey] = {}
+        self._versions = count(1)
+        self._lock = threading.Lock()
+
+    def intern(self, destination: str, attraction: Attraction) -> AttractionKey:
+        """
+        The key for attraction, holding a reference to it until release()
+        """
+        name = (destination, attraction.id)
+        with self._lock:
+            key = self._latest.get(name)
+            entry = self._entries.get(key) if key is not None else None
+            if entry is None or (entry[0] is not attraction and entry[0] != attraction):
+                key = (sys.intern(destination), sys.intern(attraction.id), next(self._versions))
+                entry = self._entries[key] = [attraction, 0]
+                self._latest[name] = key
+            entry[1] += 1
+            return key
+
+    def release(self, key: AttractionKey):
+        with self._lock:
+            entry = self._entries[key]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._entries[key]
+                if self._latest.get(key[:2]) == key:
+                    del self._latest[key[:2]]
+
+    def __getitem__(self, key: AttractionKey) -> Attraction:
+        return self._entries[key][0]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Clock times repeat across trips (every day starts at 9:00), so one object each
+_TIMES: Dict[time, time] = {}
+
+
+def _intern_time(value: time) -> time:
+    return _TIMES.setdefault(value, value)
+
+
+def _intern_text(value: Optional[str]) -> Optional[str]:
+    # Notes are generated from templates ("Don't miss the ...!") and repeat
+    return sys.intern(value) if value is not None else None
+
+
+class CompactSlot:
+    __slots__ = ("attraction", "start_time", "end_time", "travel_time_minutes", "notes")
+
+    def __init__(self, attraction: AttractionKey, start_time: time, end_time: time, travel_time_minutes: int, notes: Optional[str]):
+        self.attraction = attraction
+        self.start_time = start_time
+        self.end_time = end_time
+        self.travel_time_minutes = travel_time_minutes
+        self.notes = notes
+
+
+_SLOT_BYTES = sys.getsizeof(CompactSlot.__new__(CompactSlot))
+
+
+class CompactDay:
+    __slots__ = ("day_number", "date", "slots", "total_cost", "total_duration_minutes", "color_code")
+
+    def __init__(
+        self,
+        day_number: int,
+        date: datetime,
+        slots: Tuple[CompactSlot, ...],
+        total_cost: float,
+        total_duration_minutes: int,
+        color_code: str
+    ):
+        self.day_number = day_number
+        self.date = date
+        self.slots = slots
+        self.total_cost = total_cost
+        self.total_duration_minutes = total_duration_minutes
+        self.color_code = color_code
+
+
+class CompactTrip:
+    """
+    A TripPlan as slotted objects and tuples, with slots referencing their
+    attraction by its AttractionTable key instead of embedding it.
+    Immutable by convention; expand() builds a fresh TripPlan the caller
+    may change, and release() gives back the attraction references once
+    the trip is no longer kept.
+    """
+    __slots__ = (
+        "id", "destination", "start_date", "end_date", "days", "total_cost",
+        "notes", "created_at", "updated_at", "nbytes"
+    )
+
+    @classmethod
+    def of(cls, trip: TripPlan, attractions: AttractionTable) -> "CompactTrip":
+        compact = cls.__new__(cls)
+        compact.id = trip.id
+        compact.destination = sys.intern(trip.destination)
+        compact.start_date = trip.start_date
+        compact.end_date = trip.end_date
+        compact.days = tuple(
+            CompactDay(
+                day.day_number,
+                day.date,
+                tuple(
+                    CompactSlot(
+                        attractions.intern(compact.destination, slot.attraction),
+                        _intern_time(slot.start_time),
+                        _intern_time(slot.end_time),
+                        slot.travel_time_minutes,
+                        _intern_text(slot.notes)
+                    )
+                    for slot in day.time_slots
+                ),
+                day.total_cost,
+                day.total_duration_minutes,
+                sys.intern(day.color_code)
+            )
+            for day in trip.days
+        )
+        compact.total_cost = trip.total_cost
+        compact.notes = _intern_text(trip.notes)
+        compact.created_at = trip.created_at
+        compact.updated_at = trip.updated_at
+        compact.nbytes = compact._size()
+        return compact
+
+    def _size(self) -> int:
+        """
+        Bytes held by this trip alone, leaving out the attractions, interned
+        strings and clock times it shares with other trips
+        """
+        size = sys.getsizeof(self) + sys.getsizeof(self.id) + sys.getsizeof(self.days)
+        size += sys.getsizeof(self.start_date) + sys.getsizeof(self.end_date) + sys.getsizeof(self.total_cost)
+        for day in self.days:
+            size += sys.getsizeof(day) + sys.getsizeof(day.date) + sys.getsizeof(day.slots)
+            size += sys.getsizeof(day.total_cost) + len(day.slots) * _SLOT_BYTES
+        return size
+
+    def release(self, attractions: AttractionTable):
+        for day in self.days:
+            for slot in day.slots:
+                attractions.release(slot.attraction)
+
+    def expand(self, attractions: AttractionTable) -> TripPlan:
+        """
+        The TripPlan, built without validation: every value was validated
+        on the way in
+        """
+        new_slot = trusted_constructor(TimeSlot)
+        new_day = trusted_constructor(DayItinerary)
+        days = [
+            new_day({
+                "day_number": day.day_number,
+                "date": day.date,
+                "time_slots": [
+                    new_slot({
+                        "start_time": slot.start_time,
+                        "end_time": slot.end_time,
+                        "attraction": attractions[slot.attraction],
+                        "travel_time_minutes": slot.travel_time_minutes,
+                        "notes": slot.notes
+                    })
+                    for slot in day.slots
+                ],
+                "total_cost": day.total_cost,
+                "total_duration_minutes": day.total_duration_minutes,
+                "color_code": day.color_code
+            })
+            for day in self.days
+        ]
+        return trusted_constructor(TripPlan)({
+            "id": self.id,
+            "destination": self.destination,
+            "start_date": self.start_date,
+            "end_date": self.end_date,
+            "days": days,
+            "total_cost": self.total_cost,
+            "notes": self.notes,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
+        })
+
+
+# Shared by the in-process session store and anything else keeping compact trips
+attraction_table = AttractionTable()
@@ -0,0 +1,306 @@
+from typing import Dict, Any, Optional, Set, Callable, Tuple, Union
+from enum import Enum
+import asyncio
+import zlib
+
+from services.json_encoding import EncodedJSON, encode_json
+from services.session_bus import ByProtocol, LocalBus, SessionBus
+from services.telemetry import tracer
+
+
+class SlowConsumerPolicy(str, Enum):
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+    CLOSE = "close"
+
+
+class MessageEncoding(str, Enum):
+    JSON = "json"  # Text frames
+    ZLIB = "zlib"  # Binary frames of zlib-compressed JSON
+
+
+# Encoded message as it goes on the wire: text or binary frame
+Payload = Union[str, bytes]
+
+
+def encode_message(data: Any) -> str:
+    """
+    Serialize a broadcast payload to JSON text once so it can be shared by every socket
+    """
+    if isinstance(data, EncodedJSON):
+        return data.text
+    return encode_json(data).decode("utf-8")
+
+
+def encode_payload(data: Any, encoding: MessageEncoding = MessageEncoding.JSON) -> Payload:
+    if encoding == MessageEncoding.ZLIB:
+        if isinstance(data, EncodedJSON):
+            return data.compressed
+        return zlib.compress(encode_json(data))
+    return encode_message(data)
+
+
+class ClientConnection:
+    """
+    A single WebSocket client with its own bounded outbound queue.
+    A dedicated writer task drains the queue so a slow client never
+    blocks the broadcaster or the other clients of the session.
+    """
+
+    def __init__(
+        self,
+        websocket: Any,
+        session_id: str,
+        queue_size: int,
+        policy: SlowConsumerPolicy,
+        on_close: Callable[["ClientConnection"], None],
+        protocol: str = "full",
+        encoding: MessageEncoding = MessageEncoding.JSON
+    ):
+        self.websocket = websocket
+        self.session_id = session_id
+        self.policy = policy
+        # Which kind of trip updates the client understands, see ConnectionManager.broadcast
+        self.protocol = protocol
+        self.encoding = encoding
+        self.closed = False
+        self.dropped = 0
+        self._on_close = on_close
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._closer: Optional[asyncio.Task] = None
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def enqueue(self, payload: Payload) -> bool:
+        """
+        Queue an already-encoded message without awaiting the socket.
+        Returns False if the message was not delivered to the queue.
+        """
+        if self.closed:
+            return False
+
+        try:
+            self._queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        if self.policy == SlowConsumerPolicy.DROP_OLDEST:
+            self._queue.get_nowait()
+            self._queue.put_nowait(payload)
+            self.dropped += 1
+            return True
+        if self.policy == SlowConsumerPolicy.DROP_NEWEST:
+            self.dropped += 1
+            return False
+
+        # Close policy: the client fell too far behind, disconnect it
+        self.dropped += 1
+        self._shutdown(close_code=1013)
+        return False
+
+    async def send(self, data: Any) -> bool:
+        """
+        Encode and queue a message for this client only
+        """
+        return self.enqueue(encode_payload(data, self.encoding))
+
+    async def send_wait(self, data: Any) -> bool:
+        """
+        Encode and queue a message for this client, waiting for room in
+        the queue instead of applying the slow-consumer policy. For
+        streams that must not lose messages and should slow down instead.
+        """
+        if self.closed:
+            return False
+        await self._queue.put(encode_payload(data, self.encoding))
+        return not self.closed
+
+    async def close(self, close_code: int = 1000):
+        self._shutdown(close_code=close_code)
+        await self.wait_closed()
+
+    async def wait_closed(self):
+        """
+        Wait for the writer task (and any pending close frame) to finish
+        """
+        tasks = [task for task in (self._writer, self._closer) if task is not None]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _shutdown(self, close_code: Optional[int] = None):
+        if self.closed:
+            return
+        self.closed = True
+        self._on_close(self)
+
+        current = asyncio.current_task()
+        if self._writer is not current:
+            self._writer.cancel()
+        if close_code is not None:
+            self._closer = asyncio.create_task(self._close_socket(close_code))
+
+    async def _close_socket(self, close_code: int):
+        try:
+            await self.websocket.close(code=close_code)
+        except Exception:
+            # Socket is already gone
+            pass
+
+    async def _write_loop(self):
+        try:
+            while True:
+                payload = await self._queue.get()
+                if isinstance(payload, bytes):
+                    await self.websocket.send_bytes(payload)
+                else:
+                    await self.websocket.send_text(payload)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # Dead connection
+            self._shutdown(close_code=None)
+
+
+class ConnectionManager:
+    """
+    Registry of WebSocket clients keyed by session id.
+    Broadcasts are encoded once and fanned out to the session's
+    per-connection queues without awaiting any individual socket.
+    They travel through the bus, which with several workers carries them
+    to the clients connected to the other workers.
+    """
+
+    def __init__(
+        self,
+        queue_size: int = 64,
+        policy: SlowConsumerPolicy = SlowConsumerPolicy.DROP_OLDEST,
+        bus: Optional[SessionBus] = None
+    ):
+        self.queue_size = queue_size
+        self.policy = policy
+        self.bus = bus if bus is not None else LocalBus()
+        self.bus.attach(self.deliver)
+        self._sessions: Dict[str, Set[ClientConnection]] = {}
+        self.messages_sent = 0
+        self.messages_dropped = 0
+
+    async def connect(
+        self,
+        session_id: str,
+        websocket: Any,
+        protocol: str = "full",
+        encoding: MessageEncoding = MessageEncoding.JSON
+    ) -> ClientConnection:
+        """
+        Register an accepted WebSocket under its session, returning once
+        the bus delivers the session's broadcasts to this worker
+        """
+        connection = ClientConnection(
+            websocket=websocket,
+            session_id=session_id,
+            queue_size=self.queue_size,
+            policy=self.policy,
+            on_close=self._remove,
+            protocol=protocol,
+            encoding=MessageEncoding(encoding)
+        )
+        self._sessions.setdefault(session_id, set()).add(connection)
+        await self.bus.subscribe(session_id)
+        return connection
+
+    async def disconnect(self, connection: ClientConnection):
+        connection._shutdown(close_code=None)
+        await connection.wait_closed()
+
+    def _remove(self, connection: ClientConnection):
+        self.messages_dropped += connection.dropped
+        connections = self._sessions.get(connection.session_id)
+        if connections is None:
+            return
+        connections.discard(connection)
+        if not connections:
+            del self._sessions[connection.session_id]
+            self.bus.unsubscribe(connection.session_id)
+
+    async def broadcast(
+        self,
+        session_id: str,
+        data: Any,
+        by_protocol: Optional[ByProtocol] = None
+    ) -> int:
+        """
+        Send a message to every client of a session.
+        Clients whose protocol is in by_protocol get what that builder
+        returns instead (nothing if it is None); each builder runs and each
+        message is encoded at most once per encoding.
+        Returns the number of clients the message was queued for, or with
+        a shared bus the number of workers it reached.
+        """
+        return await self.bus.publish(session_id, data, by_protocol or {})
+
+    def deliver(self, session_id: str, data: Any, by_protocol: ByProtocol) -> int:
+        """
+        Fan a broadcast from the bus out to this worker's clients of the session
+        """
+        connections = self._sessions.get(session_id)
+        if not connections:
+            return 0
+
+        with tracer.span("ws.broadcast", clients=len(connections)):
+            return self._broadcast(connections, data, by_protocol)
+
+    def _broadcast(
+        self,
+        connections: Set[ClientConnection],
+        data: Any,
+        by_protocol: ByProtocol
+    ) -> int:
+        messages: Dict[str, Any] = {}
+        payloads: Dict[Tuple[Optional[str], MessageEncoding], Payload] = {}
+        delivered = 0
+        # Copy since the close policy may remove connections while iterating
+        for connection in list(connections):
+            protocol = connection.protocol if connection.protocol in by_protocol else None
+            if protocol is not None and by_protocol[protocol] is None:
+                continue
+            key = (protocol, connection.encoding)
+            payload = payloads.get(key)
+            if payload is None:
+                if protocol is None:
+                    message = data
+                elif protocol in messages:
+                    message = messages[protocol]
+                else:
+                    message = messages[protocol] = by_protocol[protocol]()
+                payload = payloads[key] = encode_payload(message, connection.encoding)
+            if connection.enqueue(payload):
+                delivered += 1
+        self.messages_sent += delivered
+        return delivered
+
+    async def close_all(self):
+        closing = [
+            connection
+            for connections in list(self._sessions.values())
+            for connection in list(connections)
+        ]
+        for connection in closing:
+            connection._shutdown(close_code=1001)
+        await asyncio.gather(*(connection.wait_closed() for connection in closing))
+
+    def connection_count(self, session_id: Optional[str] = None) -> int:
+        if session_id is not None:
+            return len(self._sessions.get(session_id, ()))
+        return sum(len(connections) for connections in self._sessions.values())
+
+    def stats(self) -> Dict[str, int]:
+        live_dropped = sum(
+            connection.dropped
+            for connections in self._sessions.values()
+            for connection in connections
+        )
+        return {
+            "sessions": len(self._sessions),
+            "connections": self.connection_count(),
+            "messages_sent": self.messages_sent,
+            "messages_dropped": self.messages_dropped + live_dropped
+        }
@@ -0,0 +1,125 @@
+from typing import Any, Callable, Dict, Optional
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+
+
+class ExecutorOverloaded(Exception):
+    """
+    The executor already has as much work queued as allowed
+    """
+
+
+class CPUExecutor:
+    """
+    Runs CPU-bound work (route solving, day packing) off the event loop so
+    one long search doesn't stall every other request. "process" runs it
+    in worker processes, which is the only way past the GIL; work and
+    results must then be picklable, so callers pass plain values and ids
+    rather than models tied to this process's state. "thread" keeps the
+    loop responsive but shares one core, and "inline" runs work on the
+    loop as before. At most max_queue calls are in flight at a time;
+    beyond that run raises ExecutorOverloaded so the caller can shed the
+    request. Cancelling the awaiting task drops work that hasn't started.
+    """
+
+    def __init__(self, kind: str = "thread", workers: Optional[int] = None, max_queue: int = 64):
+        if kind not in ("inline", "thread", "process"):
+            raise ValueError(f"Unknown executor kind {kind!r}")
+        self.kind = kind
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.completed = 0
+        self.shed = 0
+        self.cancelled = 0
+        self.busy_ms = 0.0
+        self._pool: Optional[Executor] = None
+        self._pool_lock = threading.Lock()
+
+    def _executor(self) -> Executor:
+        # Created on first use so processes aren't started for idle instances
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    if self.kind == "process":
+                        # Forking a process that runs threads can copy held locks
+                        self._pool = ProcessPoolExecutor(
+                            max_workers=self.workers,
+                            mp_context=multiprocessing.get_context("spawn")
+                        )
+                    else:
+                        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="cpu")
+        return self._pool
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        fn(*args) on the executor. Raises ExecutorOverloaded when
+        max_queue calls are already in flight.
+        """
+        if self.kind == "inline":
+            return fn(*args)
+        if self.in_flight >= self.max_queue:
+            self.shed += 1
+            raise ExecutorOverloaded(f"{self.in_flight} CPU tasks already queued")
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        started = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor(), fn, *args)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.in_flight -= 1
+        self.completed += 1
+        self.busy_ms += (time.perf_counter() - started) * 1000
+        return result
+
+    def warm_up(self):
+        """
+        Start the workers now rather than on the first request
+        """
+        if self.kind != "inline":
+            pool = self._executor()
+            for future in [pool.submit(int) for _ in range(self.workers)]:
+                future.result()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "workers": self.workers if self.kind != "inline" else 0,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "completed": self.completed,
+            "shed": self.shed,
+            "cancelled": self.cancelled,
+            "avg_ms": round(self.busy_ms / self.completed, 2) if self.completed else 0.0
+        }
+
+
+def create_cpu_executor() -> CPUExecutor:
+    """
+    Build the CPU executor configured through environment variables
+    (CPU_EXECUTOR=thread, process or inline)
+    """
+    workers = int(os.getenv("CPU_WORKERS", "0"))
+    return CPUExecutor(
+        kind=os.getenv("CPU_EXECUTOR", "thread"),
+        workers=workers or None,
+        max_queue=int(os.getenv("CPU_MAX_QUEUE", "64"))
+    )
+
+
+# Shared by the planner and the optimizer
+cpu_executor = create_cpu_executor()
@@ -0,0 +1,399 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set
+from pydantic import BaseModel
+import functools
+import heapq
+import math
+import re
+import time
+import numpy as np
+
+from models import Attraction
+from services.catalog import catalog_registry
+from services.travel_matrix import TravelMatrixEngine, TravelMode, travel_matrix_engine
+
+# Score = RATING_WEIGHT * rating/5 + INTEREST_WEIGHT * interest match
+RATING_WEIGHT = 1.0
+INTEREST_WEIGHT = 1.5
+DEFAULT_RATING = 3.5
+
+# Interests users say mapped to the tags and types attractions carry
+INTEREST_SYNONYMS: Dict[str, Set[str]] = {
+    "sightseeing": {"landmark", "iconic", "photo-spot", "views"},
+    "culture": {"culture", "museum", "history", "historic", "art-deco", "architecture"},
+    "history": {"history", "historic", "museum"},
+    "food": {"food", "restaurant", "market", "dining", "chocolate"},
+    "nature": {"nature", "park", "island"},
+    "shopping": {"shopping", "market"},
+    "family": {"family-friendly", "sea-lions", "science"},
+    "art": {"art-deco", "museum", "architecture"},
+    "nightlife": {"entertainment"},
+}
+
+# Per-day spend assumed for budget words
+BUDGET_LEVELS_PER_DAY = {"low": 50.0, "budget": 50.0, "cheap": 50.0, "moderate": 150.0, "medium": 150.0}
+
+KMEANS_ITERATIONS = 10
+
+
+class PackedPlan(BaseModel):
+    days: List[List[Attraction]]
+    score: float
+    total_cost: float
+    elapsed_ms: float
+    timed_out: bool
+
+
+def parse_budget(budget: Any, num_days: int) -> Optional[float]:
+    """
+    Total trip budget in USD from a number, "$500"-style text or a budget
+    level word. None means unconstrained.
+    """
+    if budget is None:
+        return None
+    if isinstance(budget, (int, float)):
+        return float(budget)
+    text = str(budget).lower()
+    amount = re.search(r"\d+(?:\.\d+)?", text.replace(",", ""))
+    if amount:
+        value = float(amount.group())
+        return value * num_days if "day" in text else value
+    for word, per_day in BUDGET_LEVELS_PER_DAY.items():
+        if word in text:
+            return per_day * num_days
+    return None
+
+
+def expand_interests(interests: Optional[Iterable[str]]) -> Set[str]:
+    terms: Set[str] = set()
+    for interest in interests or []:
+        interest = interest.lower().strip()
+        terms.add(interest)
+        terms |= INTEREST_SYNONYMS.get(interest, set())
+    return terms
+
+
+def score_attraction(attraction: Attraction, interest_terms: Set[str]) -> float:
+    rating = (attraction.rating if attraction.rating is not None else DEFAULT_RATING) / 5.0
+    match = 0.0
+    if interest_terms:
+        terms = {tag.lower() for tag in attraction.tags}
+        terms.add(attraction.type.value)
+        # Two matching terms is a full match
+        match = min(1.0, len(terms & interest_terms) / 2.0)
+    return RATING_WEIGHT * rating + INTEREST_WEIGHT * match
+
+
+class _Day:
+    """
+    A day being packed: its route (candidate indexes) and running totals
+    """
+
+    def __init__(self, route: Optional[List[int]] = None):
+        self.route: List[int] = route or []
+        self.minutes = 0.0
+        self.cost = 0.0
+
+    def insertion(self, candidate: int, travel: List[List[float]]):
+        """
+        Cheapest place to insert a candidate: (added travel minutes, position)
+        """
+        route = self.route
+        if not route:
+            return 0.0, 0
+        best_added, best_position = travel[route[-1]][candidate], len(route)
+        start_added = travel[candidate][route[0]]
+        if start_added < best_added:
+            best_added, best_position = start_added, 0
+        to_candidate = travel[candidate]
+        for position in range(1, len(route)):
+            previous, following = route[position - 1], route[position]
+            added = travel[previous][candidate] + to_candidate[following] - travel[previous][following]
+            if added < best_added:
+                best_added, best_position = added, position
+        return best_added, best_position
+
+    def removal_saving(self, position: int, travel: List[List[float]]) -> float:
+        route = self.route
+        saving = 0.0
+        if position > 0:
+            saving += travel[route[position - 1]][route[position]]
+        if position < len(route) - 1:
+            saving += travel[route[position]][route[position + 1]]
+        if 0 < position < len(route) - 1:
+            saving -= travel[route[position - 1]][route[position + 1]]
+        return saving
+
+
+class _PackState:
+    """
+    Everything one pack() call works on, kept off the packer so it can be shared
+    """
+
+    def __init__(self, pool, scores, travel, budget_usd, stops_cap, deadline):
+        self.pool: List[Attraction] = pool
+        self.scores: List[float] = scores
+        self.travel: List[List[float]] = travel
+        self.remaining_budget = budget_usd if budget_usd is not None else math.inf
+        # Each day's share of the budget while days are first filled, so the
+        # first days can't spend it all; the improvement pass uses what's left
+        self.day_budget = self.remaining_budget
+        self.stops_cap = stops_cap
+        self.deadline = deadline
+        self.assigned: Set[int] = set()
+
+
+class DayPacker:
+    """
+    Chooses which attractions go on which day of a trip.
+    Candidates are scored on rating and interest match, the best are
+    clustered by location into one group per day, each day is filled
+    greedily under its time limit and the trip budget, and a swap-based
+    local search then improves the total score until the wall-clock
+    budget runs out. Scoring and clustering happen before the first
+    deadline check, so long trips over large catalogs can exceed it.
+    """
+
+    def __init__(
+        self,
+        day_minutes: int = 9 * 60,
+        max_stops_per_day: int = 6,
+        time_budget_ms: float = 50.0,
+        pool_factor: int = 3,
+        travel_matrix: TravelMatrixEngine = travel_matrix_engine,
+        travel_mode: TravelMode = TravelMode.TRANSIT
+    ):
+        self.day_minutes = day_minutes
+        self.max_stops_per_day = max_stops_per_day
+        self.time_budget_ms = time_budget_ms
+        # Only the best num_days * max_stops * pool_factor attractions are considered
+        self.pool_factor = pool_factor
+        self.travel_matrix = travel_matrix
+        self.travel_mode = travel_mode
+
+    def pack(
+        self,
+        attractions: Sequence[Attraction],
+        num_days: int,
+        interests: Optional[Iterable[str]] = None,
+        budget_usd: Optional[float] = None,
+        destination: Optional[str] = None
+    ) -> PackedPlan:
+        started = time.perf_counter()
+        if num_days <= 0 or not attractions:
+            return PackedPlan(
+                days=[[] for _ in range(max(num_days, 0))],
+                score=0.0,
+                total_cost=0.0,
+                elapsed_ms=0.0,
+                timed_out=False
+            )
+
+        interest_terms = expand_interests(interests)
+        pool_size = min(len(attractions), num_days * self.max_stops_per_day * self.pool_factor)
+        scored = heapq.nlargest(
+            pool_size,
+            ((score_attraction(attraction, interest_terms), i) for i, attraction in enumerate(attractions))
+        )
+        pool = [attractions[i] for _, i in scored]
+        travel = self.travel_matrix.matrix(pool, self.travel_mode, destination).submatrix(
+            [attraction.id for attraction in pool]
+        )
+        state = _PackState(
+            pool=pool,
+            scores=[score for score, _ in scored],
+            travel=travel,
+            budget_usd=budget_usd,
+            # Spread small catalogs evenly instead of filling the first days
+            stops_cap=min(self.max_stops_per_day, math.ceil(len(pool) / num_days)),
+            deadline=started + self.time_budget_ms / 1000.0
+        )
+
+        days = [_Day() for _ in range(num_days)]
+        state.day_budget = state.remaining_budget / num_days
+        timed_out = False
+
+        # Each day first takes the best of its own cluster
+        for day, members in zip(days, self._cluster(pool, min(num_days, len(pool)))):
+            for candidate in members:
+                self._try_insert(day, candidate, state)
+
+        # Leftovers go to the emptiest day they fit, cheapest detour first
+        for candidate in range(len(pool)):
+            if candidate in state.assigned:
+                continue
+            if time.perf_counter() > state.deadline:
+                timed_out = True
+                break
+            best = None
+            for day in days:
+                added, _ = day.insertion(candidate, travel)
+                if self._fits(day, candidate, added, state):
+                    key = (len(day.route), added)
+                    if best is None or key < best[0]:
+                        best = (key, day)
+            if best is not None:
+                self._try_insert(best[1], candidate, state)
+
+        state.day_budget = math.inf
+        if not timed_out:
+            timed_out = self._improve(days, state)
+
+        packed_days = [[pool[candidate] for candidate in day.route] for day in days]
+        # Fullest days first so a trip never opens with an empty day
+        packed_days.sort(key=len, reverse=True)
+        return PackedPlan(
+            days=packed_days,
+            score=round(sum(state.scores[candidate] for candidate in state.assigned), 4),
+            total_cost=round(sum(day.cost for day in days), 2),
+            elapsed_ms=round((time.perf_counter() - started) * 1000, 3),
+            timed_out=timed_out
+        )
+
+    def _cluster(self, pool: List[Attraction], k: int) -> List[List[int]]:
+        """
+        k-means on location, seeded with farthest-point picks starting from
+        the best candidate. Members of each cluster stay in score order.
+        """
+        if k <= 1:
+            return [list(range(len(pool)))]
+        coordinates = np.array([(a.location.lat, a.location.lng) for a in pool], dtype=np.float64)
+        coordinates[:, 1] *= math.cos(math.radians(float(coordinates[:, 0].mean())))
+
+        centers = [coordinates[0]]
+        nearest = np.linalg.norm(coordinates - centers[0], axis=1)
+        for _ in range(1, k):
+            centers.append(coordinates[int(nearest.argmax())])
+            nearest = np.minimum(nearest, np.linalg.norm(coordinates - centers[-1], axis=1))
+        centers = np.array(centers)
+
+        labels = np.zeros(len(pool), dtype=int)
+        for _ in range(KMEANS_ITERATIONS):
+            distances = ((coordinates[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+            new_labels = distances.argmin(axis=1)
+            if np.array_equal(new_labels, labels):
+                break
+            labels = new_labels
+            for cluster in range(k):
+                members = coordinates[labels == cluster]
+                if len(members):
+                    centers[cluster] = members.mean(axis=0)
+
+        clusters: List[List[int]] = [[] for _ in range(k)]
+        for candidate, label in enumerate(labels.tolist()):
+            clusters[label].append(candidate)
+        return clusters
+
+    def _fits(
+        self,
+        day: _Day,
+        candidate: int,
+        added_travel: float,
+        state: _PackState,
+        removed_minutes: float = 0.0,
+        removed_cost: float = 0.0,
+        replacing: bool = False
+    ) -> bool:
+        attraction = state.pool[candidate]
+        if len(day.route) >= state.stops_cap and not replacing:
+            return False
+        if day.minutes - removed_minutes + attraction.duration_minutes + added_travel > self.day_minutes:
+            return False
+        if day.cost - removed_cost + attraction.cost_usd > state.day_budget:
+            return False
+        return attraction.cost_usd - removed_cost <= state.remaining_budget
+
+    def _try_insert(self, day: _Day, candidate: int, state: _PackState) -> bool:
+        added, position = day.insertion(candidate, state.travel)
+        if not self._fits(day, candidate, added, state):
+            return False
+        attraction = state.pool[candidate]
+        day.route.insert(position, candidate)
+        day.minutes += attraction.duration_minutes + added
+        day.cost += attraction.cost_usd
+        state.remaining_budget -= attraction.cost_usd
+        state.assigned.add(candidate)
+        return True
+
+    def _improve(self, days: List[_Day], state: _PackState) -> bool:
+        """
+        Swap an unassigned candidate in for a lower-scoring stop whenever the
+        day still fits afterwards. Every swap raises the total score, so
+        this terminates. Returns True if stopped by the deadline.
+        """
+        scores = state.scores
+        improved = True
+        while improved:
+            improved = False
+            unassigned = sorted(
+                (candidate for candidate in range(len(state.pool)) if candidate not in state.assigned),
+                key=lambda candidate: -scores[candidate]
+            )
+            for candidate in unassigned:
+                if time.perf_counter() > state.deadline:
+                    return True
+                for day in days:
+                    if self._try_insert(day, candidate, state) or self._try_swap(day, candidate, state):
+                        improved = True
+                        break
+        return False
+
+    def _try_swap(self, day: _Day, candidate: int, state: _PackState) -> bool:
+        pool, scores, travel = state.pool, state.scores, state.travel
+        for position in sorted(range(len(day.route)), key=lambda p: scores[day.route[p]]):
+            current = day.route[position]
+            if scores[current] >= scores[candidate]:
+                return False
+            removed_minutes = pool[current].duration_minutes + day.removal_saving(position, travel)
+
+            trial = _Day(day.route[:position] + day.route[position + 1:])
+            added, insert_at = trial.insertion(candidate, travel)
+            if not self._fits(
+                day, candidate, added, state,
+                removed_minutes=removed_minutes,
+                removed_cost=pool[current].cost_usd,
+                replacing=True
+            ):
+                continue
+
+            day.route = trial.route
+            day.route.insert(insert_at, candidate)
+            day.minutes += pool[candidate].duration_minutes + added - removed_minutes
+            cost_change = pool[candidate].cost_usd - pool[current].cost_usd
+            day.cost += cost_change
+            state.remaining_budget -= cost_change
+            state.assigned.discard(current)
+            state.assigned.add(candidate)
+            return True
+        return False
+
+
+@functools.lru_cache(maxsize=8)
+def _packer(time_budget_ms: float, travel_mode: TravelMode) -> DayPacker:
+    return DayPacker(time_budget_ms=time_budget_ms, travel_mode=travel_mode)
+
+
+def pack_catalog(
+    destination: str,
+    source_mtime: float,
+    num_days: int,
+    interests: Optional[List[str]],
+    budget_usd: Optional[float],
+    time_budget_ms: float,
+    travel_mode: str = TravelMode.TRANSIT.value
+) -> List[List[str]]:
+    """
+    Pack a trip from a destination's catalog and return each day's
+    attraction ids, with travel times for travel_mode. Made to run on the
+    CPU executor: arguments and result are plain values, and a worker
+    process loads (or catches up to) the catalog version the caller
+    planned from.
+    """
+    catalog = catalog_registry.get_version(destination, source_mtime)
+    packed = _packer(time_budget_ms, TravelMode(travel_mode)).pack(
+        catalog.attractions,
+        num_days,
+        interests=interests,
+        budget_usd=budget_usd,
+        destination=catalog.destination
+    )
+    return [[attraction.id for attraction in day] for day in packed.days]
@@ -0,0 +1,278 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from pydantic import BaseModel
+import json
+import os
+import re
+import threading
+
+from services.catalog import CatalogRegistry, catalog_registry
+
+# Phrases that mean the user wants a plan
+PLANNING_PHRASES = (
+    "plan", "planning", "trip", "itinerary", "visit", "visiting", "travel to", "going to",
+    "vacation", "holiday", "getaway", "weekend in", "days in",
+)
+
+# Phrase users say -> interest the planner understands (see day_packer.INTEREST_SYNONYMS)
+INTEREST_PHRASES: Dict[str, str] = {
+    "sightseeing": "sightseeing", "sights": "sightseeing", "landmark": "sightseeing", "views": "sightseeing",
+    "culture": "culture", "cultural": "culture", "architecture": "culture",
+    "history": "history", "historic": "history", "historical": "history",
+    "food": "food", "foodie": "food", "restaurant": "food", "eat": "food", "eating": "food", "cuisine": "food",
+    "dining": "food", "market": "food",
+    "nature": "nature", "park": "nature", "hike": "nature", "hiking": "nature", "outdoors": "nature", "beach": "nature",
+    "shopping": "shopping", "shop": "shopping",
+    "family": "family", "kid": "family", "kids": "family", "children": "family",
+    "art": "art", "museum": "art", "gallery": "art", "galleries": "art",
+    "nightlife": "nightlife", "bar": "nightlife", "club": "nightlife",
+}
+
+# Used when a destination is known but no interests were mentioned
+DEFAULT_INTERESTS = ["sightseeing", "food", "culture"]
+DEFAULT_DURATION_DAYS = 3
+# Longer trips aren't planned: planning time and the reply grow with every day
+MAX_DURATION_DAYS = 30
+
+BUDGET_WORDS = ("cheap", "budget", "low", "moderate", "medium", "luxury")
+
+TRAVEL_MODE_PHRASES: Dict[str, str] = {
+    "walk": "walk", "walking": "walk", "on foot": "walk",
+    "transit": "transit", "public transport": "transit", "public transportation": "transit",
+    "subway": "transit", "metro": "transit", "bus": "transit",
+    "drive": "drive", "driving": "drive", "car": "drive", "rental car": "drive",
+}
+
+_NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "couple of": 2, "few": 3,
+}
+
+# One pass over the lowercased message: durations and amounts are
+# recognised in place, everything else is split into words for the gazetteer
+_SCAN_PATTERN = re.compile(
+    r"(?P<count>\d+|" + "|".join(sorted(_NUMBER_WORDS, key=len, reverse=True)) + r")[\s-]*"
+    r"(?P<unit>days?|nights?|weeks?)\b"
+    r"|(?P<weekend>\bweekend\b)"
+    r"|\$\s?(?P<dollars>\d[\d,]*(?:\.\d+)?)(?P<per_day>\s*(?:a|per|/)\s*day)?"
+    r"|(?P<amount>\d[\d,]*(?:\.\d+)?)\s*(?:dollars|usd|bucks)\b(?P<per_day2>\s*(?:a|per|/)\s*day)?"
+    r"|(?P<word>[a-z0-9]+(?:'[a-z]+)?)"
+)
+
+_UNIT_DAYS = {"day": 1, "days": 1, "night": 1, "nights": 1, "week": 7, "weeks": 7}
+
+
+def duration_or_default(duration_days: Any) -> int:
+    """
+    duration_days if it is a whole number of days from 1 to
+    MAX_DURATION_DAYS, otherwise DEFAULT_DURATION_DAYS
+    """
+    if isinstance(duration_days, int) and not isinstance(duration_days, bool) and 1 <= duration_days <= MAX_DURATION_DAYS:
+        return duration_days
+    return DEFAULT_DURATION_DAYS
+
+
+def _phrase_key(text: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+(?:'[a-z]+)?", text.lower()))
+
+
+class Extraction(BaseModel):
+    requires_planning: bool
+    preferences: Optional[Dict[str, Any]] = None
+    confidence: float
+
+
+class Gazetteer:
+    """
+    Phrase -> (kind, value) for every known destination alias, interest,
+    travel mode and planning phrase, matched on whole words by looking up
+    the word n-grams starting at each position, longest first. The cost
+    per message depends on its length and the longest phrase, not on how
+    many phrases there are, and "sf" never matches inside "transfer".
+    """
+
+    def __init__(self):
+        self.phrases: Dict[str, Tuple[str, str]] = {}
+        # First word -> most words in a phrase starting with it; other words start no phrase
+        self.first_words: Dict[str, int] = {}
+
+    def add(self, phrase: str, kind: str, value: str):
+        key = _phrase_key(phrase)
+        if not key:
+            return
+        # Destinations win over the generic vocabulary ("bar harbor", "park city")
+        if key in self.phrases and self.phrases[key][0] == "destination" and kind != "destination":
+            return
+        self.phrases[key] = (kind, value)
+        first, _, _ = key.partition(" ")
+        self.first_words[first] = max(self.first_words.get(first, 0), key.count(" ") + 1)
+
+    def add_plural(self, phrase: str, kind: str, value: str):
+        self.add(phrase, kind, value)
+        if not phrase.endswith("s"):
+            self.add(phrase + "s", kind, value)
+
+    def __len__(self) -> int:
+        return len(self.phrases)
+
+    def matches(self, words: List[Optional[str]]) -> Iterable[Tuple[str, str]]:
+        """
+        (kind, value) of the leftmost-longest phrases in words; None
+        entries separate runs that phrases may not span
+        """
+        phrases, first_words = self.phrases, self.first_words
+        i, count = 0, len(words)
+        while i < count:
+            longest = first_words.get(words[i])
+            if longest is None:
+                i += 1
+                continue
+            if longest == 1:
+                yield phrases[words[i]]
+                i += 1
+                continue
+            for length in range(min(longest, count - i), 0, -1):
+                run = words[i:i + length]
+                if None in run:
+                    continue
+                match = phrases.get(" ".join(run))
+                if match is not None:
+                    yield match
+                    i += length
+                    break
+            else:
+                i += 1
+
+
+class IntentExtractor:
+    """
+    Local intent and preference extraction: whether the message asks for a
+    trip plan, and its destination, duration, interests, budget and travel
+    mode, in one scan of the message. Destinations come from the attraction
+    catalogs (plus an optional gazetteer file mapping destination names to
+    aliases) and the phrase table is rebuilt when the catalogs change.
+    """
+
+    def __init__(self, catalogs: Optional[CatalogRegistry] = catalog_registry, gazetteer_path: Optional[str] = None):
+        self.catalogs = catalogs
+        self.gazetteer_path = gazetteer_path
+        self.extra_destinations: Dict[str, List[str]] = {}
+        self._gazetteer: Optional[Gazetteer] = None
+        self._generation = -1
+        self._lock = threading.Lock()
+
+    def add_destinations(self, destinations: Dict[str, Iterable[str]]):
+        """
+        Destinations to recognise besides the catalog ones, with their aliases
+        """
+        with self._lock:
+            for name, aliases in destinations.items():
+                self.extra_destinations.setdefault(name, []).extend(aliases)
+            self._gazetteer = None
+
+    def gazetteer(self) -> Gazetteer:
+        generation = self.catalogs.generation if self.catalogs is not None else 0
+        gazetteer = self._gazetteer
+        if gazetteer is None or generation != self._generation:
+            with self._lock:
+                if self._gazetteer is None or generation != self._generation:
+                    self._gazetteer = self._build()
+                    self._generation = self.catalogs.generation if self.catalogs is not None else 0
+                gazetteer = self._gazetteer
+        return gazetteer
+
+    def _build(self) -> Gazetteer:
+        gazetteer = Gazetteer()
+        for phrase in PLANNING_PHRASES:
+            gazetteer.add(phrase, "planning", phrase)
+        for phrase, interest in INTEREST_PHRASES.items():
+            gazetteer.add_plural(phrase, "interest", interest)
+        for word in BUDGET_WORDS:
+            gazetteer.add(word, "budget", word)
+        for phrase, mode in TRAVEL_MODE_PHRASES.items():
+            gazetteer.add(phrase, "travel_mode", mode)
+
+        destinations: Dict[str, List[str]] = {}
+        if self.gazetteer_path:
+            with open(self.gazetteer_path) as f:
+                for name, aliases in json.load(f).items():
+                    destinations.setdefault(name, []).extend(aliases)
+        for name, aliases in self.extra_destinations.items():
+            destinations.setdefault(name, []).extend(aliases)
+        if self.catalogs is not None:
+            # Catalog names last, so they win over gazetteer entries for the same alias
+            for name, aliases in self.catalogs.destinations().items():
+                destinations.setdefault(name, []).extend(aliases)
+        for name, aliases in destinations.items():
+            for alias in (name, *aliases):
+                gazetteer.add(alias, "destination", name)
+        return gazetteer
+
+    def extract(self, message: str) -> Extraction:
+        gazetteer = self.gazetteer()
+        words: List[Optional[str]] = []
+        duration_days = None
+        budget = None
+
+        for count, unit, weekend, dollars, per_day, amount, per_day2, word in _SCAN_PATTERN.findall(message.lower()):
+            if word:
+                words.append(word)
+                continue
+            if weekend:
+                # Still a word, so "weekend in" counts as a planning phrase
+                words.append(weekend)
+                duration_days = duration_days or 2
+                continue
+            # Phrases don't span a duration or an amount
+            words.append(None)
+            if unit:
+                duration_days = (int(count) if count.isdigit() else _NUMBER_WORDS[count]) * _UNIT_DAYS[unit]
+                if not 1 <= duration_days <= MAX_DURATION_DAYS:
+                    duration_days = None
+            else:
+                budget = f"${(dollars or amount).replace(',', '')}" + (" per day" if per_day or per_day2 else "")
+
+        requires_planning = False
+        destination = None
+        interests: List[str] = []
+        travel_mode = None
+        for kind, value in gazetteer.matches(words):
+            if kind == "planning":
+                requires_planning = True
+            elif kind == "destination":
+                destination = destination or value
+            elif kind == "interest":
+                if value not in interests:
+                    interests.append(value)
+            elif kind == "budget":
+                budget = budget or value
+            elif kind == "travel_mode":
+                travel_mode = travel_mode or value
+
+        if destination is not None and duration_days:
+            # "Two weeks in Lisbon" asks for a plan without saying so
+            requires_planning = True
+
+        preferences: Optional[Dict[str, Any]] = None
+        if destination is not None or (requires_planning and (duration_days or interests or budget)):
+            preferences = {
+                "interests": interests or list(DEFAULT_INTERESTS),
+                "duration_days": duration_days or DEFAULT_DURATION_DAYS
+            }
+            if destination is not None:
+                preferences["destination"] = destination
+            if budget is not None:
+                preferences["budget"] = budget
+            if travel_mode is not None:
+                preferences["travel_mode"] = travel_mode
+
+        if requires_planning == (destination is not None):
+            # A trip request for a known destination, or plain small talk
+            confidence = 0.95 if requires_planning else 0.85
+        else:
+            # Planning words without a destination we know, or the other way round
+            confidence = 0.5
+        return Extraction(requires_planning=requires_planning, preferences=preferences, confidence=confidence)
+
+
+# Shared by the chat agents; destinations load with the first message
+intent_extractor = IntentExtractor(gazetteer_path=os.getenv("DESTINATION_GAZETTEER") or None)
@@ -0,0 +1,102 @@
+from typing import Any, Dict, Optional, Tuple
+from collections import OrderedDict
+import threading
+import zlib
+
+from pydantic import BaseModel
+from pydantic_core import to_json
+
+
+class EncodedJSON:
+    """
+    A value already serialized to JSON. encode_json splices it into the
+    messages that contain it instead of serializing it again, and the
+    text and compressed forms are derived once and kept.
+    """
+    __slots__ = ("data", "_text", "_compressed")
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self._text: Optional[str] = None
+        self._compressed: Optional[bytes] = None
+
+    @classmethod
+    def of(cls, value: Any) -> "EncodedJSON":
+        return cls(encode_json(value))
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.data.decode("utf-8")
+        return self._text
+
+    @property
+    def compressed(self) -> bytes:
+        if self._compressed is None:
+            self._compressed = zlib.compress(self.data)
+        return self._compressed
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+def encode_json(data: Any) -> bytes:
+    """
+    Compact JSON for data (dicts, lists, models, datetimes, enums) through
+    pydantic-core. EncodedJSON values, the whole message or the values of
+    its top-level keys, are copied in as they are.
+    """
+    if isinstance(data, EncodedJSON):
+        return data.data
+    if isinstance(data, dict) and any(isinstance(value, EncodedJSON) for value in data.values()):
+        return b"{" + b",".join(
+            to_json(str(key)) + b":" + (value.data if isinstance(value, EncodedJSON) else to_json(value))
+            for key, value in data.items()
+        ) + b"}"
+    return to_json(data)
+
+
+class TripJSONCache:
+    """
+    The encoded form of each session's current trip version, so the HTTP
+    reply, every WebSocket broadcast and later initial states reuse one
+    serialization until the trip changes. Versions come from the session store.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # session_id -> (trip id, version, encoded trip)
+        self._entries: "OrderedDict[str, Tuple[str, int, EncodedJSON]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str, trip_id: str, version: int) -> Optional[EncodedJSON]:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None or entry[0] != trip_id or entry[1] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, session_id: str, trip_id: str, version: int, encoded: EncodedJSON):
+        with self._lock:
+            self._entries[session_id] = (trip_id, version, encoded)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def encode(self, session_id: str, trip: BaseModel, version: int) -> EncodedJSON:
+        """
+        The trip's JSON for this version, serialized only on the first call
+        """
+        encoded = self.get(session_id, trip.id, version)
+        if encoded is None:
+            encoded = EncodedJSON.of(trip)
+            self.put(session_id, trip.id, version, encoded)
+        return encoded
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,123 @@
+from typing import Any, Dict, Tuple
+import os
+import threading
+
+PROVIDERS = ("openai", "anthropic")
+
+
+class LLMClientPool:
+    """
+    Chat models for the agents, built on first use and shared. Each
+    provider gets one pooled httpx client (plus an async one) that every
+    model of that provider sends through, so agents reuse connections
+    instead of each opening their own. LangChain and the provider SDKs
+    are only imported when the first model is built, which keeps them out
+    of process start-up.
+    """
+
+    def __init__(self, max_connections: int = 20, max_keepalive: int = 10, timeout_seconds: float = 60.0):
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.timeout_seconds = timeout_seconds
+        self._http: Dict[str, Any] = {}
+        self._async_http: Dict[str, Any] = {}
+        self._models: Dict[Tuple[str, str, float], Any] = {}
+        self._lock = threading.Lock()
+
+    def _limits(self):
+        import httpx
+        return httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_keepalive)
+
+    def http_client(self, provider: str):
+        """
+        The provider's shared httpx.Client
+        """
+        with self._lock:
+            client = self._http.get(provider)
+            if client is None:
+                import httpx
+                client = self._http[provider] = httpx.Client(limits=self._limits(), timeout=self.timeout_seconds)
+            return client
+
+    def async_http_client(self, provider: str):
+        """
+        The provider's shared httpx.AsyncClient
+        """
+        with self._lock:
+            client = self._async_http.get(provider)
+            if client is None:
+                import httpx
+                client = self._async_http[provider] = httpx.AsyncClient(limits=self._limits(), timeout=self.timeout_seconds)
+            return client
+
+    def chat_model(self, provider: str, model: str, temperature: float):
+        """
+        LangChain chat model for a provider, one per (provider, model,
+        temperature) however many agents ask for it
+        """
+        if provider not in PROVIDERS:
+            raise ValueError(f"Unknown LLM provider: {provider}")
+        key = (provider, model, temperature)
+        chat_model = self._models.get(key)
+        if chat_model is None:
+            build = self._build_openai if provider == "openai" else self._build_anthropic
+            built = build(model, temperature)
+            with self._lock:
+                chat_model = self._models.setdefault(key, built)
+        return chat_model
+
+    def _build_openai(self, model: str, temperature: float):
+        import openai
+        from langchain.chat_models import ChatOpenAI
+
+        api_key = os.getenv("OPENAI_API_KEY")
+        return ChatOpenAI(
+            model=model,
+            temperature=temperature,
+            openai_api_key=api_key,
+            client=openai.OpenAI(api_key=api_key, http_client=self.http_client("openai")).chat.completions,
+            async_client=openai.AsyncOpenAI(api_key=api_key, http_client=self.async_http_client("openai")).chat.completions
+        )
+
+    def _build_anthropic(self, model: str, temperature: float):
+        import anthropic
+        from langchain.chat_models import ChatAnthropic
+
+        api_key = os.getenv("ANTHROPIC_API_KEY")
+        chat_model = ChatAnthropic(model=model, temperature=temperature, anthropic_api_key=api_key)
+        # ChatAnthropic always creates its own SDK clients; route them through the pool
+        chat_model.client = anthropic.Anthropic(
+            base_url=chat_model.anthropic_api_url,
+            api_key=api_key,
+            http_client=self.http_client("anthropic")
+        )
+        chat_model.async_client = anthropic.AsyncAnthropic(
+            base_url=chat_model.anthropic_api_url,
+            api_key=api_key,
+            http_client=self.async_http_client("anthropic")
+        )
+        return chat_model
+
+    async def aclose(self):
+        with self._lock:
+            http, async_http = list(self._http.values()), list(self._async_http.values())
+            self._http.clear()
+            self._async_http.clear()
+            self._models.clear()
+        for client in http:
+            client.close()
+        for client in async_http:
+            await client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "models": len(self._models),
+            "http_clients": sorted(set(self._http) | set(self._async_http))
+        }
+
+
+# Shared by all agents in the process
+llm_clients = LLMClientPool(
+    max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+    timeout_seconds=float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+)
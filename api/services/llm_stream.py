@@ -0,0 +1,132 @@
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+import asyncio
+import json
+import re
+
+# Words with their trailing whitespace, so joined tokens give back the text
+_TOKEN_PATTERN = re.compile(r"\S+\s*|\s+")
+
+
+def word_tokens(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall(text)
+
+
+class TokenSource:
+    """
+    Where chat reply tokens come from. draft is the reply the agent has
+    already decided on; sources without a model stream it back.
+    """
+
+    async def stream(self, messages: List[Any], draft: str) -> AsyncIterator[str]:
+        for token in word_tokens(draft):
+            yield token
+
+
+class FakeLLM(TokenSource):
+    """
+    Streams the draft on a fixed schedule, like a provider would: a delay
+    before the first token, then tokens_per_second. For local testing and
+    benchmarks without network access.
+    """
+
+    def __init__(self, first_token_ms: float = 300.0, tokens_per_second: float = 40.0):
+        self.first_token_ms = first_token_ms
+        self.tokens_per_second = tokens_per_second
+
+    async def stream(self, messages: List[Any], draft: str) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        # Schedule against the start time so a slow consumer doesn't stretch the gaps
+        next_at = loop.time() + self.first_token_ms / 1000.0
+        interval = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        for token in word_tokens(draft):
+            delay = next_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield token
+            next_at += interval
+
+
+class LangChainTokenSource(TokenSource):
+    """
+    Streams a LangChain chat model's reply chunk by chunk
+    """
+
+    def __init__(self, model: Any):
+        self.model = model
+
+    async def stream(self, messages: List[Any], draft: str) -> AsyncIterator[str]:
+        async for chunk in self.model.astream(messages):
+            if chunk.content:
+                yield chunk.content
+
+
+async def buffered(
+    events: AsyncIterator[Dict[str, Any]],
+    max_pending: int = 32,
+    coalesce: Optional[Callable[[Dict[str, Any], Dict[str, Any]], Optional[Dict[str, Any]]]] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run an event producer ahead of its consumer by at most max_pending
+    events. When the buffer is full the producer waits, so a slow client
+    slows generation instead of growing memory. coalesce(a, b) may merge
+    two queued events into one (or return None to keep both), so a client
+    that falls behind gets fewer, larger messages.
+    The producer is cancelled if the consumer stops early.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+    done = object()
+
+    async def produce():
+        try:
+            async for event in events:
+                await queue.put(event)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            await queue.put(done)
+            raise
+        await queue.put(done)
+
+    producer = asyncio.create_task(produce())
+    held = None
+    try:
+        while True:
+            if held is not None:
+                event, held = held, None
+            else:
+                event = await queue.get()
+            if event is done:
+                break
+            while coalesce is not None and not queue.empty():
+                following = queue.get_nowait()
+                merged = coalesce(event, following) if following is not done else None
+                if merged is None:
+                    held = following
+                    break
+                event = merged
+            yield event
+        # Surface the producer's exception, if any
+        await producer
+    finally:
+        if not producer.done():
+            producer.cancel()
+            try:
+                await producer
+            except (asyncio.CancelledError, Exception):
+                pass
+
+
+def merge_tokens(first: Dict[str, Any], second: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    coalesce function for buffered: joins consecutive token events
+    """
+    if first.get("type") == "chat_token" and second.get("type") == "chat_token":
+        return {**first, "text": first["text"] + second["text"]}
+    return None
+
+
+def format_sse(event: Dict[str, Any], encode: Callable[[Any], str] = json.dumps) -> str:
+    """
+    One Server-Sent Events frame, named after the event's type
+    """
+    return f"event: {event['type']}\ndata: {encode(event)}\n\n"
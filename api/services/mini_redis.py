@@ -0,0 +1,288 @@
+"""
+A local stand-in for Redis, speaking enough of its protocol for the
+shared session store and the broadcast bus (services.session_store,
+services.session_bus): strings with expiry, WATCH/MULTI/EXEC, and
+pub/sub. Everything is kept in memory in one process and nothing is
+persisted, so it is meant for development and the multi-worker benchmark;
+deployments use a real Redis.
+
+Run from the api directory:
+    python -m services.mini_redis [--host 127.0.0.1] [--port 6379]
+"""
+from typing import Dict, List, Optional, Set, Tuple
+import argparse
+import asyncio
+import time
+
+from services.resp import READ_SIZE, RespError, parse_reply
+
+OK = b"+OK\r\n"
+QUEUED = b"+QUEUED\r\n"
+NIL = b"$-1\r\n"
+NIL_ARRAY = b"*-1\r\n"
+
+# Commands a client in MULTI runs straight away instead of queueing
+TRANSACTION_COMMANDS = {b"EXEC", b"DISCARD", b"MULTI", b"WATCH"}
+
+
+def _integer(value: int) -> bytes:
+    return b":%d\r\n" % value
+
+
+def _bulk(value: Optional[bytes]) -> bytes:
+    if value is None:
+        return NIL
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def _array(items: List[bytes]) -> bytes:
+    return b"*%d\r\n" % len(items) + b"".join(items)
+
+
+def _error(message: str) -> bytes:
+    return b"-%s\r\n" % message.encode("utf-8")
+
+
+class _Client:
+    __slots__ = ("writer", "watched", "queued", "channels")
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        # Key -> revision when it was watched
+        self.watched: Dict[bytes, int] = {}
+        # Commands queued since MULTI, None outside a transaction
+        self.queued: Optional[List[List[bytes]]] = None
+        self.channels: Set[bytes] = set()
+
+
+class MiniRedis:
+    """
+    The server state and command handlers. Commands run one at a time on
+    the event loop, so each, and each EXEC, is atomic.
+    """
+
+    def __init__(self):
+        # Key -> (value, expires at in monotonic seconds or None)
+        self._data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        # Key -> revision of its last change, for WATCH
+        self._revisions: Dict[bytes, int] = {}
+        self._revision = 0
+        self._subscribers: Dict[bytes, Set[_Client]] = {}
+        self.commands = 0
+        self.published = 0
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 6379) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = _Client(writer)
+        buffer = b""
+        try:
+            while True:
+                chunk = await reader.read(READ_SIZE)
+                if not chunk:
+                    break
+                buffer += chunk
+                pos = 0
+                replies = []
+                while True:
+                    command, pos = self._next_command(buffer, pos)
+                    if command is None:
+                        break
+                    if command:
+                        replies.append(self._execute(client, command))
+                buffer = buffer[pos:]
+                writer.write(b"".join(replies))
+                await writer.drain()
+        except (ConnectionError, RespError):
+            pass
+        finally:
+            for channel in list(client.channels):
+                self._unsubscribe(client, channel)
+            writer.close()
+
+    def _next_command(self, buffer: bytes, pos: int) -> Tuple[Optional[List[bytes]], int]:
+        if pos >= len(buffer):
+            return None, pos
+        if buffer[pos:pos + 1] != b"*":
+            # Inline command, as typed into telnet
+            end = buffer.find(b"\r\n", pos)
+            if end < 0:
+                return None, pos
+            return buffer[pos:end].split(), end + 2
+        parsed = parse_reply(buffer, pos)
+        if parsed is None:
+            return None, pos
+        return parsed
+
+    def _execute(self, client: _Client, command: List[bytes]) -> bytes:
+        self.commands += 1
+        name = command[0].upper()
+        if client.queued is not None and name not in TRANSACTION_COMMANDS:
+            client.queued.append(command)
+            return QUEUED
+        handler = getattr(self, f"_cmd_{name.decode('ascii', 'replace').lower()}", None)
+        if handler is None:
+            return _error(f"ERR unknown command '{command[0].decode('utf-8', 'replace')}'")
+        try:
+            return handler(client, *command[1:])
+        except (TypeError, ValueError):
+            return _error(f"ERR wrong arguments for '{name.decode('ascii', 'replace').lower()}' command")
+
+    def _lookup(self, key: bytes) -> Optional[bytes]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            self._touch(key)
+            return None
+        return value
+
+    def _touch(self, key: bytes):
+        self._revision += 1
+        self._revisions[key] = self._revision
+
+    # Keys
+
+    def _cmd_ping(self, client: _Client, message: Optional[bytes] = None) -> bytes:
+        return _bulk(message) if message is not None else b"+PONG\r\n"
+
+    def _cmd_select(self, client: _Client, db: bytes) -> bytes:
+        # One keyspace for every database number
+        int(db)
+        return OK
+
+    def _cmd_get(self, client: _Client, key: bytes) -> bytes:
+        return _bulk(self._lookup(key))
+
+    def _cmd_getrange(self, client: _Client, key: bytes, start: bytes, end: bytes) -> bytes:
+        value = self._lookup(key) or b""
+        start, end = int(start), int(end)
+        if end < 0:
+            end += len(value)
+        return _bulk(value[start:end + 1])
+
+    def _cmd_set(self, client: _Client, key: bytes, value: bytes, *options: bytes) -> bytes:
+        expires_at = None
+        options = [option.upper() for option in options]
+        if b"NX" in options and self._lookup(key) is not None:
+            return NIL
+        for unit, scale in ((b"EX", 1.0), (b"PX", 0.001)):
+            if unit in options:
+                expires_at = time.monotonic() + int(options[options.index(unit) + 1]) * scale
+        self._data[key] = (value, expires_at)
+        self._touch(key)
+        return OK
+
+    def _cmd_del(self, client: _Client, *keys: bytes) -> bytes:
+        deleted = 0
+        for key in keys:
+            if self._lookup(key) is not None:
+                del self._data[key]
+                self._touch(key)
+                deleted += 1
+        return _integer(deleted)
+
+    def _cmd_dbsize(self, client: _Client) -> bytes:
+        return _integer(sum(1 for key in list(self._data) if self._lookup(key) is not None))
+
+    def _cmd_flushdb(self, client: _Client, *options: bytes) -> bytes:
+        for key in list(self._data):
+            self._touch(key)
+        self._data.clear()
+        return OK
+
+    # Transactions
+
+    def _cmd_watch(self, client: _Client, *keys: bytes) -> bytes:
+        if client.queued is not None:
+            return _error("ERR WATCH inside MULTI is not allowed")
+        for key in keys:
+            self._lookup(key)
+            client.watched[key] = self._revisions.get(key, 0)
+        return OK
+
+    def _cmd_unwatch(self, client: _Client) -> bytes:
+        client.watched.clear()
+        return OK
+
+    def _cmd_multi(self, client: _Client) -> bytes:
+        if client.queued is not None:
+            return _error("ERR MULTI calls can not be nested")
+        client.queued = []
+        return OK
+
+    def _cmd_discard(self, client: _Client) -> bytes:
+        if client.queued is None:
+            return _error("ERR DISCARD without MULTI")
+        client.queued = None
+        client.watched.clear()
+        return OK
+
+    def _cmd_exec(self, client: _Client) -> bytes:
+        if client.queued is None:
+            return _error("ERR EXEC without MULTI")
+        queued, client.queued = client.queued, None
+        for key in client.watched:
+            self._lookup(key)
+        changed = any(self._revisions.get(key, 0) != revision for key, revision in client.watched.items())
+        client.watched.clear()
+        if changed:
+            return NIL_ARRAY
+        return _array([self._execute(client, command) for command in queued])
+
+    # Pub/sub
+
+    def _cmd_publish(self, client: _Client, channel: bytes, message: bytes) -> bytes:
+        subscribers = self._subscribers.get(channel, ())
+        if subscribers:
+            frame = _array([_bulk(b"message"), _bulk(channel), _bulk(message)])
+            for subscriber in subscribers:
+                subscriber.writer.write(frame)
+        self.published += 1
+        return _integer(len(subscribers))
+
+    def _cmd_subscribe(self, client: _Client, *channels: bytes) -> bytes:
+        if not channels:
+            raise ValueError("no channels")
+        replies = []
+        for channel in channels:
+            client.channels.add(channel)
+            self._subscribers.setdefault(channel, set()).add(client)
+            replies.append(_array([_bulk(b"subscribe"), _bulk(channel), _integer(len(client.channels))]))
+        return b"".join(replies)
+
+    def _cmd_unsubscribe(self, client: _Client, *channels: bytes) -> bytes:
+        replies = []
+        for channel in channels or list(client.channels):
+            self._unsubscribe(client, channel)
+            replies.append(_array([_bulk(b"unsubscribe"), _bulk(channel), _integer(len(client.channels))]))
+        return b"".join(replies)
+
+    def _unsubscribe(self, client: _Client, channel: bytes):
+        client.channels.discard(channel)
+        subscribers = self._subscribers.get(channel)
+        if subscribers is not None:
+            subscribers.discard(client)
+            if not subscribers:
+                del self._subscribers[channel]
+
+
+async def serve_forever(host: str, port: int):
+    server = await MiniRedis().serve(host, port)
+    print(f"mini_redis listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,538 @@
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+from abc import ABC, abstractmethod
+from collections import deque
+from enum import Enum
+from pydantic import BaseModel
+import asyncio
+import json
+import os
+import random
+
+from services.llm_clients import LLMClientPool, llm_clients
+from services.llm_stream import TokenSource, word_tokens
+from services.telemetry import MetricsRegistry, metrics as default_metrics, tracer
+
+
+class ModelTier(str, Enum):
+    RULES = "rules"
+    SMALL = "small"
+    LARGE = "large"
+
+
+# Cheapest first; intent extraction escalates along this order
+ESCALATION_ORDER = (ModelTier.RULES, ModelTier.SMALL, ModelTier.LARGE)
+
+INTENT_PROMPT = """Decide whether the traveller's message asks for a trip plan and extract
+their preferences. Answer with JSON only:
+{"requires_planning": true|false, "preferences": {"destination": ..., "duration_days": ...,
+"interests": [...], "budget": ..., "travel_mode": ...} or null, "confidence": 0.0-1.0}"""
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (about four characters per token) for cost accounting
+    when a provider doesn't report usage
+    """
+    return max(1, len(text) // 4)
+
+
+def _message_text(messages: Sequence[Any]) -> str:
+    return "".join(message[1] if isinstance(message, tuple) else str(message) for message in messages)
+
+
+class IntentResult(BaseModel):
+    requires_planning: bool
+    preferences: Optional[Dict[str, Any]] = None
+    confidence: float
+    # Tier that produced the accepted answer
+    route: ModelTier = ModelTier.RULES
+
+
+class RouteError(Exception):
+    def __init__(self, route: str, reason: str):
+        super().__init__(f"{route}: {reason}")
+        self.route = route
+
+
+class ChatProvider(ABC):
+    """
+    One model at one provider, with its price per 1000 tokens
+    """
+
+    def __init__(self, name: str, model: str, input_cost_per_1k: float = 0.0, output_cost_per_1k: float = 0.0):
+        self.name = name
+        self.model = model
+        self.input_cost_per_1k = input_cost_per_1k
+        self.output_cost_per_1k = output_cost_per_1k
+
+    def cost_usd(self, input_tokens: int, output_tokens: int) -> float:
+        return (input_tokens * self.input_cost_per_1k + output_tokens * self.output_cost_per_1k) / 1000
+
+    @abstractmethod
+    async def stream(self, messages: Sequence[Any]) -> AsyncIterator[str]:
+        """
+        The reply to messages, as text chunks while the model produces them
+        """
+
+
+class LangChainProvider(ChatProvider):
+    """
+    A provider's model through LangChain, built by the shared client pool
+    on first use
+    """
+
+    def __init__(
+        self,
+        name: str,
+        model: str,
+        input_cost_per_1k: float,
+        output_cost_per_1k: float,
+        temperature: float = 0.7,
+        clients: LLMClientPool = llm_clients
+    ):
+        super().__init__(name, model, input_cost_per_1k, output_cost_per_1k)
+        self.temperature = temperature
+        self.clients = clients
+
+    async def stream(self, messages: Sequence[Any]) -> AsyncIterator[str]:
+        async for chunk in self.clients.chat_model(self.name, self.model, self.temperature).astream(list(messages)):
+            if chunk.content:
+                yield chunk.content
+
+
+class StubProvider(ChatProvider):
+    """
+    Local stand-in for a provider: replies with reply(messages) after
+    latency_ms, streaming at tokens_per_second. slow_rate of the calls take
+    slow_ms instead, and fail_rate of them fail, to exercise hedging and
+    failover in tests and benchmarks without network access.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        model: str,
+        reply: Callable[[Sequence[Any]], str],
+        latency_ms: float = 50.0,
+        tokens_per_second: float = 0.0,
+        slow_rate: float = 0.0,
+        slow_ms: float = 0.0,
+        fail_rate: float = 0.0,
+        input_cost_per_1k: float = 0.0,
+        output_cost_per_1k: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        super().__init__(name, model, input_cost_per_1k, output_cost_per_1k)
+        self.reply = reply
+        self.latency_ms = latency_ms
+        self.tokens_per_second = tokens_per_second
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.fail_rate = fail_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+
+    async def stream(self, messages: Sequence[Any]) -> AsyncIterator[str]:
+        self.calls += 1
+        slow = self._rng.random() < self.slow_rate
+        fail = self._rng.random() < self.fail_rate
+        await asyncio.sleep((self.slow_ms if slow else self.latency_ms) / 1000.0)
+        if fail:
+            raise RouteError(self.name, "stub provider failure")
+        interval = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        for i, token in enumerate(word_tokens(self.reply(messages))):
+            if i and interval:
+                await asyncio.sleep(interval)
+            yield token
+
+
+class RouteMetrics:
+    """
+    Latency, token, cost and hedging counters for one route (task and tier)
+    """
+
+    def __init__(self, window: int = 1024):
+        self.calls = 0
+        self.errors = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost_usd = 0.0
+        self.by_provider: Dict[str, int] = {}
+        self._latencies: deque = deque(maxlen=window)
+
+    def record(self, provider: ChatProvider, latency_ms: float, input_tokens: int, output_tokens: int):
+        self.calls += 1
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        self.cost_usd += provider.cost_usd(input_tokens, output_tokens)
+        self.by_provider[provider.name] = self.by_provider.get(provider.name, 0) + 1
+        self._latencies.append(latency_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        ordered = sorted(self._latencies)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "p50_ms": round(ordered[len(ordered) // 2], 2) if ordered else 0.0,
+            "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 2) if ordered else 0.0,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+            "by_provider": dict(self.by_provider)
+        }
+
+
+class _Attempt:
+    """
+    One provider's stream, started in its own task up to its first token
+    """
+
+    def __init__(self, provider: ChatProvider, messages: Sequence[Any]):
+        self.provider = provider
+        self.stream = provider.stream(messages)
+        self.first = asyncio.ensure_future(self.stream.__anext__())
+
+    async def close(self):
+        if not self.first.done():
+            self.first.cancel()
+        try:
+            await self.first
+        except (asyncio.CancelledError, Exception):
+            pass
+        await self.stream.aclose()
+
+
+class ModelRouter:
+    """
+    Chooses a model per request, cheapest first. Intent detection and
+    preference extraction go to the local rule-based classifier and only
+    escalate to the small, then the large tier when the answer's
+    confidence is below confidence_threshold. Replies go to the tier the
+    caller asks for (large for itinerary generation).
+
+    Every model call is hedged across the tier's providers: the first
+    provider starts right away, the next one if no token has arrived
+    within hedge_after_ms (or as soon as the first fails), and the first
+    to answer wins while the others are cancelled. A call that gets no
+    answer within deadline_ms fails with RouteError.
+    """
+
+    def __init__(
+        self,
+        providers: Optional[Dict[ModelTier, List[ChatProvider]]] = None,
+        confidence_threshold: float = 0.8,
+        hedge_after_ms: float = 1500.0,
+        deadline_ms: float = 20000.0,
+        registry: MetricsRegistry = default_metrics
+    ):
+        self.providers = {tier: list(tier_providers) for tier, tier_providers in (providers or {}).items()}
+        self.confidence_threshold = confidence_threshold
+        self.hedge_after_ms = hedge_after_ms
+        self.deadline_ms = deadline_ms
+        self.intents = 0
+        self.escalations = 0
+        self.intent_routes: Dict[str, int] = {}
+        self._routes: Dict[str, RouteMetrics] = {}
+        # Exported on /metrics, by task, tier and the provider that answered
+        labels = ("task", "tier", "provider")
+        self.call_seconds = registry.histogram(
+            "llm_call_duration_seconds", "Model calls from start to last token", labels
+        )
+        self.first_token_seconds = registry.histogram(
+            "llm_first_token_seconds", "Model calls from start to first token", labels
+        )
+        self.tokens = registry.counter(
+            "llm_tokens_total", "Prompt and completion tokens (estimated when not reported)", labels + ("kind",)
+        )
+        self.failures = registry.counter("llm_failures_total", "Model calls that got no answer", ("task", "tier"))
+
+    def has_tier(self, tier: ModelTier) -> bool:
+        return bool(self.providers.get(tier))
+
+    def _metrics(self, task: str, tier: ModelTier) -> RouteMetrics:
+        key = f"{task}:{tier.value}"
+        metrics = self._routes.get(key)
+        if metrics is None:
+            metrics = self._routes[key] = RouteMetrics()
+        return metrics
+
+    async def stream(self, task: str, tier: ModelTier, messages: Sequence[Any]) -> AsyncIterator[str]:
+        """
+        The reply of whichever of the tier's providers starts answering first
+        """
+        providers = self.providers.get(tier) or []
+        if not providers:
+            raise RouteError(f"{task}:{tier.value}", "no providers configured")
+        tokens = self._stream(task, tier, providers, messages)
+        try:
+            with tracer.span(f"llm.{task}", tier=tier.value):
+                async for token in tokens:
+                    yield token
+        finally:
+            await tokens.aclose()
+
+    async def _stream(
+        self,
+        task: str,
+        tier: ModelTier,
+        providers: List[ChatProvider],
+        messages: Sequence[Any]
+    ) -> AsyncIterator[str]:
+        metrics = self._metrics(task, tier)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.deadline_ms / 1000.0
+        pending = list(providers)
+        attempts: List[_Attempt] = []
+        winner: Optional[_Attempt] = None
+
+        def start_next() -> float:
+            attempts.append(_Attempt(pending.pop(0), messages))
+            return loop.time() + self.hedge_after_ms / 1000.0
+
+        next_hedge = start_next()
+        try:
+            while winner is None:
+                for attempt in [attempt for attempt in attempts if attempt.first.done()]:
+                    attempts.remove(attempt)
+                    if attempt.first.cancelled() or attempt.first.exception() is not None:
+                        metrics.errors += 1
+                        await attempt.stream.aclose()
+                    elif winner is None:
+                        winner = attempt
+                    else:
+                        attempts.append(attempt)
+                if winner is not None:
+                    break
+                if not attempts:
+                    if not pending:
+                        raise RouteError(f"{task}:{tier.value}", "all providers failed")
+                    # Fail over right away
+                    next_hedge = start_next()
+                    continue
+
+                now = loop.time()
+                if now >= deadline:
+                    metrics.errors += 1
+                    raise RouteError(f"{task}:{tier.value}", f"no answer within {self.deadline_ms:.0f} ms")
+                timeout = deadline - now
+                if pending:
+                    timeout = min(timeout, max(0.0, next_hedge - now))
+                done, _ = await asyncio.wait(
+                    [attempt.first for attempt in attempts],
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done and pending and next_hedge <= loop.time() < deadline:
+                    metrics.hedges += 1
+                    next_hedge = start_next()
+        except BaseException as exc:
+            for attempt in attempts:
+                await attempt.close()
+            if isinstance(exc, RouteError):
+                self.failures.inc(task, tier.value)
+            raise
+
+        # Cancel the losers
+        for attempt in attempts:
+            await attempt.close()
+        if winner.provider is not providers[0]:
+            metrics.hedge_wins += 1
+
+        first_token = winner.first.result()
+        self.first_token_seconds.observe(loop.time() - started, task, tier.value, winner.provider.name)
+        output = [first_token]
+        yield first_token
+        try:
+            async for token in winner.stream:
+                output.append(token)
+                yield token
+        finally:
+            await winner.stream.aclose()
+            elapsed = loop.time() - started
+            input_tokens = estimate_tokens(_message_text(messages))
+            output_tokens = estimate_tokens("".join(output))
+            metrics.record(winner.provider, elapsed * 1000, input_tokens, output_tokens)
+            labels = (task, tier.value, winner.provider.name)
+            self.call_seconds.observe(elapsed, *labels)
+            self.tokens.inc(*labels, "input", amount=input_tokens)
+            self.tokens.inc(*labels, "output", amount=output_tokens)
+
+    async def complete(self, task: str, tier: ModelTier, messages: Sequence[Any]) -> str:
+        parts = []
+        async for token in self.stream(task, tier, messages):
+            parts.append(token)
+        return "".join(parts)
+
+    def token_source(self, tier: ModelTier) -> Optional[TokenSource]:
+        """
+        TokenSource streaming replies from the tier, or None when the tier
+        has no providers
+        """
+        return RoutedTokenSource(self, tier) if self.has_tier(tier) else None
+
+    async def route_intent(
+        self,
+        message: str,
+        rules: Callable[[str], Tuple[bool, Optional[Dict[str, Any]], float]]
+    ) -> IntentResult:
+        """
+        Intent and preferences from the cheapest tier confident enough.
+        rules is the local classifier; if no tier is confident, the most
+        confident answer is used.
+        """
+        requires_planning, preferences, confidence = rules(message)
+        best = IntentResult(requires_planning=requires_planning, preferences=preferences, confidence=confidence)
+        self.intents += 1
+        escalated = False
+        for tier in ESCALATION_ORDER[1:]:
+            if best.confidence >= self.confidence_threshold:
+                break
+            if not self.has_tier(tier):
+                continue
+            escalated = True
+            answer = await self._model_intent(message, tier)
+            if answer is not None and answer.confidence >= best.confidence:
+                best = answer
+        self.escalations += escalated
+        self.intent_routes[best.route.value] = self.intent_routes.get(best.route.value, 0) + 1
+        return best
+
+    async def _model_intent(self, message: str, tier: ModelTier) -> Optional[IntentResult]:
+        try:
+            text = await self.complete("intent", tier, [("system", INTENT_PROMPT), ("human", message)])
+            answer = json.loads(text[text.index("{"):text.rindex("}") + 1])
+            return IntentResult(
+                requires_planning=bool(answer.get("requires_planning")),
+                preferences=answer.get("preferences") or None,
+                confidence=float(answer.get("confidence", 0.0)),
+                route=tier
+            )
+        except (RouteError, ValueError, TypeError, AttributeError):
+            # No usable answer from this tier; the next one may do better
+            self._metrics("intent", tier).errors += 1
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "intents": self.intents,
+            # Tier whose answer was used
+            "intent_routes": dict(self.intent_routes),
+            # Share of messages that needed at least one model call
+            "escalation_rate": round(self.escalations / self.intents, 4) if self.intents else 0.0,
+            "routes": {key: metrics.stats() for key, metrics in self._routes.items()}
+        }
+
+
+class RoutedTokenSource(TokenSource):
+    """
+    Streams chat replies through the router's hedged providers for one tier
+    """
+
+    def __init__(self, router: ModelRouter, tier: ModelTier):
+        self.router = router
+        self.tier = tier
+
+    async def stream(self, messages: List[Any], draft: str) -> AsyncIterator[str]:
+        async for token in self.router.stream("reply", self.tier, messages):
+            yield token
+
+
+# Published per-1000-token prices (input, output) in USD
+LIVE_MODELS: Dict[ModelTier, List[Tuple[str, str, float, float]]] = {
+    ModelTier.SMALL: [
+        ("openai", "gpt-3.5-turbo", 0.0005, 0.0015),
+        ("anthropic", "claude-3-haiku-20240307", 0.00025, 0.00125),
+    ],
+    ModelTier.LARGE: [
+        ("openai", "gpt-4-turbo-preview", 0.01, 0.03),
+        ("anthropic", "claude-3-opus-20240229", 0.015, 0.075),
+    ],
+}
+
+
+# Filler the fake providers stream as replies
+FAKE_REPLY_TEXT = (
+    "Here is a plan built around the neighbourhoods you will enjoy most, with time for food, "
+    "sights and a few quieter places between them. "
+)
+
+
+def fake_reply(reply_tokens: int) -> Callable[[Sequence[Any]], str]:
+    """
+    Replies for the fake providers: reply_tokens words of filler, and an
+    intent answer with no confidence, so the rule-based one is kept
+    """
+    words = word_tokens(FAKE_REPLY_TEXT)
+    text = "".join(words[i % len(words)] for i in range(reply_tokens)).rstrip()
+    intent = json.dumps({"requires_planning": False, "preferences": None, "confidence": 0.0})
+
+    def reply(messages: Sequence[Any]) -> str:
+        if messages and _message_text(messages[:1]) == INTENT_PROMPT:
+            return intent
+        return text
+
+    return reply
+
+
+def fake_providers(
+    first_token_ms: float = 300.0,
+    tokens_per_second: float = 50.0,
+    reply_tokens: int = 60
+) -> Dict[ModelTier, List[ChatProvider]]:
+    """
+    Stand-ins for the live tiers, with the live models' names and prices,
+    answering after first_token_ms and streaming at tokens_per_second.
+    For load tests and benchmarks without network access or API spend.
+    """
+    reply = fake_reply(reply_tokens)
+    return {
+        tier: [
+            StubProvider(
+                name, f"fake-{model}", reply,
+                latency_ms=first_token_ms,
+                tokens_per_second=tokens_per_second,
+                input_cost_per_1k=input_cost,
+                output_cost_per_1k=output_cost
+            )
+            for name, model, input_cost, output_cost in models
+        ]
+        for tier, models in LIVE_MODELS.items()
+    }
+
+
+def create_model_router() -> ModelRouter:
+    """
+    Build the router configured through environment variables. With
+    MODEL_ROUTING=rules (the default) only the local classifier runs and
+    replies come from the agent's own token source; MODEL_ROUTING=live
+    adds the OpenAI and Anthropic tiers, and MODEL_ROUTING=fake local
+    stand-ins for them (see fake_providers).
+    """
+    providers: Dict[ModelTier, List[ChatProvider]] = {}
+    routing = os.getenv("MODEL_ROUTING", "rules")
+    if routing == "live":
+        providers = {
+            tier: [LangChainProvider(name, model, input_cost, output_cost) for name, model, input_cost, output_cost in models]
+            for tier, models in LIVE_MODELS.items()
+        }
+    elif routing == "fake":
+        providers = fake_providers(
+            first_token_ms=float(os.getenv("FAKE_LLM_FIRST_TOKEN_MS", "300")),
+            tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "50")),
+            reply_tokens=int(os.getenv("FAKE_LLM_REPLY_TOKENS", "60"))
+        )
+    return ModelRouter(
+        providers,
+        confidence_threshold=float(os.getenv("MODEL_ROUTER_CONFIDENCE", "0.8")),
+        hedge_after_ms=float(os.getenv("MODEL_HEDGE_AFTER_MS", "1500")),
+        deadline_ms=float(os.getenv("MODEL_DEADLINE_MS", "20000"))
+    )
+
+
+# Shared by the agents in the process
+model_router = create_model_router()
@@ -0,0 +1,182 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+
+from models import Attraction
+from services.routing import TimeWindow
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+MINUTES_PER_DAY = 24 * 60
+
+# Weekday by key in opening_hours: full names and three-letter abbreviations, any case
+_WEEKDAY_BY_NAME = {
+    **{name: weekday for weekday, name in enumerate(WEEKDAYS)},
+    **{name[:3]: weekday for weekday, name in enumerate(WEEKDAYS)}
+}
+
+# The window of a day without usable hours: open whenever a visit could happen
+_UNCONSTRAINED: TimeWindow = (-MINUTES_PER_DAY, 2 * MINUTES_PER_DAY)
+
+
+def _parse_clock(value: str) -> int:
+    hours, minutes = value.strip().split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def _parse_day(value: str) -> Optional[List[TimeWindow]]:
+    """
+    The windows of one day's "HH:MM-HH:MM[, HH:MM-HH:MM]" hours, closing
+    times past midnight as minutes after 24:00. "closed" has none;
+    unparseable hours give None.
+    """
+    value = value.strip().lower()
+    if value == "closed":
+        return []
+    if value in ("24 hours", "open 24 hours"):
+        return [(0, MINUTES_PER_DAY)]
+    windows = []
+    try:
+        for part in value.replace(";", ",").split(","):
+            opens, closes = part.split("-")
+            opens_minute, closes_minute = _parse_clock(opens), _parse_clock(closes)
+            if closes_minute <= opens_minute:
+                # Open past midnight
+                closes_minute += MINUTES_PER_DAY
+            windows.append((opens_minute, closes_minute))
+    except ValueError:
+        return None
+    return windows
+
+
+def _merge(windows: List[TimeWindow]) -> List[TimeWindow]:
+    merged: List[TimeWindow] = []
+    for opens, closes in sorted(windows):
+        if merged and opens <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], closes))
+        else:
+            merged.append((opens, closes))
+    return merged
+
+
+class WeeklyHours:
+    """
+    Opening hours parsed into sorted, disjoint windows per weekday, in
+    minutes since that day's midnight. A day's windows include the part
+    of the previous day's hours that runs past midnight (as negative
+    opening minutes), so every query looks at a single day: is_open and
+    next_window are a binary search, earliest_start one more step per
+    window too short for the visit. Days missing from the hours, or with
+    hours that don't parse, are unconstrained.
+    """
+    __slots__ = ("always_open", "_opens", "_closes", "_envelopes")
+
+    def __init__(self, days: Sequence[Optional[List[TimeWindow]]]):
+        windows: List[List[TimeWindow]] = [[] for _ in WEEKDAYS]
+        for weekday, day in enumerate(days):
+            if day is None:
+                windows[weekday].append(_UNCONSTRAINED)
+                continue
+            for opens, closes in day:
+                windows[weekday].append((opens, closes))
+                if closes > MINUTES_PER_DAY:
+                    following = windows[(weekday + 1) % len(WEEKDAYS)]
+                    following.append((opens - MINUTES_PER_DAY, closes - MINUTES_PER_DAY))
+        merged = [_merge(day) for day in windows]
+        self.always_open = all(day is None for day in days)
+        self._opens = tuple(tuple(opens for opens, _ in day) for day in merged)
+        self._closes = tuple(tuple(closes for _, closes in day) for day in merged)
+        self._envelopes = tuple(
+            None if day is None else ((merged[weekday][0][0], merged[weekday][-1][1]) if merged[weekday] else (0, 0))
+            for weekday, day in enumerate(days)
+        )
+
+    def is_open(self, weekday: int, minute: int) -> bool:
+        """
+        Whether the place is open at minute (since midnight) of weekday (0 = Monday)
+        """
+        opens = self._opens[weekday]
+        index = bisect_right(opens, minute) - 1
+        return index >= 0 and minute < self._closes[weekday][index]
+
+    def next_window(self, weekday: int, minute: int) -> Optional[TimeWindow]:
+        """
+        The window open at minute, or else the next one to open that day
+        """
+        closes = self._closes[weekday]
+        index = bisect_right(closes, minute)
+        if index == len(closes):
+            return None
+        return (self._opens[weekday][index], closes[index])
+
+    def earliest_start(self, weekday: int, minute: int, duration: int) -> Optional[int]:
+        """
+        The earliest minute at or after minute at which a visit of duration
+        minutes fits inside one window, or None if none is left that day
+        """
+        opens, closes = self._opens[weekday], self._closes[weekday]
+        index = bisect_left(closes, minute + duration)
+        while index < len(closes):
+            start = max(minute, opens[index])
+            if start + duration <= closes[index]:
+                return start
+            index += 1
+        return None
+
+    def envelope(self, weekday: int) -> Optional[TimeWindow]:
+        """
+        First opening to last closing of a weekday, as one window for the
+        route solver: None if unconstrained, (0, 0) if closed all day
+        """
+        return self._envelopes[weekday]
+
+
+ALWAYS_OPEN = WeeklyHours([None] * len(WEEKDAYS))
+
+
+@lru_cache(maxsize=4096)
+def _parse(items: Tuple[Tuple[str, str], ...]) -> WeeklyHours:
+    days: List[Optional[List[TimeWindow]]] = [None] * len(WEEKDAYS)
+    for name, value in items:
+        weekday = _WEEKDAY_BY_NAME.get(name.strip().lower())
+        if weekday is not None and value:
+            days[weekday] = _parse_day(value)
+    if all(day is None for day in days):
+        return ALWAYS_OPEN
+    return WeeklyHours(days)
+
+
+def parse_opening_hours(opening_hours: Optional[Dict[str, str]]) -> WeeklyHours:
+    """
+    Parse an attraction's opening_hours. Places tend to share hours, so
+    each distinct set is parsed once and the result shared.
+    """
+    if not opening_hours:
+        return ALWAYS_OPEN
+    return _parse(tuple(sorted(opening_hours.items())))
+
+
+def weekly_hours(attraction: Attraction) -> WeeklyHours:
+    """
+    An attraction's parsed hours, kept on the attraction after the first call
+    """
+    # Through the private dict: pydantic's lookup of private attributes
+    # costs several times what a query does
+    private = attraction.__pydantic_private__
+    hours = private["_weekly_hours"]
+    if hours is None:
+        hours = parse_opening_hours(attraction.opening_hours)
+        private["_weekly_hours"] = hours
+    return hours
+
+
+def visit_start(attraction: Attraction, weekday: int, minute: int) -> Optional[int]:
+    """
+    When a visit to attraction arriving at minute of weekday can begin:
+    on arrival, or once it opens if that is later. None if no window
+    left that day is long enough for the visit.
+    """
+    hours = weekly_hours(attraction)
+    if hours.always_open:
+        return minute
+    return hours.earliest_start(weekday, minute, attraction.duration_minutes)
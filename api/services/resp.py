@@ -0,0 +1,342 @@
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Set, Tuple
+from collections import deque
+from urllib.parse import urlparse
+import asyncio
+import logging
+import socket
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from a socket at a time
+READ_SIZE = 65536
+
+# Seconds between attempts to reconnect a dropped subscriber
+RECONNECT_DELAY_SECONDS = 0.5
+
+
+class RespError(Exception):
+    """
+    An error reply from the server
+    """
+
+
+def parse_url(url: str) -> Tuple[str, int, int]:
+    """
+    Host, port and database number of a redis://host:port/db URL
+    """
+    parsed = urlparse(url)
+    if parsed.scheme != "redis":
+        raise ValueError(f"Expected a redis:// URL, got {url!r}")
+    return parsed.hostname or "127.0.0.1", parsed.port or 6379, int(parsed.path.lstrip("/") or 0)
+
+
+def _bulk(value: Any) -> bytes:
+    if isinstance(value, bytes):
+        data = value
+    elif isinstance(value, str):
+        data = value.encode("utf-8")
+    else:
+        data = str(value).encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+def encode_command(*args: Any) -> bytes:
+    """
+    A command as a RESP array of bulk strings; ints and strs are sent as their text
+    """
+    return b"*%d\r\n" % len(args) + b"".join(_bulk(arg) for arg in args)
+
+
+def parse_reply(buffer: bytes, pos: int = 0) -> Optional[Tuple[Any, int]]:
+    """
+    The RESP value starting at pos and the position after it, or None if
+    the buffer ends first. Bulk strings are bytes, simple strings str,
+    error replies RespError instances (returned, not raised) and nil None.
+    """
+    end = buffer.find(b"\r\n", pos)
+    if end < 0:
+        return None
+    kind, line, pos = buffer[pos:pos + 1], buffer[pos + 1:end], end + 2
+    if kind == b"$":
+        length = int(line)
+        if length < 0:
+            return None, pos
+        if len(buffer) < pos + length + 2:
+            return None
+        return buffer[pos:pos + length], pos + length + 2
+    if kind == b"*":
+        length = int(line)
+        if length < 0:
+            return None, pos
+        items = []
+        for _ in range(length):
+            parsed = parse_reply(buffer, pos)
+            if parsed is None:
+                return None
+            item, pos = parsed
+            items.append(item)
+        return items, pos
+    if kind == b":":
+        return int(line), pos
+    if kind == b"+":
+        return line.decode("utf-8"), pos
+    if kind == b"-":
+        return RespError(line.decode("utf-8")), pos
+    raise RespError(f"Unexpected reply type {kind!r}")
+
+
+class _ReplyBuffer:
+    """
+    Bytes received but not yet parsed into replies
+    """
+    __slots__ = ("data", "pos")
+
+    def __init__(self):
+        self.data = b""
+        self.pos = 0
+
+    def feed(self, chunk: bytes):
+        self.data = self.data[self.pos:] + chunk
+        self.pos = 0
+
+    def next(self) -> Optional[Tuple[Any]]:
+        """
+        The next complete reply as a 1-tuple, or None
+        """
+        parsed = parse_reply(self.data, self.pos)
+        if parsed is None:
+            return None
+        value, self.pos = parsed
+        return (value,)
+
+
+class RespClient:
+    """
+    Blocking client on one socket, for callers that are synchronous anyway
+    (see RedisSessionStore). Not thread-safe: use one per thread.
+    """
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        host, port, db = parse_url(url)
+        self._socket = socket.create_connection((host, port), timeout=timeout)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._buffer = _ReplyBuffer()
+        if db:
+            self.execute("SELECT", db)
+
+    def execute(self, *args: Any) -> Any:
+        reply = self.pipeline([args])[0]
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+    def pipeline(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        """
+        Send the commands in one write and return their replies in order,
+        error replies included as RespError values
+        """
+        self._socket.sendall(b"".join(encode_command(*command) for command in commands))
+        return [self._read_reply() for _ in commands]
+
+    def _read_reply(self) -> Any:
+        while True:
+            reply = self._buffer.next()
+            if reply is not None:
+                return reply[0]
+            chunk = self._socket.recv(READ_SIZE)
+            if not chunk:
+                raise ConnectionError("Server closed the connection")
+            self._buffer.feed(chunk)
+
+    def close(self):
+        self._socket.close()
+
+
+class AsyncRespClient:
+    """
+    Pipelined asyncio client: commands from any number of tasks share one
+    connection and each gets its reply in order. Reconnects on the next
+    command after the connection drops.
+    """
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._waiting: Deque[asyncio.Future] = deque()
+        self._connecting: Optional[asyncio.Future] = None
+
+    async def execute(self, *args: Any) -> Any:
+        if self._writer is None:
+            await self._connect()
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.append(future)
+        self._writer.write(encode_command(*args))
+        reply = await future
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+    async def _connect(self):
+        # Concurrent first commands share one connection attempt
+        if self._connecting is None:
+            self._connecting = asyncio.ensure_future(self._open())
+        try:
+            await asyncio.shield(self._connecting)
+        finally:
+            self._connecting = None
+
+    async def _open(self):
+        host, port, db = parse_url(self.url)
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), self.timeout)
+        writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._writer = writer
+        self._reader_task = asyncio.create_task(self._read_loop(reader))
+        if db:
+            await self.execute("SELECT", db)
+
+    async def _read_loop(self, reader: asyncio.StreamReader):
+        buffer = _ReplyBuffer()
+        error: Exception = ConnectionError("Server closed the connection")
+        try:
+            while True:
+                chunk = await reader.read(READ_SIZE)
+                if not chunk:
+                    break
+                buffer.feed(chunk)
+                reply = buffer.next()
+                while reply is not None:
+                    if self._waiting:
+                        future = self._waiting.popleft()
+                        if not future.done():
+                            future.set_result(reply[0])
+                    reply = buffer.next()
+        except (OSError, RespError) as exc:
+            error = exc
+        finally:
+            self._writer = None
+            while self._waiting:
+                future = self._waiting.popleft()
+                if not future.done():
+                    future.set_exception(error)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._reader_task is not None:
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+
+
+class RespSubscriber:
+    """
+    A connection in pub/sub mode. on_message(channel, data) is called for
+    every message on a subscribed channel, in the order the server sent
+    them. If the connection drops it is reopened and every channel
+    subscribed again; messages published meanwhile are lost.
+    """
+
+    def __init__(self, url: str, on_message: Callable[[bytes, bytes], None], timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+        self.on_message = on_message
+        self.channels: Set[bytes] = set()
+        self.reconnects = 0
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._confirmed: Set[bytes] = set()
+        # Channel -> futures of subscribe calls waiting for the server's confirmation
+        self._pending: Dict[bytes, List[asyncio.Future]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._connected: Optional[asyncio.Future] = None
+
+    async def start(self):
+        """
+        Connect, waiting until the connection is up
+        """
+        self._connected = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._run())
+        await asyncio.wait_for(asyncio.shield(self._connected), self.timeout)
+
+    async def subscribe(self, channel: bytes):
+        """
+        Subscribe to channel, returning once the server has confirmed it
+        (or after the timeout if the server is unreachable; the channel
+        is subscribed when the connection comes back)
+        """
+        if channel in self._confirmed:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(channel, []).append(future)
+        if channel not in self.channels:
+            self.channels.add(channel)
+            self._send(b"SUBSCRIBE", channel)
+        try:
+            await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning("No confirmation of subscription to %r", channel)
+
+    def unsubscribe(self, channel: bytes):
+        if channel in self.channels:
+            self.channels.discard(channel)
+            self._confirmed.discard(channel)
+            self._send(b"UNSUBSCRIBE", channel)
+
+    def _send(self, *args: Any):
+        if self._writer is not None:
+            self._writer.write(encode_command(*args))
+
+    async def _run(self):
+        host, port, db = parse_url(self.url)
+        while True:
+            try:
+                reader, self._writer = await asyncio.wait_for(asyncio.open_connection(host, port), self.timeout)
+                if db:
+                    self._send(b"SELECT", db)
+                if self.channels:
+                    self._send(b"SUBSCRIBE", *self.channels)
+                if not self._connected.done():
+                    self._connected.set_result(None)
+                await self._read_loop(reader)
+            except (OSError, asyncio.TimeoutError, RespError) as exc:
+                logger.warning("Subscriber connection to %s lost: %s", self.url, exc)
+            self._writer = None
+            self._confirmed.clear()
+            self.reconnects += 1
+            await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+
+    async def _read_loop(self, reader: asyncio.StreamReader):
+        buffer = _ReplyBuffer()
+        while True:
+            chunk = await reader.read(READ_SIZE)
+            if not chunk:
+                return
+            buffer.feed(chunk)
+            reply = buffer.next()
+            while reply is not None:
+                self._dispatch(reply[0])
+                reply = buffer.next()
+
+    def _dispatch(self, reply: Any):
+        if not isinstance(reply, list) or not reply:
+            return
+        kind = reply[0]
+        if kind == b"message":
+            try:
+                self.on_message(reply[1], reply[2])
+            except Exception:
+                logger.exception("Message handler failed")
+        elif kind == b"subscribe":
+            channel = reply[1]
+            if channel in self.channels:
+                self._confirmed.add(channel)
+            for future in self._pending.pop(channel, ()):
+                if not future.done():
+                    future.set_result(None)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
@@ -0,0 +1,400 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import zlib
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Cosine similarity above which a cached reply answers a differently worded prompt
+DEFAULT_SIMILARITY_THRESHOLD = 0.9
+
+DEFAULT_EMBEDDING_DIM = 256
+
+# Queued SQLite writes applied in one transaction
+WRITE_BATCH_SIZE = 256
+
+# Text -> unit-length vector
+Embedder = Callable[[str], np.ndarray]
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+_NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+
+
+def normalize_prompt(text: str) -> str:
+    """
+    Lowercase, punctuation-free, single-spaced form of a prompt
+    """
+    return " ".join(_WORD_PATTERN.findall(text.lower()))
+
+
+class HashingEmbedder:
+    """
+    Deterministic local embedding: word unigrams, word bigrams and
+    character trigrams hashed into a fixed number of buckets. Needs no
+    model or network, so tests and benchmarks give the same results
+    everywhere; a model-backed embedder can replace it.
+    """
+
+    def __init__(self, dim: int = DEFAULT_EMBEDDING_DIM):
+        self.dim = dim
+
+    def __call__(self, text: str) -> np.ndarray:
+        words = normalize_prompt(text).split()
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        joined = f" {' '.join(words)} "
+        features += [joined[i:i + 3] for i in range(len(joined) - 2)]
+
+        # crc32 is stable across processes, unlike hash(), so persisted embeddings stay valid
+        hashes = np.fromiter((zlib.crc32(feature.encode("utf-8")) for feature in features), dtype=np.uint32, count=len(features))
+        # Signed hashing keeps collisions from only ever adding up
+        signs = np.where(hashes >> 31, 1.0, -1.0).astype(np.float32)
+        vector = np.bincount(hashes % self.dim, weights=signs, minlength=self.dim).astype(np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+
+class _Entry:
+    __slots__ = ("namespace", "embedding", "payload", "expires_at")
+
+    def __init__(self, namespace: str, embedding: np.ndarray, payload: str, expires_at: float):
+        self.namespace = namespace
+        self.embedding = embedding
+        self.payload = payload
+        self.expires_at = expires_at
+
+
+class _Namespace:
+    """
+    Keys sharing a model and preferences, with their embeddings as rows of
+    one matrix for a single matrix-vector product per lookup. Rows are
+    added and removed in place, so writes don't restack the matrix.
+    """
+    __slots__ = ("keys", "rows", "matrix")
+
+    def __init__(self, dim: int):
+        self.keys: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.matrix = np.empty((8, dim), dtype=np.float32)
+
+    def add(self, key: str, embedding: np.ndarray):
+        if len(self.keys) == len(self.matrix):
+            grown = np.empty((len(self.matrix) * 2, self.matrix.shape[1]), dtype=np.float32)
+            grown[:len(self.keys)] = self.matrix
+            self.matrix = grown
+        self.rows[key] = len(self.keys)
+        self.matrix[len(self.keys)] = embedding
+        self.keys.append(key)
+
+    def remove(self, key: str):
+        # Move the last row into the freed one
+        row = self.rows.pop(key)
+        last = self.keys.pop()
+        if last != key:
+            self.keys[row] = last
+            self.rows[last] = row
+            self.matrix[row] = self.matrix[len(self.keys)]
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        return self.matrix[:len(self.keys)] @ query
+
+
+class ResponseCache:
+    """
+    Two-tier cache for model replies. Tier one matches the normalized
+    prompt exactly; tier two returns the reply to the most similar cached
+    prompt above a cosine threshold. Both tiers only consider entries with
+    the same model, preferences and numbers in the prompt, so "3 days"
+    never answers "5 days". Entries expire after ttl_seconds and the least
+    recently used are evicted past max_entries. With a path, entries are
+    also written to SQLite (evictions delete them there too) and reloaded
+    on start. Those writes are queued for a background thread, so lookups
+    and puts from the event loop never wait on the database.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl_seconds: Optional[float] = 3600.0,
+        similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        embedder: Optional[Embedder] = None,
+        path: Optional[str] = None
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.embedder = embedder or HashingEmbedder()
+        self.path = path
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # (statement, parameters) for the writer thread, None to stop it
+        self._writes: "queue.Queue[Optional[Tuple[str, Tuple[Any, ...]]]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        if path:
+            self._load()
+            self._writer = threading.Thread(target=self._write_loop, name="response-cache-writer", daemon=True)
+            self._writer.start()
+
+    @staticmethod
+    def namespace(model: str, preferences: Optional[Dict[str, Any]], prompt: str) -> str:
+        material = json.dumps(
+            [model, preferences or {}, _NUMBER_PATTERN.findall(prompt)],
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _key(namespace: str, normalized: str) -> str:
+        return hashlib.sha256(f"{namespace}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def get(
+        self,
+        prompt: str,
+        model: str,
+        preferences: Optional[Dict[str, Any]] = None
+    ) -> Tuple[Optional[Any], Optional[str]]:
+        """
+        Cached reply for a prompt and the tier that answered it
+        ("exact" or "semantic"), or (None, None) on a miss
+        """
+        normalized = normalize_prompt(prompt)
+        namespace = self.namespace(model, preferences, normalized)
+        key = self._key(namespace, normalized)
+        now = time.time()
+
+        with self._lock:
+            entry = self._live_entry(key, now)
+            if entry is not None:
+                self.exact_hits += 1
+                return json.loads(entry.payload), "exact"
+
+            found = self._nearest(namespace, normalized, now)
+            if found is None:
+                self.misses += 1
+                return None, None
+            self.semantic_hits += 1
+            return json.loads(found[1].payload), "semantic"
+
+    def put(
+        self,
+        prompt: str,
+        model: str,
+        value: Any,
+        preferences: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Cache a JSON-serializable reply
+        """
+        normalized = normalize_prompt(prompt)
+        namespace = self.namespace(model, preferences, normalized)
+        key = self._key(namespace, normalized)
+        payload = json.dumps(value, default=str)
+        embedding = self.embedder(normalized)
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds else float("inf")
+
+        with self._lock:
+            self._install(key, _Entry(namespace, embedding, payload, expires_at))
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+        if self.path:
+            self._write(
+                "INSERT OR REPLACE INTO response_cache "
+                "(key, namespace, embedding, payload, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, namespace, embedding.tobytes(), payload, expires_at, time.time())
+            )
+
+    def _live_entry(self, key: str, now: float) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < now:
+            self._drop(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _nearest(self, namespace: str, normalized: str, now: float) -> Optional[Tuple[str, _Entry]]:
+        group = self._namespaces.get(namespace)
+        if group is None:
+            return None
+        query = self.embedder(normalized)
+        while group.keys:
+            scores = group.scores(query)
+            best = int(scores.argmax())
+            if scores[best] < self.similarity_threshold:
+                return None
+            key = group.keys[best]
+            entry = self._live_entry(key, now)
+            if entry is not None:
+                return key, entry
+            # Expired and dropped: look again among the rest
+            group = self._namespaces.get(namespace)
+            if group is None:
+                return None
+        return None
+
+    def _install(self, key: str, entry: _Entry):
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = entry
+        group = self._namespaces.get(entry.namespace)
+        if group is None:
+            group = self._namespaces[entry.namespace] = _Namespace(len(entry.embedding))
+        group.add(key, entry.embedding)
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key)
+        group = self._namespaces[entry.namespace]
+        group.remove(key)
+        if not group.keys:
+            del self._namespaces[entry.namespace]
+        if self.path:
+            self._write("DELETE FROM response_cache WHERE key = ?", (key,))
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, statement: str, parameters: Tuple[Any, ...] = ()):
+        # After close the cache carries on in memory only
+        if self._writer is not None:
+            self._writes.put((statement, parameters))
+
+    def _write_loop(self):
+        """
+        Apply queued writes in order, as many as are waiting (up to
+        WRITE_BATCH_SIZE) per transaction
+        """
+        while True:
+            batch = [self._writes.get()]
+            while batch[-1] is not None and len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            writes = [write for write in batch if write is not None]
+            try:
+                if writes:
+                    conn = self._conn()
+                    with conn:
+                        conn.execute("BEGIN")
+                        for statement, parameters in writes:
+                            conn.execute(statement, parameters)
+            except sqlite3.Error:
+                logger.exception("Dropped %d response cache writes", len(writes))
+            finally:
+                for _ in batch:
+                    self._writes.task_done()
+            if batch[-1] is None:
+                return
+
+    def flush(self):
+        """
+        Wait until every queued SQLite write is applied
+        """
+        if self._writer is not None:
+            self._writes.join()
+
+    def close(self):
+        """
+        Apply the queued writes and stop the writer thread
+        """
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join()
+            self._writer = None
+
+    def _load(self):
+        """
+        Create the table if needed and load the most recently written live entries
+        """
+        conn = self._conn()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS response_cache (
+                key TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                payload TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS response_cache_accessed ON response_cache(accessed_at)")
+        conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (time.time(),))
+        rows = conn.execute(
+            "SELECT key, namespace, embedding, payload, expires_at FROM response_cache "
+            "ORDER BY accessed_at DESC LIMIT ?",
+            (self.max_entries,)
+        ).fetchall()
+        # Oldest first so the newest are evicted last
+        for key, namespace, embedding, payload, expires_at in reversed(rows):
+            vector = np.frombuffer(embedding, dtype=np.float32)
+            self._install(key, _Entry(namespace, vector, payload, expires_at))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._namespaces.clear()
+        if self.path:
+            self._write("DELETE FROM response_cache")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+def create_response_cache() -> Optional[ResponseCache]:
+    """
+    Build the response cache configured through environment variables;
+    None when RESPONSE_CACHE=off
+    """
+    backend = os.getenv("RESPONSE_CACHE", "memory")
+    if backend == "off":
+        return None
+    ttl_seconds = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+    return ResponseCache(
+        max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000")),
+        ttl_seconds=ttl_seconds or None,
+        similarity_threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", str(DEFAULT_SIMILARITY_THRESHOLD))),
+        path=os.getenv("RESPONSE_CACHE_PATH", "/tmp/response_cache.db") if backend == "sqlite" else None
+    )
+
+
+# Shared by the chat agent and the trip planner
+response_cache = create_response_cache()
@@ -0,0 +1,339 @@
+from typing import List, Optional, Tuple
+from pydantic import BaseModel
+import time
+
+# Days with at most this many stops are solved exactly with Held-Karp DP
+EXACT_DP_MAX_STOPS = 7
+
+# Cost of one minute spent at a place after it closes, in travel minutes
+LATE_PENALTY = 1000.0
+
+# Hard limits for the local search on larger days
+DEFAULT_TIME_BUDGET_MS = 8.0
+DEFAULT_MAX_ITERATIONS = 200000
+
+# Or-opt moves segments of up to this many consecutive stops
+OR_OPT_MAX_SEGMENT = 3
+
+# (opens, closes) in minutes since midnight
+TimeWindow = Tuple[int, int]
+
+
+class RouteResult(BaseModel):
+    order: List[int]
+    travel_minutes: float
+    lateness_minutes: float
+    method: str
+    iterations: int
+    elapsed_ms: float
+
+
+def evaluate_route(
+    order: List[int],
+    travel: List[List[float]],
+    durations: List[int],
+    windows: List[Optional[TimeWindow]],
+    start_minute: int
+) -> Tuple[float, float]:
+    """
+    Walk a route and return (total travel minutes, minutes spent past closing).
+    Arriving before a place opens waits until it does.
+    """
+    clock = start_minute
+    total_travel = 0.0
+    lateness = 0.0
+    previous = None
+    for stop in order:
+        if previous is not None:
+            leg = travel[previous][stop]
+            total_travel += leg
+            clock += leg
+        window = windows[stop]
+        if window is not None:
+            opens, closes = window
+            if clock < opens:
+                clock = opens
+            overrun = clock + durations[stop] - closes
+            if overrun > 0:
+                lateness += overrun
+        clock += durations[stop]
+        previous = stop
+    return total_travel, lateness
+
+
+def _route_cost(order, travel, durations, windows, start_minute) -> float:
+    total_travel, lateness = evaluate_route(order, travel, durations, windows, start_minute)
+    return total_travel + LATE_PENALTY * lateness
+
+
+def solve_route(
+    travel: List[List[float]],
+    durations: List[int],
+    windows: Optional[List[Optional[TimeWindow]]] = None,
+    start_minute: int = 9 * 60,
+    initial_order: Optional[List[int]] = None,
+    time_budget_ms: float = DEFAULT_TIME_BUDGET_MS,
+    max_iterations: int = DEFAULT_MAX_ITERATIONS
+) -> RouteResult:
+    """
+    Order a day's stops to minimise total travel time while visiting
+    each stop inside its opening window where possible.
+    The route is open: it starts at any stop and does not return.
+    """
+    started = time.perf_counter()
+    n = len(durations)
+    if windows is None:
+        windows = [None] * n
+    if initial_order is None:
+        initial_order = list(range(n))
+
+    if n <= 2:
+        order, method, iterations = _best_of_trivial(initial_order, travel, durations, windows, start_minute), "trivial", n
+    elif n <= EXACT_DP_MAX_STOPS:
+        order, iterations = _held_karp(travel, durations, windows, start_minute)
+        method = "exact_dp"
+    else:
+        deadline = started + time_budget_ms / 1000.0
+        if any(window is not None for window in windows):
+            order, iterations = _local_search(
+                initial_order, travel, durations, windows, start_minute, deadline, max_iterations
+            )
+        else:
+            # Without time windows moves can be scored from the changed edges alone
+            order, iterations = _local_search_travel_only(initial_order, travel, deadline, max_iterations)
+        method = "local_search"
+
+    total_travel, lateness = evaluate_route(order, travel, durations, windows, start_minute)
+    return RouteResult(
+        order=order,
+        travel_minutes=round(total_travel, 2),
+        lateness_minutes=round(lateness, 2),
+        method=method,
+        iterations=iterations,
+        elapsed_ms=round((time.perf_counter() - started) * 1000, 3)
+    )
+
+
+def _best_of_trivial(order, travel, durations, windows, start_minute) -> List[int]:
+    if len(order) < 2:
+        return list(order)
+    reversed_order = list(reversed(order))
+    if _route_cost(reversed_order, travel, durations, windows, start_minute) < _route_cost(
+        order, travel, durations, windows, start_minute
+    ):
+        return reversed_order
+    return list(order)
+
+
+def _held_karp(travel, durations, windows, start_minute) -> Tuple[List[int], int]:
+    """
+    Subset DP over (visited set, last stop). Exact for travel time; with
+    time windows each state keeps its cheapest label, earliest finish on ties.
+    """
+    n = len(durations)
+    full = (1 << n) - 1
+    inf = float("inf")
+    cost = [[inf] * n for _ in range(full + 1)]
+    finish = [[0.0] * n for _ in range(full + 1)]
+    parent = [[-1] * n for _ in range(full + 1)]
+
+    def visit(clock: float, stop: int) -> Tuple[float, float]:
+        # Returns (finish time, lateness) of visiting a stop arriving at clock
+        window = windows[stop]
+        late = 0.0
+        if window is not None:
+            opens, closes = window
+            if clock < opens:
+                clock = opens
+            late = max(0.0, clock + durations[stop] - closes)
+        return clock + durations[stop], late
+
+    for stop in range(n):
+        end, late = visit(start_minute, stop)
+        cost[1 << stop][stop] = LATE_PENALTY * late
+        finish[1 << stop][stop] = end
+
+    iterations = 0
+    for mask in range(1, full + 1):
+        cost_row = cost[mask]
+        for last in range(n):
+            current = cost_row[last]
+            if current == inf:
+                continue
+            clock = finish[mask][last]
+            legs = travel[last]
+            for nxt in range(n):
+                bit = 1 << nxt
+                if mask & bit:
+                    continue
+                iterations += 1
+                leg = legs[nxt]
+                end, late = visit(clock + leg, nxt)
+                candidate = current + leg + LATE_PENALTY * late
+                next_mask = mask | bit
+                best = cost[next_mask][nxt]
+                if candidate < best or (candidate == best and end < finish[next_mask][nxt]):
+                    cost[next_mask][nxt] = candidate
+                    finish[next_mask][nxt] = end
+                    parent[next_mask][nxt] = last
+
+    last = min(range(n), key=lambda stop: cost[full][stop])
+    order = []
+    mask = full
+    while last != -1:
+        order.append(last)
+        previous = parent[mask][last]
+        mask ^= 1 << last
+        last = previous
+    order.reverse()
+    return order, iterations
+
+
+def _nearest_neighbour(first: int, travel) -> List[int]:
+    n = len(travel)
+    order = [first]
+    remaining = set(range(n))
+    remaining.discard(first)
+    while remaining:
+        legs = travel[order[-1]]
+        nxt = min(remaining, key=legs.__getitem__)
+        order.append(nxt)
+        remaining.discard(nxt)
+    return order
+
+
+def _local_search(
+    initial_order, travel, durations, windows, start_minute, deadline, max_iterations
+) -> Tuple[List[int], int]:
+    """
+    Nearest-neighbour construction improved with 2-opt and Or-opt moves,
+    stopping at a local optimum, the iteration cap or the deadline.
+    """
+    def cost_of(order):
+        return _route_cost(order, travel, durations, windows, start_minute)
+
+    best = list(initial_order)
+    best_cost = cost_of(best)
+    constructed = _nearest_neighbour(initial_order[0], travel)
+    constructed_cost = cost_of(constructed)
+    if constructed_cost < best_cost:
+        best, best_cost = constructed, constructed_cost
+
+    n = len(best)
+    iterations = 0
+    improved = True
+    while improved:
+        improved = False
+
+        # 2-opt: reverse the segment best[i..j]
+        for i in range(n - 1):
+            for j in range(i + 1, n):
+                iterations += 1
+                if iterations >= max_iterations or (iterations & 15 == 0 and time.perf_counter() > deadline):
+                    return best, iterations
+                candidate = best[:i] + best[i:j + 1][::-1] + best[j + 1:]
+                candidate_cost = cost_of(candidate)
+                if candidate_cost < best_cost - 1e-9:
+                    best, best_cost = candidate, candidate_cost
+                    improved = True
+
+        # Or-opt: move a short run of stops to another position
+        for length in range(1, OR_OPT_MAX_SEGMENT + 1):
+            for i in range(n - length + 1):
+                segment = best[i:i + length]
+                rest = best[:i] + best[i + length:]
+                for position in range(len(rest) + 1):
+                    if position == i:
+                        continue
+                    iterations += 1
+                    if iterations >= max_iterations or (iterations & 15 == 0 and time.perf_counter() > deadline):
+                        return best, iterations
+                    candidate = rest[:position] + segment + rest[position:]
+                    candidate_cost = cost_of(candidate)
+                    if candidate_cost < best_cost - 1e-9:
+                        best, best_cost = candidate, candidate_cost
+                        improved = True
+                        break
+                if improved:
+                    break
+            if improved:
+                break
+
+    return best, iterations
+
+
+def _local_search_travel_only(initial_order, travel, deadline, max_iterations) -> Tuple[List[int], int]:
+    """
+    Same search as _local_search for days without opening hours, scoring
+    2-opt and Or-opt moves in O(1) from the edges they add and remove.
+    Assumes a symmetric travel matrix.
+    """
+    def path_cost(order):
+        return sum(travel[a][b] for a, b in zip(order, order[1:]))
+
+    best = list(initial_order)
+    constructed = _nearest_neighbour(initial_order[0], travel)
+    if path_cost(constructed) < path_cost(best):
+        best = constructed
+
+    n = len(best)
+    iterations = 0
+    improved = True
+    while improved:
+        improved = False
+
+        # 2-opt on an open path: only the edges at the ends of the reversed segment change
+        for i in range(n - 1):
+            for j in range(i + 1, n):
+                iterations += 1
+                if iterations >= max_iterations or (iterations & 127 == 0 and time.perf_counter() > deadline):
+                    return best, iterations
+                delta = 0.0
+                if i > 0:
+                    delta += travel[best[i - 1]][best[j]] - travel[best[i - 1]][best[i]]
+                if j < n - 1:
+                    delta += travel[best[i]][best[j + 1]] - travel[best[j]][best[j + 1]]
+                if delta < -1e-9:
+                    best[i:j + 1] = best[i:j + 1][::-1]
+                    improved = True
+
+        # Or-opt: cut a short run out and splice it in between two other stops
+        for length in range(1, OR_OPT_MAX_SEGMENT + 1):
+            i = 0
+            while i <= n - length:
+                first, last = best[i], best[i + length - 1]
+                before = best[i - 1] if i > 0 else None
+                after = best[i + length] if i + length < n else None
+                removal_gain = 0.0
+                if before is not None:
+                    removal_gain += travel[before][first]
+                if after is not None:
+                    removal_gain += travel[last][after]
+                if before is not None and after is not None:
+                    removal_gain -= travel[before][after]
+
+                rest = best[:i] + best[i + length:]
+                moved = False
+                for position in range(len(rest) + 1):
+                    if position == i:
+                        continue
+                    iterations += 1
+                    if iterations >= max_iterations or (iterations & 127 == 0 and time.perf_counter() > deadline):
+                        return best, iterations
+                    u = rest[position - 1] if position > 0 else None
+                    v = rest[position] if position < len(rest) else None
+                    insertion_cost = 0.0
+                    if u is not None:
+                        insertion_cost += travel[u][first]
+                    if v is not None:
+                        insertion_cost += travel[last][v]
+                    if u is not None and v is not None:
+                        insertion_cost -= travel[u][v]
+                    if insertion_cost < removal_gain - 1e-9:
+                        best = rest[:position] + best[i:i + length] + rest[position:]
+                        improved = moved = True
+                        break
+                if not moved:
+                    i += 1
+
+    return best, iterations
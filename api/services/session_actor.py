@@ -0,0 +1,112 @@
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+from collections import deque
+import asyncio
+
+
+class SessionBusy(Exception):
+    """
+    The session already has as many mutations waiting as allowed
+    """
+
+
+class _Mutation:
+    __slots__ = ("operation", "key", "futures")
+
+    def __init__(self, operation: Callable[[], Awaitable[Any]], key: Optional[Hashable], future: asyncio.Future):
+        self.operation = operation
+        self.key = key
+        self.futures: List[asyncio.Future] = [future]
+
+
+class SessionActors:
+    """
+    Applies each session's mutations one at a time, in the order they were
+    submitted, while different sessions proceed independently. Each session
+    with pending work gets a worker task, which exits once its queue is
+    empty. A mutation submitted with a coalesce key replaces a not yet
+    started mutation with the same key at the end of the queue (a burst of
+    reorders of one day), and every caller of the replaced ones gets the
+    result of the latest.
+    """
+
+    def __init__(self, max_pending: int = 64):
+        self.max_pending = max_pending
+        self.submitted = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.max_depth = 0
+        self._queues: Dict[str, Deque[_Mutation]] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+
+    async def submit(
+        self,
+        session_id: str,
+        operation: Callable[[], Awaitable[Any]],
+        coalesce_key: Optional[Hashable] = None
+    ) -> Any:
+        """
+        Run operation after the session's earlier mutations and return its
+        result (or that of the mutation that replaced it). Once accepted a
+        mutation runs even if the caller stops waiting for it.
+        """
+        queue = self._queues.setdefault(session_id, deque())
+        mutation = _Mutation(operation, coalesce_key, asyncio.get_running_loop().create_future())
+        if coalesce_key is not None and queue and queue[-1].key == coalesce_key:
+            mutation.futures[:0] = queue.pop().futures
+            self.coalesced += 1
+        elif len(queue) >= self.max_pending:
+            self.rejected += 1
+            raise SessionBusy(f"session {session_id} has {len(queue)} changes waiting")
+        queue.append(mutation)
+        self.submitted += 1
+        self.max_depth = max(self.max_depth, len(queue))
+
+        if session_id not in self._workers:
+            self._workers[session_id] = asyncio.create_task(self._run(session_id, queue))
+        return await asyncio.shield(mutation.futures[-1])
+
+    async def _run(self, session_id: str, queue: Deque[_Mutation]):
+        try:
+            while queue:
+                mutation = queue.popleft()
+                try:
+                    result = await mutation.operation()
+                except asyncio.CancelledError:
+                    queue.appendleft(mutation)
+                    raise
+                except Exception as exc:
+                    for future in mutation.futures:
+                        if not future.done():
+                            future.set_exception(exc)
+                else:
+                    for future in mutation.futures:
+                        if not future.done():
+                            future.set_result(result)
+        finally:
+            # Nothing runs between the queue emptying and this, so no submit
+            # is lost; anything left means the worker was cancelled
+            del self._workers[session_id]
+            del self._queues[session_id]
+            for mutation in queue:
+                for future in mutation.futures:
+                    future.cancel()
+
+    def pending(self, session_id: str) -> int:
+        queue = self._queues.get(session_id)
+        return len(queue) if queue is not None else 0
+
+    async def close(self):
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "active_sessions": len(self._workers),
+            "pending": sum(len(queue) for queue in self._queues.values()),
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "max_depth": self.max_depth
+        }
@@ -0,0 +1,169 @@
+from typing import Any, Callable, Dict, Optional, Tuple
+from abc import ABC, abstractmethod
+import json
+import os
+
+from services.json_encoding import EncodedJSON, encode_json
+from services.resp import AsyncRespClient, RespSubscriber
+from services.telemetry import tracer
+
+# What ConnectionManager.broadcast sends: the message and, per client
+# protocol, a builder of the message those clients get instead (None: nothing)
+ByProtocol = Dict[str, Optional[Callable[[], Any]]]
+Handler = Callable[[str, Any, ByProtocol], int]
+
+
+def encode_frame(data: Any, by_protocol: ByProtocol) -> bytes:
+    """
+    A broadcast as bytes: a JSON header with the length of each part, a
+    newline, then the encoded message and the message for each protocol
+    that gets its own. Builders run here, since the workers receiving the
+    frame may have clients of any protocol.
+    """
+    parts = [encode_json(data)]
+    layout: Dict[str, Optional[int]] = {}
+    for protocol, build in by_protocol.items():
+        if build is None:
+            layout[protocol] = None
+        else:
+            parts.append(encode_json(build()))
+            layout[protocol] = len(parts[-1])
+    header = encode_json({"data": len(parts[0]), "by_protocol": layout})
+    return header + b"\n" + b"".join(parts)
+
+
+def decode_frame(frame: bytes) -> Tuple[EncodedJSON, ByProtocol]:
+    """
+    The message and builders of an encoded broadcast, as EncodedJSON so
+    the parts are forwarded to clients without being parsed
+    """
+    newline = frame.index(b"\n")
+    header = json.loads(frame[:newline])
+    pos = newline + 1
+    data = EncodedJSON(frame[pos:pos + header["data"]])
+    pos += header["data"]
+    by_protocol: ByProtocol = {}
+    for protocol, length in header["by_protocol"].items():
+        if length is None:
+            by_protocol[protocol] = None
+        else:
+            message = EncodedJSON(frame[pos:pos + length])
+            pos += length
+            by_protocol[protocol] = lambda message=message: message
+    return data, by_protocol
+
+
+class SessionBus(ABC):
+    """
+    Carries each session's broadcasts to the WebSocket clients of that
+    session in every worker. A worker subscribes to a session while it has
+    clients of it, and its ConnectionManager is the handler delivering
+    what arrives.
+    """
+
+    def __init__(self):
+        self.published = 0
+        self.received = 0
+        self._handler: Optional[Handler] = None
+
+    def attach(self, handler: Handler):
+        self._handler = handler
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    @abstractmethod
+    async def publish(self, session_id: str, data: Any, by_protocol: ByProtocol) -> int:
+        """
+        Send a broadcast to every subscribed worker
+        """
+
+    async def subscribe(self, session_id: str):
+        pass
+
+    def unsubscribe(self, session_id: str):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.__class__.__name__,
+            "published": self.published,
+            "received": self.received
+        }
+
+
+class LocalBus(SessionBus):
+    """
+    A single worker: broadcasts go straight to its own clients, builders
+    run only if a client needs them. Returns the number of clients reached.
+    """
+
+    async def publish(self, session_id: str, data: Any, by_protocol: ByProtocol) -> int:
+        self.published += 1
+        self.received += 1
+        return self._handler(session_id, data, by_protocol)
+
+
+class RedisBus(SessionBus):
+    """
+    Broadcasts published to one Redis channel per session, which each
+    worker subscribes to while it has clients of the session. Every
+    worker, the publisher included, delivers from its subscription, so
+    clients see a session's broadcasts in the order the server got them.
+    One connection publishes and one receives per worker. Returns the
+    number of workers reached.
+    """
+
+    CHANNEL_PREFIX = "session:"
+
+    def __init__(self, url: str):
+        super().__init__()
+        self.url = url
+        self._publisher = AsyncRespClient(url)
+        self._subscriber = RespSubscriber(url, self._receive)
+
+    async def start(self):
+        await self._subscriber.start()
+
+    async def close(self):
+        await self._subscriber.close()
+        await self._publisher.close()
+
+    def _channel(self, session_id: str) -> bytes:
+        return (self.CHANNEL_PREFIX + session_id).encode("utf-8")
+
+    async def publish(self, session_id: str, data: Any, by_protocol: ByProtocol) -> int:
+        with tracer.span("bus.publish"):
+            frame = encode_frame(data, by_protocol)
+            workers = await self._publisher.execute("PUBLISH", self._channel(session_id), frame)
+        self.published += 1
+        return workers
+
+    async def subscribe(self, session_id: str):
+        await self._subscriber.subscribe(self._channel(session_id))
+
+    def unsubscribe(self, session_id: str):
+        self._subscriber.unsubscribe(self._channel(session_id))
+
+    def _receive(self, channel: bytes, frame: bytes):
+        self.received += 1
+        data, by_protocol = decode_frame(frame)
+        self._handler(channel.decode("utf-8")[len(self.CHANNEL_PREFIX):], data, by_protocol)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["subscriptions"] = len(self._subscriber.channels)
+        stats["reconnects"] = self._subscriber.reconnects
+        return stats
+
+
+def create_session_bus() -> SessionBus:
+    """
+    Build the broadcast bus configured through environment variables
+    """
+    if os.getenv("SESSION_BUS", "local") == "redis":
+        return RedisBus(os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0"))
+    return LocalBus()
@@ -0,0 +1,483 @@
+from typing import Dict, Any, Callable, Optional, Tuple, TypeVar
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from models import TripPlan
+from services.compact_trip import AttractionTable, CompactTrip, attraction_table
+from services.resp import RespClient, RespError
+
+T = TypeVar("T")
+
+# Rough per-entry bookkeeping cost on top of the payload (key, tuple, dict slot)
+ENTRY_OVERHEAD_BYTES = 200
+
+# Writes between row-count checks in the SQLite store
+EVICTION_CHECK_INTERVAL = 64
+
+# Seconds a SQLite session's access time may lag before a read updates it
+ACCESS_UPDATE_INTERVAL_SECONDS = 60.0
+
+
+def encode_trip(trip: TripPlan) -> bytes:
+    """
+    Serialize a trip to compressed JSON bytes for storage
+    """
+    return zlib.compress(trip.model_dump_json().encode("utf-8"), 1)
+
+
+def decode_trip(payload: bytes) -> TripPlan:
+    return TripPlan.model_validate_json(zlib.decompress(payload))
+
+
+class VersionConflict(Exception):
+    """
+    The session's trip changed since the version a write was based on
+    """
+
+
+class SessionStore(ABC):
+    """
+    Storage for the current trip of each session.
+    Trips are kept encoded (serialized, or compact in memory) and decoded
+    on read, so callers always get their own copy and can never mutate
+    the stored state in place.
+    Every write bumps the session's version (1 for a new session). A write
+    can be made conditional on the version it was based on, so writers in
+    other workers sharing the store can't silently overwrite each other.
+    Code on the event loop uses the async methods (aget, aset, ...): for
+    stores whose calls wait on a file or a server they run the call on a
+    thread, so one slow round trip doesn't stall every other request.
+    """
+
+    # Whether calls wait on I/O, and so are made on a thread by the async methods
+    blocking = False
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, session_id: str) -> Optional[TripPlan]:
+        return self.get_versioned(session_id)[0]
+
+    def get_versioned(self, session_id: str) -> Tuple[Optional[TripPlan], int]:
+        """
+        The session's trip and its version, (None, 0) if there is none
+        """
+        entry = self._get_entry(session_id)
+        if entry is None:
+            self.misses += 1
+            return None, 0
+        self.hits += 1
+        payload, version = entry
+        return self._decode(payload), version
+
+    def version(self, session_id: str) -> int:
+        entry = self._get_entry(session_id)
+        return entry[1] if entry is not None else 0
+
+    def set(self, session_id: str, trip: TripPlan, expected_version: Optional[int] = None) -> int:
+        """
+        Store the session's trip and return its new version. With
+        expected_version, raises VersionConflict unless that is still the
+        current version (0 for a session without a trip).
+        """
+        return self._set_payload(session_id, self._encode(trip), expected_version)
+
+    async def aget(self, session_id: str) -> Optional[TripPlan]:
+        return await self._offload(self.get, session_id)
+
+    async def aget_versioned(self, session_id: str) -> Tuple[Optional[TripPlan], int]:
+        return await self._offload(self.get_versioned, session_id)
+
+    async def aversion(self, session_id: str) -> int:
+        return await self._offload(self.version, session_id)
+
+    async def aset(self, session_id: str, trip: TripPlan, expected_version: Optional[int] = None) -> int:
+        return await self._offload(self.set, session_id, trip, expected_version)
+
+    async def alen(self) -> int:
+        return await self._offload(len, self)
+
+    async def astats(self) -> Dict[str, Any]:
+        return await self._offload(self.stats)
+
+    async def _offload(self, fn: Callable[..., T], *args: Any) -> T:
+        if not self.blocking:
+            return fn(*args)
+        return await asyncio.to_thread(fn, *args)
+
+    def _encode(self, trip: TripPlan) -> Any:
+        return encode_trip(trip)
+
+    def _decode(self, payload: Any) -> TripPlan:
+        return decode_trip(payload)
+
+    def __contains__(self, session_id: str) -> bool:
+        return self._get_entry(session_id) is not None
+
+    @abstractmethod
+    def _get_entry(self, session_id: str) -> Optional[Tuple[Any, int]]:
+        """
+        The stored payload and its version
+        """
+
+    @abstractmethod
+    def _set_payload(self, session_id: str, payload: Any, expected_version: Optional[int]) -> int:
+        pass
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        pass
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.__class__.__name__,
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+class MemorySessionStore(SessionStore):
+    """
+    In-process LRU store with a TTL and a cap on entries and total payload bytes.
+    Trips are kept as CompactTrips referencing shared attractions by key,
+    which is smaller than compressed JSON and decodes without parsing or
+    validation.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl_seconds: Optional[float] = 24 * 3600,
+        attractions: AttractionTable = attraction_table
+    ):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.attractions = attractions
+        self.current_bytes = 0
+        # session_id -> (expires_at, version, compact trip), oldest access first
+        self._entries: "OrderedDict[str, Tuple[float, int, CompactTrip]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _encode(self, trip: TripPlan) -> CompactTrip:
+        return CompactTrip.of(trip, self.attractions)
+
+    def _decode(self, payload: CompactTrip) -> TripPlan:
+        return payload.expand(self.attractions)
+
+    def _get_entry(self, session_id: str) -> Optional[Tuple[CompactTrip, int]]:
+        with self._lock:
+            entry = self._live_entry(session_id)
+            if entry is None:
+                return None
+            self._entries.move_to_end(session_id)
+            return entry[2], entry[1]
+
+    def _live_entry(self, session_id: str) -> Optional[Tuple[float, int, CompactTrip]]:
+        entry = self._entries.get(session_id)
+        if entry is not None and entry[0] < time.monotonic():
+            self._drop(session_id)
+            self.expirations += 1
+            return None
+        return entry
+
+    def _set_payload(self, session_id: str, payload: CompactTrip, expected_version: Optional[int]) -> int:
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else float("inf")
+        with self._lock:
+            entry = self._live_entry(session_id)
+            current = entry[1] if entry is not None else 0
+            if expected_version is not None and expected_version != current:
+                payload.release(self.attractions)
+                raise VersionConflict(f"session {session_id} is at version {current}, not {expected_version}")
+            if entry is not None:
+                self._drop(session_id)
+            self._entries[session_id] = (expires_at, current + 1, payload)
+            self.current_bytes += payload.nbytes + ENTRY_OVERHEAD_BYTES
+
+            # Evict least recently used sessions until both caps hold
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes
+            ):
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+            return current + 1
+
+    def _drop(self, session_id: str):
+        _, _, payload = self._entries.pop(session_id)
+        self.current_bytes -= payload.nbytes + ENTRY_OVERHEAD_BYTES
+        payload.release(self.attractions)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            if session_id in self._entries:
+                self._drop(session_id)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["bytes"] = self.current_bytes
+        stats["max_bytes"] = self.max_bytes
+        stats["attractions"] = len(self.attractions)
+        return stats
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    On-disk store backed by a SQLite file in WAL mode, so every uvicorn
+    worker on the host sees the same sessions and they survive restarts.
+    Least recently accessed sessions are evicted past max_entries; reads
+    only record an access once the stored time is over
+    ACCESS_UPDATE_INTERVAL_SECONDS old, so most of them take no write lock.
+    Writes check and bump the version in one IMMEDIATE transaction, which
+    the file lock makes atomic across workers.
+    """
+
+    blocking = True
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 100000,
+        ttl_seconds: Optional[float] = 24 * 3600
+    ):
+        super().__init__()
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._writes = 0
+        self._local = threading.local()
+
+        conn = self._conn()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                payload BLOB NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+        if "version" not in columns:
+            # File written before trips were versioned
+            conn.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_accessed ON sessions(accessed_at)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _get_entry(self, session_id: str) -> Optional[Tuple[bytes, int]]:
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT payload, expires_at, accessed_at, version FROM sessions WHERE session_id = ?",
+            (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        payload, expires_at, accessed_at, version = row
+        if expires_at < now:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self.expirations += 1
+            return None
+        if now - accessed_at >= ACCESS_UPDATE_INTERVAL_SECONDS:
+            conn.execute(
+                "UPDATE sessions SET accessed_at = ? WHERE session_id = ?",
+                (now, session_id)
+            )
+        return payload, version
+
+    def _set_payload(self, session_id: str, payload: bytes, expected_version: Optional[int]) -> int:
+        now = time.time()
+        expires_at = now + self.ttl_seconds if self.ttl_seconds else float("inf")
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT version FROM sessions WHERE session_id = ? AND expires_at >= ?",
+                (session_id, now)
+            ).fetchone()
+            current = row[0] if row is not None else 0
+            if expected_version is not None and expected_version != current:
+                raise VersionConflict(f"session {session_id} is at version {current}, not {expected_version}")
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, payload, expires_at, accessed_at, version) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (session_id, payload, expires_at, now, current + 1)
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+        # Counting rows is a table scan, so only check the cap periodically
+        self._writes += 1
+        if self._writes % EVICTION_CHECK_INTERVAL == 0:
+            self._evict(conn)
+        return current + 1
+
+    def _evict(self, conn: sqlite3.Connection):
+        overflow = len(self) - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM sessions WHERE session_id IN "
+                "(SELECT session_id FROM sessions ORDER BY accessed_at LIMIT ?)",
+                (overflow,)
+            )
+            self.evictions += overflow
+
+    def delete(self, session_id: str):
+        self._conn().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def purge_expired(self) -> int:
+        cursor = self._conn().execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),))
+        self.expirations += cursor.rowcount
+        return cursor.rowcount
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Store on a Redis server (or services.mini_redis) shared by the workers
+    of every host. Each session is one key holding its version and
+    compressed trip, expiring after the TTL; eviction under memory
+    pressure is left to the server's maxmemory policy, and the database is
+    expected to hold nothing but sessions (its size is DBSIZE). Writes
+    WATCH the key so that a write based on a version another worker has
+    replaced fails instead of overwriting it. Calls block for a round trip,
+    like SQLiteSessionStore's queries, so the async methods make them on a
+    thread; each thread has its own connection, which WATCH needs (a
+    pipelined AsyncRespClient connection is shared by every task).
+    """
+
+    blocking = True
+
+    KEY_PREFIX = "trip:"
+
+    def __init__(self, url: str, ttl_seconds: Optional[float] = 24 * 3600):
+        super().__init__()
+        self.url = url
+        self.ttl_seconds = ttl_seconds
+        self.retries = 0
+        self._local = threading.local()
+        self._client().execute("PING")
+
+    def _client(self) -> RespClient:
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = RespClient(self.url)
+        return client
+
+    def _call(self, *args: Any) -> Any:
+        try:
+            return self._client().execute(*args)
+        except (OSError, ConnectionError):
+            # Reconnect once, e.g. after the server restarted
+            self._local.client = None
+            return self._client().execute(*args)
+
+    def _key(self, session_id: str) -> str:
+        return self.KEY_PREFIX + session_id
+
+    def _get_entry(self, session_id: str) -> Optional[Tuple[bytes, int]]:
+        value = self._call("GET", self._key(session_id))
+        if value is None:
+            return None
+        return value[8:], int.from_bytes(value[:8], "big")
+
+    def version(self, session_id: str) -> int:
+        return int.from_bytes(self._call("GETRANGE", self._key(session_id), 0, 7) or b"", "big")
+
+    def _set_payload(self, session_id: str, payload: bytes, expected_version: Optional[int]) -> int:
+        key = self._key(session_id)
+        expiry = ("PX", int(self.ttl_seconds * 1000)) if self.ttl_seconds else ()
+        while True:
+            self._call("WATCH", key)
+            client = self._client()
+            current = int.from_bytes(client.execute("GETRANGE", key, 0, 7) or b"", "big")
+            if expected_version is not None and expected_version != current:
+                client.execute("UNWATCH")
+                raise VersionConflict(f"session {session_id} is at version {current}, not {expected_version}")
+            replies = client.pipeline([
+                ("MULTI",),
+                ("SET", key, (current + 1).to_bytes(8, "big") + payload, *expiry),
+                ("EXEC",)
+            ])
+            for reply in replies:
+                if isinstance(reply, RespError):
+                    raise reply
+            if replies[-1] is not None:
+                return current + 1
+            # Another worker wrote the key between the read and EXEC
+            self.retries += 1
+            if expected_version is not None:
+                raise VersionConflict(f"session {session_id} changed during the write")
+
+    def delete(self, session_id: str):
+        self._call("DEL", self._key(session_id))
+
+    def __len__(self) -> int:
+        return self._call("DBSIZE")
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["write_retries"] = self.retries
+        return stats
+
+
+def create_session_store() -> SessionStore:
+    """
+    Build the session store configured through environment variables
+    """
+    backend = os.getenv("SESSION_STORE", "memory")
+    ttl_seconds = float(os.getenv("SESSION_TTL_SECONDS", str(24 * 3600)))
+
+    if backend == "redis":
+        return RedisSessionStore(
+            url=os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0"),
+            ttl_seconds=ttl_seconds
+        )
+    if backend == "sqlite":
+        return SQLiteSessionStore(
+            path=os.getenv("SESSION_STORE_PATH", "/tmp/trip_sessions.db"),
+            max_entries=int(os.getenv("SESSION_STORE_MAX_ENTRIES", "100000")),
+            ttl_seconds=ttl_seconds
+        )
+    return MemorySessionStore(
+        max_entries=int(os.getenv("SESSION_STORE_MAX_ENTRIES", "10000")),
+        max_bytes=int(os.getenv("SESSION_STORE_MAX_BYTES", str(64 * 1024 * 1024))),
+        ttl_seconds=ttl_seconds
+    )
@@ -0,0 +1,128 @@
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, List, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import time
+
+
+class _Flight:
+    """
+    One in-flight run: the items produced so far, and an event that is set
+    and replaced whenever there is something new
+    """
+    __slots__ = ("items", "done", "error", "changed", "followers", "task")
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Event()
+        self.followers = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def notify(self):
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class SingleFlight:
+    """
+    At most one run of a stream-producing computation per key. Callers
+    asking for a key that is already being computed follow that run and
+    get every item it has produced and will produce, instead of starting
+    their own. Completed runs are kept for ttl_seconds in an LRU of
+    max_entries and replayed. A run nobody follows any more is cancelled.
+
+    Items are shared between callers, so callers must copy before
+    changing them.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.runs = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._results: "OrderedDict[Hashable, Tuple[float, Tuple[Any, ...]]]" = OrderedDict()
+
+    def _cached(self, key: Hashable) -> Optional[Tuple[Any, ...]]:
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._results[key]
+            return None
+        self._results.move_to_end(key)
+        return entry[1]
+
+    async def stream(self, key: Hashable, produce: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """
+        The items of produce() for key, computed once for all concurrent callers
+        """
+        cached = self._cached(key)
+        if cached is not None:
+            self.cache_hits += 1
+            for item in cached:
+                yield item
+            return
+
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.create_task(self._run(key, flight, produce))
+            self.runs += 1
+        else:
+            self.coalesced += 1
+
+        flight.followers += 1
+        try:
+            position = 0
+            while True:
+                while position < len(flight.items):
+                    yield flight.items[position]
+                    position += 1
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.changed.wait()
+        finally:
+            flight.followers -= 1
+            if flight.followers == 0 and not flight.done:
+                # Nobody wants the result any more; later callers start afresh
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+
+    async def _run(self, key: Hashable, flight: _Flight, produce: Callable[[], AsyncIterator[Any]]):
+        try:
+            async for item in produce():
+                flight.items.append(item)
+                flight.notify()
+        except asyncio.CancelledError:
+            flight.error = RuntimeError("single-flight run was cancelled")
+        except Exception as exc:
+            flight.error = exc
+        else:
+            if self.max_entries > 0:
+                self._results[key] = (time.monotonic() + self.ttl_seconds, tuple(flight.items))
+                self._results.move_to_end(key)
+                while len(self._results) > self.max_entries:
+                    self._results.popitem(last=False)
+        finally:
+            flight.done = True
+            flight.notify()
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def clear(self):
+        self._results.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "runs": self.runs,
+            "coalesced": self.coalesced,
+            "cache_hits": self.cache_hits,
+            "in_flight": len(self._flights),
+            "cached": len(self._results)
+        }
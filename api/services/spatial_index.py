@@ -0,0 +1,202 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import heapq
+import math
+import threading
+
+from models import Attraction, AttractionType
+
+# Grid cell edge in degrees (~280 m of latitude), small enough that a
+# "few nearest within a couple of km" query touches a handful of cells
+DEFAULT_CELL_DEGREES = 0.0025
+
+KM_PER_DEGREE_LAT = 110.57
+KM_PER_DEGREE_LNG_EQUATOR = 111.32
+
+# Grid entries: (lat, lng, attraction id, attraction)
+Entry = Tuple[float, float, str, Attraction]
+
+
+class AttractionIndex:
+    """
+    Uniform lat/lng grid over the attraction catalog, partitioned by type,
+    for k-nearest-within-radius lookups. Cells are searched in rings of
+    increasing size around the query, stopping as soon as no unvisited
+    cell can hold anything closer than the current k-th result. Rings
+    only visit cells inside the grid's bounds, and when that is still
+    more cells than are occupied the occupied cells are bucketed by ring
+    instead, so a query far from the catalog costs no more than a scan.
+    """
+
+    def __init__(
+        self,
+        attractions: Iterable[Attraction] = (),
+        cell_degrees: float = DEFAULT_CELL_DEGREES
+    ):
+        self.cell_degrees = cell_degrees
+        # (type or None for "any type", cell x, cell y) -> entries
+        self._cells: Dict[Tuple[Optional[AttractionType], int, int], List[Entry]] = {}
+        self._by_id: Dict[str, Attraction] = {}
+        self._bounds: Optional[List[int]] = None  # [min x, max x, min y, max y]
+        self._lock = threading.Lock()
+        self.add_many(attractions)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __contains__(self, attraction_id: str) -> bool:
+        return attraction_id in self._by_id
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return int(math.floor(lng / self.cell_degrees)), int(math.floor(lat / self.cell_degrees))
+
+    def add_many(self, attractions: Iterable[Attraction]):
+        for attraction in attractions:
+            self.add(attraction)
+
+    def add(self, attraction: Attraction):
+        """
+        Insert or replace one attraction without rebuilding the grid
+        """
+        with self._lock:
+            if attraction.id in self._by_id:
+                self._remove_locked(attraction.id)
+
+            lat, lng = attraction.location.lat, attraction.location.lng
+            x, y = self._cell(lat, lng)
+            entry = (lat, lng, attraction.id, attraction)
+            for key in ((attraction.type, x, y), (None, x, y)):
+                self._cells.setdefault(key, []).append(entry)
+            self._by_id[attraction.id] = attraction
+
+            if self._bounds is None:
+                self._bounds = [x, x, y, y]
+            else:
+                bounds = self._bounds
+                bounds[0], bounds[1] = min(bounds[0], x), max(bounds[1], x)
+                bounds[2], bounds[3] = min(bounds[2], y), max(bounds[3], y)
+
+    def remove(self, attraction_id: str):
+        with self._lock:
+            if attraction_id in self._by_id:
+                self._remove_locked(attraction_id)
+
+    def _remove_locked(self, attraction_id: str):
+        attraction = self._by_id.pop(attraction_id)
+        x, y = self._cell(attraction.location.lat, attraction.location.lng)
+        for key in ((attraction.type, x, y), (None, x, y)):
+            entries = self._cells[key]
+            entries[:] = [entry for entry in entries if entry[2] != attraction_id]
+            if not entries:
+                del self._cells[key]
+
+    def nearest(
+        self,
+        lat: float,
+        lng: float,
+        k: int = 5,
+        attraction_type: Optional[AttractionType] = None,
+        radius_km: Optional[float] = None,
+        exclude_ids: Optional[Set[str]] = None
+    ) -> List[Tuple[Attraction, float]]:
+        """
+        Up to k attractions of the given type (any type if None) closest to
+        a point, optionally within radius_km and skipping exclude_ids.
+        Returns (attraction, distance_km) pairs, closest first.
+        """
+        if k <= 0 or self._bounds is None or (radius_km is not None and not radius_km >= 0):
+            return []
+        exclude_ids = exclude_ids or set()
+        attraction_type = AttractionType(attraction_type) if attraction_type else None
+
+        # Equirectangular distances are exact enough at city scale
+        km_per_lng = KM_PER_DEGREE_LNG_EQUATOR * math.cos(math.radians(lat))
+        # Anything outside ring r is at least r cell edges away
+        cell_km = self.cell_degrees * min(KM_PER_DEGREE_LAT, km_per_lng)
+        cx, cy = self._cell(lat, lng)
+        bounds = tuple(self._bounds)
+        min_x, max_x, min_y, max_y = bounds
+        # Rings inside this one hold no cell of the grid
+        first_ring = max(min_x - cx, cx - max_x, min_y - cy, cy - max_y, 0)
+        max_ring = max(cx - min_x, max_x - cx, cy - min_y, max_y - cy)
+        if radius_km is not None and math.isfinite(radius_km):
+            max_ring = min(max_ring, int(math.ceil(radius_km / cell_km)) + 1)
+        if first_ring > max_ring:
+            return []
+
+        cells = self._cells
+        searched = (
+            (min(max_x, cx + max_ring) - max(min_x, cx - max_ring) + 1)
+            * (min(max_y, cy + max_ring) - max(min_y, cy - max_ring) + 1)
+        )
+        if searched <= len(cells):
+            rings = (
+                (ring, self._ring_cells(cx, cy, ring, bounds))
+                for ring in range(first_ring, max_ring + 1)
+            )
+        else:
+            rings = self._occupied_rings(cx, cy, attraction_type, first_ring, max_ring)
+
+        # Max-heap of the best k as (-distance, id, attraction)
+        best: List[Tuple[float, str, Attraction]] = []
+        for ring, ring_cells in rings:
+            for x, y in ring_cells:
+                entries = cells.get((attraction_type, x, y))
+                if not entries:
+                    continue
+                for entry_lat, entry_lng, attraction_id, attraction in entries:
+                    if attraction_id in exclude_ids:
+                        continue
+                    dy = (entry_lat - lat) * KM_PER_DEGREE_LAT
+                    dx = (entry_lng - lng) * km_per_lng
+                    distance = math.sqrt(dx * dx + dy * dy)
+                    if radius_km is not None and distance > radius_km:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, attraction_id, attraction))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, attraction_id, attraction))
+
+            if len(best) == k and ring * cell_km >= -best[0][0]:
+                break
+
+        results = sorted(((attraction, -negative) for negative, _, attraction in best), key=lambda pair: pair[1])
+        return [(attraction, round(distance, 3)) for attraction, distance in results]
+
+    @staticmethod
+    def _ring_cells(cx: int, cy: int, ring: int, bounds: Tuple[int, int, int, int]):
+        """
+        The cells of ring (cells exactly ring steps from cx, cy) inside bounds
+        """
+        min_x, max_x, min_y, max_y = bounds
+        if ring == 0:
+            yield cx, cy
+            return
+        for y in (cy - ring, cy + ring):
+            if min_y <= y <= max_y:
+                for x in range(max(cx - ring, min_x), min(cx + ring, max_x) + 1):
+                    yield x, y
+        for x in (cx - ring, cx + ring):
+            if min_x <= x <= max_x:
+                for y in range(max(cy - ring + 1, min_y), min(cy + ring - 1, max_y) + 1):
+                    yield x, y
+
+    def _occupied_rings(
+        self,
+        cx: int,
+        cy: int,
+        attraction_type: Optional[AttractionType],
+        first_ring: int,
+        max_ring: int
+    ) -> List[Tuple[int, List[Tuple[int, int]]]]:
+        """
+        The occupied cells of a type from first_ring to max_ring, grouped by
+        ring, innermost first
+        """
+        rings: Dict[int, List[Tuple[int, int]]] = {}
+        for cell_type, x, y in list(self._cells):
+            if cell_type is not attraction_type:
+                continue
+            ring = max(abs(x - cx), abs(y - cy))
+            if first_ring <= ring <= max_ring:
+                rings.setdefault(ring, []).append((x, y))
+        return sorted(rings.items())
@@ -0,0 +1,514 @@
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+import asyncio
+import itertools
+import os
+import queue
+import sys
+import threading
+import time
+
+# Request and span latencies, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Spans kept per trace; long streams stop recording detail past this
+MAX_SPANS_PER_TRACE = 256
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f"{name}=\"{_escape(str(value))}\"" for name, value in zip(names, values)) + "}"
+
+
+def _format_number(value: float) -> str:
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """
+    A monotonically increasing value per label set
+    """
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in list(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_number(value)}"
+
+
+class _Series:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets: int):
+        # Per bucket (not cumulative), plus one for above the last bound
+        self.counts = [0] * (buckets + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """
+    Observations counted into fixed buckets per label set. An observation
+    is a bisect and three additions, cheap enough for every request.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], _Series] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = _Series(len(self.buckets))
+        series.counts[bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        bounds = [_format_number(bound) for bound in self.buckets] + ["+Inf"]
+        for labels, series in list(self._series.items()):
+            selector = _format_labels(self.labelnames, labels)
+            # Label set with le appended: {a="x",le="0.5"} or {le="0.5"}
+            prefix = f"{self.name}_bucket{selector[:-1]}," if selector else f"{self.name}_bucket{{"
+            for bound, cumulative in zip(bounds, itertools.accumulate(series.counts)):
+                yield f"{prefix}le=\"{bound}\"}} {cumulative}"
+            yield f"{self.name}_sum{selector} {_format_number(series.sum)}"
+            yield f"{self.name}_count{selector} {series.count}"
+
+
+class Gauge:
+    """
+    A value read from the component that owns it when metrics are scraped
+    """
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {_format_number(float(self.read()))}"
+
+
+class MetricsRegistry:
+    """
+    The process's metrics, rendered in the Prometheus text format for
+    /metrics. Metrics are kept in memory and updated from the event loop
+    thread; each worker process exposes its own.
+    """
+
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._metrics: Dict[str, Any] = {}
+
+    def _add(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(self.prefix + name, help, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._add(Histogram(self.prefix + name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]) -> Gauge:
+        gauge = Gauge(self.prefix + name, help, read)
+        self._metrics[gauge.name] = gauge
+        return gauge
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class Span:
+    """
+    One timed step of a request. Spans nest through a context variable, so
+    tasks started inside a span (the planning task of a chat) record
+    their spans under it.
+    """
+    __slots__ = ("tracer", "name", "attributes", "trace", "parent", "start", "duration")
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.trace: Optional["Trace"] = None
+        self.parent: Optional["Span"] = None
+        self.start = 0.0
+        self.duration = 0.0
+
+    def __enter__(self) -> "Span":
+        self.parent = _current_span.get()
+        if self.parent is not None:
+            self.trace = self.parent.trace
+        _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        # Set rather than reset: async generators may finish in another context
+        _current_span.set(self.parent)
+        if exc_type is asyncio.CancelledError:
+            self.set("cancelled", True)
+        elif exc_type is not None and exc_type is not GeneratorExit:
+            self.set("error", exc_type.__name__)
+        self.tracer._finish(self)
+        return False
+
+    def set(self, key: str, value: Any):
+        if self.attributes is None:
+            self.attributes = {}
+        self.attributes[key] = value
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, key: str, value: Any):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Trace:
+    """
+    The spans of one request
+    """
+    __slots__ = ("trace_id", "root", "spans", "dropped")
+
+    def __init__(self, trace_id: int, root: Span):
+        self.trace_id = trace_id
+        self.root = root
+        self.spans: List[Span] = []
+        self.dropped = 0
+
+    def summary(self) -> Dict[str, Any]:
+        start = self.root.start
+        return {
+            "trace_id": f"{self.trace_id:016x}",
+            "name": self.root.name,
+            "duration_ms": round(self.root.duration * 1000, 3),
+            "attributes": dict(self.root.attributes or {}),
+            "spans": [
+                {
+                    "name": span.name,
+                    "start_ms": round((span.start - start) * 1000, 3),
+                    "duration_ms": round(span.duration * 1000, 3),
+                    **({"attributes": span.attributes} if span.attributes else {})
+                }
+                for span in sorted(self.spans, key=lambda span: span.start)
+            ],
+            "dropped_spans": self.dropped
+        }
+
+
+class Tracer:
+    """
+    Times requests and the steps inside them. Every span's duration goes
+    into a histogram by span name; the full span tree of a request is only
+    kept when the request is slower than slow_ms, for the last keep such
+    requests. With enabled=False span() returns a shared no-op.
+    """
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        enabled: bool = True,
+        slow_ms: float = 1000.0,
+        keep: int = 50,
+        profiler: Optional["SlowRequestProfiler"] = None
+    ):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.profiler = profiler
+        self.slow_traces: Deque[Dict[str, Any]] = deque(maxlen=keep)
+        self._ids = itertools.count(int.from_bytes(os.urandom(6), "big"))
+        self.span_seconds = registry.histogram(
+            "span_duration_seconds", "Time spent in each traced step", ("span",)
+        )
+        self.span_errors = registry.counter(
+            "span_errors_total", "Traced steps that raised", ("span",)
+        )
+        self.request_seconds = registry.histogram(
+            "http_request_duration_seconds", "HTTP request latency, until the response is fully sent",
+            ("method", "route", "status")
+        )
+
+    def span(self, name: str, **attributes: Any):
+        """
+        with tracer.span("optimizer.reorder", day=2): ...
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attributes or None)
+
+    def start_trace(self, name: str, **attributes: Any) -> Span:
+        root = Span(self, name, attributes or None)
+        root.trace = Trace(next(self._ids), root)
+        _current_span.set(root)
+        root.start = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.request_started()
+        return root
+
+    def finish_trace(self, root: Span, method: str, route: str, status: int):
+        root.set("status", status)
+        root.set("route", route)
+        _current_span.set(None)
+        root.duration = time.perf_counter() - root.start
+        self.request_seconds.observe(root.duration, method, route, str(status))
+        slow = root.duration * 1000 >= self.slow_ms
+        if slow:
+            self.slow_traces.append(root.trace.summary())
+        if self.profiler is not None:
+            self.profiler.request_finished(root.start, root.duration, f"{method} {route}", root.trace.trace_id)
+
+    def _finish(self, span: Span):
+        self.span_seconds.observe(span.duration, span.name)
+        if span.attributes is not None and "error" in span.attributes:
+            self.span_errors.inc(span.name)
+        trace = span.trace
+        if trace is not None:
+            if len(trace.spans) < MAX_SPANS_PER_TRACE:
+                trace.spans.append(span)
+            else:
+                trace.dropped += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "slow_ms": self.slow_ms,
+            "slow_traces": len(self.slow_traces),
+            "profiler": self.profiler.stats() if self.profiler is not None else None
+        }
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware starting a trace for every HTTP request. Routes are
+    labelled by endpoint function name, so metric cardinality stays fixed.
+    """
+
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        root = self.tracer.start_trace("http", path=scope.get("path"))
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            endpoint = scope.get("endpoint")
+            route = getattr(endpoint, "__name__", None) or "unmatched"
+            self.tracer.finish_trace(root, scope.get("method", ""), route, status)
+
+
+class SlowRequestProfiler:
+    """
+    Samples the stacks of every thread every interval_ms while requests are
+    in flight. When a request takes longer than slow_ms, the samples taken
+    during it are written to out_dir as folded stacks ("thread;outer;inner
+    count" per line), which flamegraph.pl and speedscope read directly.
+    Idle threads (the event loop waiting in select, pool workers waiting
+    for work) are left out. Sampling and writing happen on the profiler's
+    own thread; the request path only updates a counter and a queue.
+    """
+
+    # (file name suffix, function) of frames where a thread is waiting
+    IDLE_FRAMES = {
+        ("selectors.py", "select"),
+        ("threading.py", "wait"),
+        ("thread.py", "_worker"),
+        ("queue.py", "get"),
+    }
+
+    def __init__(
+        self,
+        slow_ms: float,
+        interval_ms: float = 5.0,
+        out_dir: str = "/tmp/profiles",
+        max_samples: int = 20000,
+        max_files: int = 100
+    ):
+        self.slow_ms = slow_ms
+        self.interval = interval_ms / 1000.0
+        self.out_dir = out_dir
+        self.max_files = max_files
+        self.samples_taken = 0
+        self.dumps = 0
+        self.last_dump: Optional[str] = None
+        self._active = 0
+        self._samples: Deque[Tuple[float, Tuple[str, ...]]] = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._dump_queue: "queue.SimpleQueue[Tuple[float, float, str, int]]" = queue.SimpleQueue()
+        self._labels: Dict[Any, str] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def request_started(self):
+        self._active += 1
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+            self._thread.start()
+        self._wake.set()
+
+    def request_finished(self, started: float, duration: float, name: str, trace_id: int):
+        self._active -= 1
+        if duration * 1000 >= self.slow_ms:
+            self._dump_queue.put((started, started + duration, name, trace_id))
+            self._wake.set()
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            self._wake.wait()
+            while self._active > 0 or not self._dump_queue.empty():
+                if self._active > 0:
+                    self._sample(own)
+                while not self._dump_queue.empty():
+                    self._dump(*self._dump_queue.get())
+                time.sleep(self.interval)
+            self._wake.clear()
+            if self._active > 0 or not self._dump_queue.empty():
+                self._wake.set()
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _sample(self, own: int):
+        now = time.perf_counter()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            code = frame.f_code
+            if (os.path.basename(code.co_filename), code.co_name) in self.IDLE_FRAMES:
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(self._label(frame.f_code))
+                frame = frame.f_back
+            frames.append(names.get(ident, str(ident)))
+            stacks.append(";".join(reversed(frames)))
+        with self._lock:
+            self._samples.append((now, tuple(stacks)))
+        self.samples_taken += 1
+
+    def _dump(self, started: float, ended: float, name: str, trace_id: int):
+        counts: Dict[str, int] = {}
+        with self._lock:
+            samples = [stacks for taken, stacks in self._samples if started <= taken <= ended]
+        for stacks in samples:
+            for stack in stacks:
+                counts[stack] = counts.get(stack, 0) + 1
+        if not counts or self.dumps >= self.max_files:
+            return
+        os.makedirs(self.out_dir, exist_ok=True)
+        file_name = "{}-{}-{:016x}.folded".format(
+            time.strftime("%Y%m%dT%H%M%S"), name.replace(" ", "-").replace("/", "_"), trace_id
+        )
+        path = os.path.join(self.out_dir, file_name)
+        with open(path, "w") as output:
+            for stack, count in sorted(counts.items()):
+                output.write(f"{stack} {count}\n")
+        self.dumps += 1
+        self.last_dump = path
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "slow_ms": self.slow_ms,
+            "samples": self.samples_taken,
+            "dumps": self.dumps,
+            "last_dump": self.last_dump
+        }
+
+
+def create_tracer(registry: MetricsRegistry) -> Tracer:
+    """
+    Build the tracer configured through environment variables; the
+    profiler only runs when PROFILE_SLOW_MS is set
+    """
+    profile_slow_ms = os.getenv("PROFILE_SLOW_MS")
+    profiler = None
+    if profile_slow_ms:
+        profiler = SlowRequestProfiler(
+            slow_ms=float(profile_slow_ms),
+            interval_ms=float(os.getenv("PROFILE_INTERVAL_MS", "5")),
+            out_dir=os.getenv("PROFILE_DIR", "/tmp/profiles")
+        )
+    return Tracer(
+        registry,
+        enabled=os.getenv("TRACING", "on") != "off",
+        slow_ms=float(os.getenv("TRACE_SLOW_MS", "1000")),
+        profiler=profiler
+    )
+
+
+# Shared by the API and the agents
+metrics = MetricsRegistry()
+tracer = create_tracer(metrics)
@@ -0,0 +1,215 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from datetime import time
+from pydantic import BaseModel
+
+from models import DayItinerary, TimeSlot, Attraction
+from services.opening_hours import MINUTES_PER_DAY, visit_start
+
+# Every day's schedule starts at 9 AM
+DAY_START_MINUTE = 9 * 60
+
+# Travel minutes from one attraction to the next
+LegMinutes = Callable[[Attraction, Attraction], int]
+
+
+class DayChanges(BaseModel):
+    """
+    Which slots of a day an edit rewrote: indexes into the new slot list
+    whose slot differs from the one previously at that index, and the new
+    length so a client can drop slots past it
+    """
+    day_number: int
+    changed_slots: List[int]
+    slot_count: int
+
+
+def minute_to_time(minute: int) -> time:
+    minute %= MINUTES_PER_DAY
+    return time(minute // 60, minute % 60)
+
+
+class DayTimeline:
+    """
+    Prefix sums over a day's slots: ends[i] is the minute (after the day
+    starts) at which slot i ends and costs[i] the cost of slots 0..i.
+    A slot starts once the travel from the previous one is done, or when
+    its attraction opens if that is later (the wait is part of the day's
+    duration); one that can't be visited while open starts on arrival.
+    Edits rewrite the slot list in place and retime only the suffix after
+    the first changed position; slots whose times stay the same are kept
+    as-is, so untouched slots remain shared with the day they came from.
+    """
+
+    def __init__(self, day: DayItinerary, start_minute: int = DAY_START_MINUTE):
+        self.day = day
+        self.start_minute = start_minute
+        self.weekday = day.date.weekday()
+        self.ends: List[int] = []
+        self.costs: List[float] = []
+        end, cost = 0, 0.0
+        for slot in day.time_slots:
+            start, _ = self._visit(slot.attraction, end + slot.travel_time_minutes)
+            end = start + slot.attraction.duration_minutes
+            cost += slot.attraction.cost_usd
+            self.ends.append(end)
+            self.costs.append(cost)
+
+    @classmethod
+    def of(cls, day: DayItinerary, source: Optional["DayItinerary"] = None) -> "DayTimeline":
+        """
+        The timeline kept on a day, built on first use. With source, a day
+        copied from source reuses source's prefix sums instead of rescanning.
+        """
+        timeline = day._timeline
+        if timeline is not None and timeline.day is day:
+            return timeline
+        origin = source._timeline if source is not None else None
+        if origin is not None and origin.day is source and len(origin.ends) == len(day.time_slots):
+            timeline = cls.__new__(cls)
+            timeline.day = day
+            timeline.start_minute = origin.start_minute
+            timeline.weekday = origin.weekday
+            timeline.ends = list(origin.ends)
+            timeline.costs = list(origin.costs)
+        else:
+            timeline = cls(day)
+        day._timeline = timeline
+        return timeline
+
+    @property
+    def total_minutes(self) -> int:
+        return self.ends[-1] if self.ends else 0
+
+    @property
+    def total_cost(self) -> float:
+        return self.costs[-1] if self.costs else 0.0
+
+    def _visit(self, attraction: Attraction, arrival: int) -> Tuple[int, bool]:
+        """
+        When a visit arriving at arrival starts, and whether the attraction
+        is open for all of it
+        """
+        start = visit_start(attraction, self.weekday, self.start_minute + arrival)
+        if start is None:
+            return arrival, False
+        return start - self.start_minute, True
+
+    def insertion_fits(self, index: int, attraction: Attraction, leg_minutes: LegMinutes) -> bool:
+        """
+        Whether inserting attraction at index would visit it while open
+        without pushing any later slot that is visited while open past its
+        hours. Nothing is changed; the walk stops where the later slots'
+        times stop moving.
+        """
+        slots = self.day.time_slots
+        end = self.ends[index - 1] if index > 0 else 0
+        travel = leg_minutes(slots[index - 1].attraction, attraction) if index > 0 else 0
+        start, is_open = self._visit(attraction, end + travel)
+        if not is_open:
+            return False
+        end = start + attraction.duration_minutes
+        for position in range(index, len(slots)):
+            slot = slots[position]
+            travel = leg_minutes(attraction, slot.attraction) if position == index else slot.travel_time_minutes
+            start, is_open = self._visit(slot.attraction, end + travel)
+            old_start = self.ends[position] - slot.attraction.duration_minutes
+            if start == old_start:
+                return True
+            if not is_open and self._visit(slot.attraction, old_start) == (old_start, True):
+                return False
+            end = start + slot.attraction.duration_minutes
+        return True
+
+    def remove(self, index: int, leg_minutes: LegMinutes) -> float:
+        """
+        Remove the slot at index. Returns the change in the day's cost.
+        """
+        slots = self.day.time_slots
+        del slots[index]
+        legs = {}
+        if 0 < index < len(slots):
+            legs[index] = leg_minutes(slots[index - 1].attraction, slots[index].attraction)
+        return self._retime(index, legs)
+
+    def insert(self, index: int, slot: TimeSlot, leg_minutes: LegMinutes) -> float:
+        """
+        Insert a slot at index; its times are filled in here.
+        Returns the change in the day's cost.
+        """
+        slots = self.day.time_slots
+        slots.insert(index, slot)
+        legs = {}
+        if index > 0:
+            legs[index] = leg_minutes(slots[index - 1].attraction, slot.attraction)
+        if index + 1 < len(slots):
+            legs[index + 1] = leg_minutes(slot.attraction, slots[index + 1].attraction)
+        return self._retime(index, legs)
+
+    def move(self, from_index: int, to_index: int, leg_minutes: LegMinutes) -> float:
+        order = list(range(len(self.day.time_slots)))
+        order.insert(to_index, order.pop(from_index))
+        return self.reorder(order, leg_minutes)
+
+    def reorder(self, order: Sequence[int], leg_minutes: LegMinutes) -> float:
+        """
+        Put the slots in the given order (a permutation of their indexes).
+        Only legs whose predecessor changed are looked up again.
+        """
+        first = next((position for position, index in enumerate(order) if position != index), None)
+        if first is None:
+            return 0.0
+        slots = self.day.time_slots
+        reordered = [slots[index] for index in order]
+        legs = {}
+        for position in range(max(first, 1), len(order)):
+            if order[position - 1] != order[position] - 1:
+                legs[position] = leg_minutes(reordered[position - 1].attraction, reordered[position].attraction)
+        slots[:] = reordered
+        return self._retime(first, legs)
+
+    def _retime(self, first: int, legs: Dict[int, int]) -> float:
+        """
+        Recompute ends and costs from position first on, taking new travel
+        legs from legs and keeping every other slot's travel time. Slots
+        whose times change are replaced by updated copies.
+        """
+        slots = self.day.time_slots
+        old_cost = self.total_cost
+        del self.ends[first:]
+        del self.costs[first:]
+        end = self.ends[-1] if self.ends else 0
+        cost = self.costs[-1] if self.costs else 0.0
+
+        for position in range(first, len(slots)):
+            slot = slots[position]
+            travel = 0 if position == 0 else legs.get(position, slot.travel_time_minutes)
+            start, _ = self._visit(slot.attraction, end + travel)
+            end = start + slot.attraction.duration_minutes
+            cost += slot.attraction.cost_usd
+            self.ends.append(end)
+            self.costs.append(cost)
+
+            start_time = minute_to_time(self.start_minute + start)
+            end_time = minute_to_time(self.start_minute + end)
+            if slot.start_time != start_time or slot.end_time != end_time or slot.travel_time_minutes != travel:
+                slots[position] = slot.model_copy(update={
+                    "start_time": start_time,
+                    "end_time": end_time,
+                    "travel_time_minutes": travel
+                })
+
+        self.day.total_duration_minutes = self.total_minutes
+        self.day.total_cost = self.total_cost
+        return self.total_cost - old_cost
+
+
+def diff_slots(day_number: int, before: Sequence[TimeSlot], after: Sequence[TimeSlot]) -> DayChanges:
+    """
+    Slots of after that are not the same object as the slot at the same
+    index in before. Unchanged slots are shared, so identity is exact.
+    """
+    changed = [
+        position for position, slot in enumerate(after)
+        if position >= len(before) or before[position] is not slot
+    ]
+    return DayChanges(day_number=day_number, changed_slots=changed, slot_count=len(after))
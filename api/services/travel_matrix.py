@@ -0,0 +1,173 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+from collections import OrderedDict
+from enum import Enum
+import math
+import threading
+import numpy as np
+
+from models import Attraction
+
+EARTH_RADIUS_KM = 6371.0
+
+
+class TravelMode(str, Enum):
+    WALK = "walk"
+    TRANSIT = "transit"
+    DRIVE = "drive"
+
+
+class SpeedProfile:
+    """
+    How fast a mode covers city distance: average speed, how much longer the
+    street route is than the straight line, and a fixed cost per leg
+    (waiting for transit, parking)
+    """
+
+    def __init__(self, speed_kmh: float, detour_factor: float, overhead_minutes: float):
+        self.speed_kmh = speed_kmh
+        self.detour_factor = detour_factor
+        self.overhead_minutes = overhead_minutes
+
+
+SPEED_PROFILES: Dict[TravelMode, SpeedProfile] = {
+    TravelMode.WALK: SpeedProfile(speed_kmh=4.8, detour_factor=1.25, overhead_minutes=0),
+    TravelMode.TRANSIT: SpeedProfile(speed_kmh=18.0, detour_factor=1.3, overhead_minutes=5),
+    TravelMode.DRIVE: SpeedProfile(speed_kmh=25.0, detour_factor=1.35, overhead_minutes=5),
+}
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """
+    Great-circle distance between two points, for one-off lookups.
+    Same formula as haversine_matrix without the array overhead.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_lat = phi2 - phi1
+    d_lng = math.radians(lng2 - lng1)
+    a = math.sin(d_lat / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(max(a, 0.0), 1.0)))
+
+
+def haversine_matrix(origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+    """
+    Great-circle distances in km between every origin and destination,
+    both given as (n, 2) arrays of (lat, lng) degrees
+    """
+    origins = np.radians(origins)
+    destinations = np.radians(destinations)
+    lat1 = origins[:, 0][:, None]
+    lat2 = destinations[:, 0][None, :]
+    d_lat = lat2 - lat1
+    d_lng = destinations[:, 1][None, :] - origins[:, 1][:, None]
+    a = np.sin(d_lat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(d_lng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class TravelMatrix:
+    """
+    Distance and travel-time matrices for a fixed set of attractions.
+    Rows are in sorted id order; use index/submatrix to look up by id.
+    """
+
+    def __init__(self, ids: Tuple[str, ...], distance_km: np.ndarray, minutes: np.ndarray):
+        self.ids = ids
+        self.index = {attraction_id: i for i, attraction_id in enumerate(ids)}
+        self.distance_km = distance_km
+        self.minutes = minutes
+        # Read-only so a cached matrix can't be modified by a caller
+        self.distance_km.setflags(write=False)
+        self.minutes.setflags(write=False)
+
+    def travel_minutes(self, from_id: str, to_id: str) -> float:
+        return float(self.minutes[self.index[from_id], self.index[to_id]])
+
+    def subarray(self, ids: Sequence[str]) -> np.ndarray:
+        """
+        Travel minutes between the given attractions, in the given order
+        """
+        rows = [self.index[attraction_id] for attraction_id in ids]
+        return self.minutes[np.ix_(rows, rows)]
+
+    def submatrix(self, ids: Sequence[str]) -> List[List[float]]:
+        """
+        Same as subarray, as nested lists for pure-Python loops
+        """
+        return self.subarray(ids).tolist()
+
+
+class TravelMatrixEngine:
+    """
+    Builds travel matrices for attraction sets in one batched NumPy call
+    and keeps the most recently used ones, keyed by destination, mode and
+    the attractions' ids and coordinates.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._cache: "OrderedDict[tuple, TravelMatrix]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def matrix(
+        self,
+        attractions: Sequence[Attraction],
+        mode: TravelMode = TravelMode.TRANSIT,
+        destination: Optional[str] = None
+    ) -> TravelMatrix:
+        mode = TravelMode(mode)
+        points = sorted({
+            (attraction.id, attraction.location.lat, attraction.location.lng)
+            for attraction in attractions
+        })
+        key = (destination, mode, tuple(points))
+
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+
+        self.misses += 1
+        travel_matrix = self._build(points, SPEED_PROFILES[mode])
+
+        with self._lock:
+            self._cache[key] = travel_matrix
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return travel_matrix
+
+    def travel_minutes(
+        self,
+        origin: Attraction,
+        destination: Attraction,
+        mode: TravelMode = TravelMode.TRANSIT
+    ) -> float:
+        """
+        Travel time for a single leg, computed directly rather than through
+        a cached matrix. Matches what matrix() gives for the same pair.
+        """
+        if origin.id == destination.id:
+            return 0.0
+        profile = SPEED_PROFILES[TravelMode(mode)]
+        distance_km = haversine_km(
+            origin.location.lat, origin.location.lng,
+            destination.location.lat, destination.location.lng
+        )
+        return distance_km * (profile.detour_factor / profile.speed_kmh * 60) + profile.overhead_minutes
+
+    def _build(self, points: List[Tuple[str, float, float]], profile: SpeedProfile) -> TravelMatrix:
+        ids = tuple(point[0] for point in points)
+        coordinates = np.array([(lat, lng) for _, lat, lng in points], dtype=np.float64).reshape(-1, 2)
+        distance_km = haversine_matrix(coordinates, coordinates)
+        minutes = distance_km * (profile.detour_factor / profile.speed_kmh * 60) + profile.overhead_minutes
+        np.fill_diagonal(minutes, 0.0)
+        return TravelMatrix(ids, distance_km, minutes)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+
+# Shared by the planner and the optimizer so they reuse each other's matrices
+travel_matrix_engine = TravelMatrixEngine()
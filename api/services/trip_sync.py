@@ -0,0 +1,291 @@
+from typing import Any, Dict, List, Optional, Sequence
+from collections import OrderedDict, deque
+import threading
+
+from models import TripPlan
+from services.timeline import DayChanges
+from services.json_encoding import EncodedJSON
+
+# JSON-Patch (RFC 6902) operation: {"op": "add" | "remove" | "replace", "path": ..., "value": ...}
+PatchOp = Dict[str, Any]
+
+
+def _escape(key: Any) -> str:
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def json_diff(old: Any, new: Any, path: str = "", ops: Optional[List[PatchOp]] = None) -> List[PatchOp]:
+    """
+    JSON-Patch operations turning old into new. Lists are compared index by
+    index, growing or shrinking at the end, which matches how slot edits
+    are reported (see services.timeline.diff_slots).
+    """
+    if ops is None:
+        ops = []
+    if old == new:
+        return ops
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            if key not in old:
+                ops.append({"op": "add", "path": f"{path}/{_escape(key)}", "value": value})
+            else:
+                json_diff(old[key], value, f"{path}/{_escape(key)}", ops)
+    elif isinstance(old, list) and isinstance(new, list):
+        common = min(len(old), len(new))
+        for i in range(common):
+            json_diff(old[i], new[i], f"{path}/{i}", ops)
+        for i in range(common, len(new)):
+            ops.append({"op": "add", "path": f"{path}/{i}", "value": new[i]})
+        # Highest index first so every path is valid when applied in order
+        for i in range(len(old) - 1, common - 1, -1):
+            ops.append({"op": "remove", "path": f"{path}/{i}"})
+    else:
+        ops.append({"op": "replace", "path": path, "value": new})
+    return ops
+
+
+def _normalize_day(day_doc: Dict[str, Any], attractions: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Replace each slot's attraction with its id, collecting the attraction
+    documents in attractions
+    """
+    for slot in day_doc["time_slots"]:
+        attraction = slot.pop("attraction")
+        attractions[attraction["id"]] = attraction
+        slot["attraction_id"] = attraction["id"]
+    return day_doc
+
+
+def normalize_trip(
+    trip: TripPlan,
+    attractions: Dict[str, Any],
+    previous: Optional[Dict[str, Any]] = None,
+    changes: Optional[Sequence[DayChanges]] = None
+) -> Dict[str, Any]:
+    """
+    The trip as a JSON document with attractions referenced by id.
+    With the previous document and the days an edit changed, only those
+    days are serialized again; the rest are reused from previous.
+    """
+    reuse = previous is not None and changes is not None and len(previous["days"]) == len(trip.days)
+    document = trip.model_dump(mode="json", exclude={"days"})
+    if reuse:
+        changed = {change.day_number for change in changes}
+        document["days"] = [
+            _normalize_day(day.model_dump(mode="json"), attractions) if day.day_number in changed else day_doc
+            for day, day_doc in zip(trip.days, previous["days"])
+        ]
+    else:
+        document["days"] = [_normalize_day(day.model_dump(mode="json"), attractions) for day in trip.days]
+    return document
+
+
+class _SessionSync:
+    def __init__(self):
+        self.version = 0
+        self.trip_id: Optional[str] = None
+        self.document: Optional[Dict[str, Any]] = None
+        # Every attraction the session's clients have been sent, by id
+        self.attractions: Dict[str, Any] = {}
+        # (version, ops, attractions first sent with that version)
+        self.history: deque = deque()
+        # Connection id -> last version the client acknowledged
+        self.acked: Dict[int, int] = {}
+        # (version, encoded document, encoded attractions) for snapshots
+        self.encoded: Optional[tuple] = None
+
+
+class TripSyncHub:
+    """
+    Versioned trip state per session for WebSocket clients. Each update
+    becomes a JSON-Patch from the previous version; attractions are sent in
+    full once and referenced by id afterwards. A bounded history of
+    patches lets a client that missed some catch up without a snapshot.
+    Versions are the session store's when given, so they agree between
+    workers; a hub that missed versions written by another worker starts
+    again from the trip it is given.
+    """
+
+    def __init__(self, history_size: int = 32, max_sessions: int = 10000):
+        self.history_size = history_size
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, _SessionSync]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.patches = 0
+        self.snapshots = 0
+        self.catch_ups = 0
+
+    def _session(self, session_id: str) -> _SessionSync:
+        state = self._sessions.get(session_id)
+        if state is None:
+            state = self._sessions[session_id] = _SessionSync()
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+        return state
+
+    def version(self, session_id: str) -> int:
+        state = self._sessions.get(session_id)
+        return state.version if state is not None else 0
+
+    def update(
+        self,
+        session_id: str,
+        trip: TripPlan,
+        changes: Optional[Sequence[DayChanges]] = None,
+        version: Optional[int] = None,
+        previous: Optional[TripPlan] = None
+    ) -> Dict[str, Any]:
+        """
+        Record a new version of a session's trip and return the message for
+        its clients: a patch, or a snapshot for a different trip. previous
+        is the trip it replaced, to patch from if this hub hasn't seen the
+        version before (it was written by another worker).
+        """
+        with self._lock:
+            state = self._session(session_id)
+            if version is None:
+                version = state.version + 1
+            if state.version != version - 1 and previous is not None and previous.id == trip.id:
+                self._reset(state, previous, version - 1)
+            if state.document is None or state.trip_id != trip.id or state.version != version - 1:
+                self._reset(state, trip, version)
+                self.snapshots += 1
+                return self._snapshot_message(session_id, state)
+
+            known = set(state.attractions)
+            document = normalize_trip(trip, state.attractions, state.document, changes)
+            ops = json_diff(state.document, document)
+            new_attractions = [attraction_id for attraction_id in state.attractions if attraction_id not in known]
+
+            base_version = state.version
+            state.version = version
+            state.document = document
+            state.history.append((state.version, ops, new_attractions))
+            self._trim(state)
+            self.patches += 1
+            return {
+                "type": "patch",
+                "session_id": session_id,
+                "base_version": base_version,
+                "version": state.version,
+                "ops": ops,
+                "attractions": {attraction_id: state.attractions[attraction_id] for attraction_id in new_attractions}
+            }
+
+    def snapshot(
+        self,
+        session_id: str,
+        trip: Optional[TripPlan] = None,
+        version: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Full state for a client that just connected. trip, at version, is
+        used when the hub has no state for the session yet, a different
+        trip, or an older version.
+        """
+        with self._lock:
+            state = self._session(session_id)
+            if trip is not None and (
+                state.document is None or state.trip_id != trip.id or (version is not None and state.version != version)
+            ):
+                self._reset(state, trip, version if version is not None else state.version + 1)
+            if state.document is None:
+                return None
+            self.snapshots += 1
+            return self._snapshot_message(session_id, state)
+
+    def catch_up(
+        self,
+        session_id: str,
+        from_version: int,
+        trip: Optional[TripPlan] = None,
+        version: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Bring a client at from_version up to date: the missed patches in
+        one message if they are all still in history, else a snapshot.
+        trip and version are the current ones, if the hub may be behind.
+        """
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is not None and version is not None and state.version != version:
+                # Behind another worker's writes: the history is incomplete
+                state = None
+            if state is not None and state.document is not None and from_version == state.version:
+                return None
+            if state is not None and state.history and state.history[0][0] <= from_version + 1 <= state.version:
+                ops: List[PatchOp] = []
+                attractions: Dict[str, Any] = {}
+                for version, version_ops, new_attractions in state.history:
+                    if version > from_version:
+                        ops.extend(version_ops)
+                        for attraction_id in new_attractions:
+                            attractions[attraction_id] = state.attractions[attraction_id]
+                self.catch_ups += 1
+                return {
+                    "type": "patch",
+                    "session_id": session_id,
+                    "base_version": from_version,
+                    "version": state.version,
+                    "ops": ops,
+                    # The client may have joined after these were first sent
+                    "attractions": attractions
+                }
+        return self.snapshot(session_id, trip, version)
+
+    def acknowledge(self, session_id: str, connection_id: int, version: int):
+        """
+        Record the version a client has applied. History older than every
+        client's acknowledged version is no longer needed.
+        """
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None:
+                return
+            state.acked[connection_id] = min(version, state.version)
+            self._trim(state)
+
+    def forget_connection(self, session_id: str, connection_id: int):
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is not None:
+                state.acked.pop(connection_id, None)
+
+    def _reset(self, state: _SessionSync, trip: TripPlan, version: int):
+        state.version = version
+        state.trip_id = trip.id
+        state.attractions = {}
+        state.document = normalize_trip(trip, state.attractions)
+        state.history.clear()
+
+    def _trim(self, state: _SessionSync):
+        oldest_needed = min(state.acked.values()) if state.acked else 0
+        while state.history and (
+            len(state.history) > self.history_size or state.history[0][0] <= oldest_needed
+        ):
+            state.history.popleft()
+
+    def _snapshot_message(self, session_id: str, state: _SessionSync) -> Dict[str, Any]:
+        # Every client connecting at the same version shares one serialization
+        if state.encoded is None or state.encoded[0] != state.version:
+            state.encoded = (state.version, EncodedJSON.of(state.document), EncodedJSON.of(state.attractions))
+        return {
+            "type": "snapshot",
+            "session_id": session_id,
+            "version": state.version,
+            "trip": state.encoded[1],
+            "attractions": state.encoded[2]
+        }
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self._sessions),
+            "patches": self.patches,
+            "snapshots": self.snapshots,
+            "catch_ups": self.catch_ups
+        }